@@ -0,0 +1,137 @@
+"""Генератор воспроизводимого синтетического корпуса для бенчмарков индексации.
+
+Запуск: python -m benchmarks.corpus --out /tmp/corpus --files 200 [--seed 42]
+Создаются юридические документы (.txt, .md, .docx), FAQ (.txt) и JSON-каталоги
+в подкаталогах, которые распознаются определителем типа документа.
+"""
+
+import argparse
+import json
+import os
+import random
+from typing import Dict, List
+
+from benchmarks.splitter_benchmark import synthetic_legal_text
+
+# Доли типов файлов в корпусе
+CORPUS_MIX = (
+    ("legal", ".txt", 0.35),
+    ("legal", ".md", 0.15),
+    ("legal", ".docx", 0.15),
+    ("faq", ".txt", 0.25),
+    ("catalog", ".json", 0.10),
+)
+
+_FAQ_WORDS = (
+    "как оформить заявку получить справку оплатить услугу изменить данные "
+    "договора срок рассмотрения документы необходимые для подачи обращения"
+).split()
+
+
+def faq_text(questions: int, rng: random.Random) -> str:
+    parts = []
+    for number in range(1, questions + 1):
+        question = " ".join(rng.choice(_FAQ_WORDS) for _ in range(rng.randint(4, 10)))
+        answer = " ".join(rng.choice(_FAQ_WORDS) for _ in range(rng.randint(15, 80)))
+        parts.append(f"Вопрос {number}: {question.capitalize()}?\nОтвет: {answer}.")
+    return "\n\n".join(parts)
+
+
+def catalog_items(items: int, rng: random.Random) -> List[Dict]:
+    return [
+        {
+            "name": f"Услуга {number}",
+            "url": f"https://example.org/services/{number}",
+            "description": " ".join(
+                rng.choice(_FAQ_WORDS) for _ in range(rng.randint(10, 60))
+            ),
+        }
+        for number in range(1, items + 1)
+    ]
+
+
+def _write_docx(path: str, text: str) -> None:
+    from docx import Document as DocxDocument
+
+    document = DocxDocument()
+    for paragraph in text.split("\n\n"):
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def write_file(path: str, kind: str, rng: random.Random, size: int) -> None:
+    """Записывает файл заданного вида; size - число статей/вопросов/элементов"""
+    extension = os.path.splitext(path)[1]
+    if kind == "catalog":
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(catalog_items(size, rng), f, ensure_ascii=False)
+        return
+
+    if kind == "faq":
+        text = faq_text(size, rng)
+    else:
+        text = synthetic_legal_text(size, rng.randrange(1 << 30))
+    if extension == ".docx":
+        _write_docx(path, text)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def _file_size(kind: str, rng: random.Random, scale: float) -> int:
+    base = {"legal": 40, "faq": 30, "catalog": 50}[kind]
+    return max(1, int(rng.randint(base // 2, base * 2) * scale))
+
+
+def generate_corpus(
+    directory: str, files: int = 200, seed: int = 42, scale: float = 1.0
+) -> List[str]:
+    """Создает корпус из files файлов, возвращает их пути.
+
+    Содержимое зависит только от seed, scale и номера файла, поэтому корпус
+    воспроизводится на любой машине.
+    """
+    paths = []
+    counts = [max(1, round(files * share)) for _, _, share in CORPUS_MIX]
+    counts[0] += files - sum(counts)
+    for (kind, extension, _), count in zip(CORPUS_MIX, counts):
+        folder = os.path.join(directory, kind)
+        os.makedirs(folder, exist_ok=True)
+        for number in range(count):
+            rng = random.Random(f"{seed}:{kind}:{extension}:{number}")
+            path = os.path.join(folder, f"{kind}_{number:05d}{extension}")
+            write_file(path, kind, rng, _file_size(kind, rng, scale))
+            paths.append(path)
+    return paths
+
+
+def mutate_corpus(
+    paths: List[str], fraction: float = 0.01, seed: int = 42, scale: float = 1.0
+) -> List[str]:
+    """Перезаписывает долю fraction файлов новым содержимым, возвращает их пути"""
+    rng = random.Random(f"{seed}:mutate")
+    count = max(1, round(len(paths) * fraction))
+    changed = sorted(rng.sample(paths, min(count, len(paths))))
+    for path in changed:
+        name = os.path.basename(path)
+        kind = name.split("_")[0]
+        file_rng = random.Random(f"{seed}:mutate:{name}")
+        write_file(path, kind, file_rng, _file_size(kind, file_rng, scale))
+    return changed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", required=True, help="Каталог корпуса")
+    parser.add_argument("--files", type=int, default=200, help="Число файлов")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scale", type=float, default=1.0, help="Множитель размера")
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.out, args.files, args.seed, args.scale)
+    total = sum(os.path.getsize(path) for path in paths)
+    print(f"Создано файлов: {len(paths)}, объем {total / 1024 / 1024:.1f} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Пропускная способность индексации на синтетическом корпусе.
+
+Запуск: python -m benchmarks.indexing_benchmark [--files 200] [--embeddings hashing]
+Корпус (benchmarks/corpus.py) и база ChromaDB создаются во временном каталоге.
+Замеряются три прохода parse_files: холодная индексация, повторный проход без
+изменений и проход после изменения 1% файлов. Для каждого выводятся файлы/с,
+чанки/с и пиковое потребление памяти (RSS) процесса во время прохода.
+С --memory в результаты (--json) добавляются пики памяти по этапам и места
+выделения памяти по типам файлов из отчета индексации.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict
+
+import psutil
+
+from benchmarks.corpus import generate_corpus, mutate_corpus
+from config import config
+
+
+class RssSampler:
+    """Фоновый замер пикового RSS процесса (psutil, раз в interval секунд)"""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = self.process.memory_info().rss
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def run_phase(name: str, vector_db, directory: str) -> Dict:
+    from services.indexing_service import parse_files
+
+    with RssSampler() as sampler:
+        started = time.perf_counter()
+        stats = parse_files(directory, vector_db)
+        elapsed = time.perf_counter() - started
+    result = {
+        "phase": name,
+        "seconds": elapsed,
+        "files": stats.files,
+        "chunks_added": stats.chunks_added,
+        "chunks_removed": stats.chunks_removed,
+        "files_per_second": stats.files / elapsed if elapsed else 0.0,
+        "chunks_per_second": stats.chunks_added / elapsed if elapsed else 0.0,
+        "peak_rss_mb": sampler.peak / 1024 / 1024,
+    }
+    if config.MEMORY_PROFILING_ENABLED and stats.report_path:
+        with open(stats.report_path, encoding="utf-8") as f:
+            result["memory"] = json.load(f).get("memory", {})
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200, help="Файлов в корпусе")
+    parser.add_argument("--scale", type=float, default=1.0, help="Множитель размера")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--changed", type=float, default=0.01, help="Доля изменяемых файлов"
+    )
+    parser.add_argument(
+        "--embeddings",
+        default="hashing",
+        choices=["hashing", "huggingface"],
+        help="hashing - детерминированные эмбеддинги без модели (офлайн)",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Пики памяти по этапам и места выделения по типам файлов",
+    )
+    parser.add_argument("--json", help="Сохранить результаты в JSON-файл")
+    parser.add_argument(
+        "--keep", action="store_true", help="Не удалять временный каталог"
+    )
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag_index_bench_")
+    corpus_dir = os.path.join(workdir, "data")
+    # Все пути индексации перенаправляются во временный каталог
+    config.INPUT_DIR = corpus_dir
+    config.CHROMA_DB_PATH = os.path.join(workdir, "chroma_db")
+    config.CHROMA_CACHE_PATH = os.path.join(workdir, "chroma_cache")
+    config.PARSED_TEXT_CACHE_PATH = os.path.join(workdir, "parsed_cache")
+    config.INDEXING_REPORT_DIR = os.path.join(workdir, "reports")
+    config.EMBEDDING_BACKEND = args.embeddings
+    config.MEMORY_PROFILING_ENABLED = args.memory
+
+    from managers.embedding_manager import EmbeddingManager
+    from managers.vector_db_manager import VectorDatabase
+
+    try:
+        started = time.perf_counter()
+        paths = generate_corpus(corpus_dir, args.files, args.seed, args.scale)
+        size = sum(os.path.getsize(path) for path in paths)
+        print(
+            f"Корпус: {len(paths)} файлов, {size / 1024 / 1024:.1f} МБ, "
+            f"создан за {time.perf_counter() - started:.1f} с ({workdir})"
+        )
+
+        embedding_manager = EmbeddingManager(config)
+        vector_db = VectorDatabase(
+            config.CHROMA_DB_PATH, config.CHROMA_CACHE_PATH, embedding_manager
+        )
+        vector_db.load_or_create()
+        vector_db.load_or_create_cache()
+
+        results = [run_phase("cold", vector_db, corpus_dir)]
+        results.append(run_phase("noop", vector_db, corpus_dir))
+        changed = mutate_corpus(paths, args.changed, args.seed, args.scale)
+        print(f"\nИзменено файлов: {len(changed)}")
+        results.append(run_phase("changed", vector_db, corpus_dir))
+        vector_db.close()
+
+        print("\n=== Результаты ===")
+        for result in results:
+            print(
+                f"{result['phase']:>8}: {result['seconds']:.2f} с, "
+                f"{result['files_per_second']:.1f} файлов/с, "
+                f"{result['chunks_per_second']:.1f} чанков/с, "
+                f"пик RSS {result['peak_rss_mb']:.0f} МБ"
+            )
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"args": vars(args), "corpus_bytes": size, "results": results},
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
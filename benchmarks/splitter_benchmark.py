@@ -0,0 +1,134 @@
+"""Сравнение OffsetTextSplitter и RecursiveCharacterTextSplitter.
+
+Запуск: python -m benchmarks.splitter_benchmark [--dir data/legal] [--type legal]
+Тексты берутся из документов каталога (через DocumentParser и кэш разбора),
+если подходящих файлов нет - используется синтетический юридический текст.
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import List, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from config import config
+from services.document_parser import DocumentParser
+from utils.offset_splitter import OffsetTextSplitter
+
+
+def synthetic_legal_text(articles: int = 2000, seed: int = 42) -> str:
+    """Текст вида '\\n\\nСТАТЬЯ N. ...' с абзацами разной длины"""
+    rng = random.Random(seed)
+    words = (
+        "договор сторона обязуется исполнитель заказчик оплата срок услуги "
+        "ответственность порядке предусмотренном настоящим законодательством "
+        "Российской Федерации"
+    ).split()
+    parts = []
+    for number in range(1, articles + 1):
+        paragraphs = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(20, 160)))
+            for _ in range(rng.randint(1, 5))
+        ]
+        parts.append(f"СТАТЬЯ {number}. " + "\n\n".join(paragraphs))
+    return "\n\n".join(parts)
+
+
+def load_texts(directory: str, limit: int) -> List[Tuple[str, str]]:
+    """Извлеченный текст документов каталога (не более limit файлов)"""
+    if not directory or not os.path.isdir(directory):
+        return []
+    parser = DocumentParser(config)
+    texts = []
+    for root, _, files in os.walk(directory):
+        for filename in sorted(files):
+            if not filename.lower().endswith(config.SUPPORTED_EXTENSIONS):
+                continue
+            if filename.lower().endswith(".json"):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                text = parser.parse_document(path)
+            except Exception as e:
+                print(f"  Пропуск {path}: {e}")
+                continue
+            if isinstance(text, str) and text.strip():
+                texts.append((path, text))
+            if len(texts) >= limit:
+                return texts
+    return texts
+
+
+def run(splitter, texts: List[str], repeat: int) -> Tuple[float, list]:
+    best = float("inf")
+    chunks = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = [
+            splitter.create_documents([text], [{"source": "benchmark"}])
+            for text in texts
+        ]
+        best = min(best, time.perf_counter() - started)
+    return best, chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", default=os.path.join(config.INPUT_DIR, "legal"))
+    parser.add_argument("--type", default="legal", choices=["default", "legal", "qa"])
+    parser.add_argument("--limit", type=int, default=50, help="Максимум файлов")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов замера")
+    args = parser.parse_args()
+
+    if args.type == "default":
+        params = {
+            "chunk_size": 500,
+            "chunk_overlap": 100,
+            "separators": ["\n\n", "\n", " "],
+        }
+    else:
+        type_config = config.DOCUMENT_TYPE_CONFIG[args.type]
+        params = {
+            key: type_config[key]
+            for key in ("chunk_size", "chunk_overlap", "separators")
+        }
+
+    documents = load_texts(args.dir, args.limit)
+    if documents:
+        print(f"Документов: {len(documents)} из {args.dir}")
+    else:
+        print("Документы не найдены, используется синтетический текст")
+        documents = [("synthetic", synthetic_legal_text())]
+    texts = [text for _, text in documents]
+    total_chars = sum(len(text) for text in texts)
+    print(f"Объем текста: {total_chars / 1e6:.2f} млн символов, параметры: {params}")
+
+    splitters = {
+        "langchain": RecursiveCharacterTextSplitter(
+            **params, length_function=len, add_start_index=True
+        ),
+        "offset": OffsetTextSplitter(
+            **params, length_function=len, add_start_index=True
+        ),
+    }
+    results = {
+        name: run(splitter, texts, args.repeat) for name, splitter in splitters.items()
+    }
+
+    for name, (elapsed, chunks) in results.items():
+        count = sum(len(doc_chunks) for doc_chunks in chunks)
+        print(
+            f"{name:>10}: {elapsed:.3f} с, чанков {count}, "
+            f"{total_chars / elapsed / 1e6:.2f} млн символов/с"
+        )
+
+    expected = [[c.page_content for c in doc] for doc in results["langchain"][1]]
+    actual = [[c.page_content for c in doc] for doc in results["offset"][1]]
+    print(f"Чанки совпадают: {'да' if expected == actual else 'НЕТ'}")
+    print(f"Ускорение: {results['langchain'][0] / results['offset'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import sys
 import os
 import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # Добавляем корень проекта в sys.path для корректного импорта
@@ -13,37 +16,67 @@ from langchain_core.documents import Document  # Импорт класса Docum
 import utils.chunk_utils as chunk_utils  # Импорт нового модуля
 
 
-def analyze_document(file_path, clean_text=True):
-    """Анализирует чанкинг документа и генерирует Markdown-отчет"""
+class _SharedCleaner:
+    """LegalTextCleaner для нескольких потоков: модель вызывается по очереди"""
+
+    def __init__(self, cleaner):
+        self._cleaner = cleaner
+        self._lock = threading.Lock()
+
+    def clean(self, text):
+        with self._lock:
+            return self._cleaner.clean(text)
+
+
+def analyze_document(file_path, clean_text=True, manager=None, cleaner=None):
+    """Анализирует чанкинг документа и генерирует Markdown-отчет.
+
+    manager и cleaner передаются при пакетной обработке, чтобы модели
+    загружались один раз на каталог.
+
+    Raises:
+        ValueError: JSON верхнего уровня - не массив и не объект
+    """
     # Инициализация менеджера эмбеддингов
-    manager = EmbeddingManager(config)
+    manager = manager or EmbeddingManager(config)
 
     # Инициализация очистителя текста
-    cleaner = LegalTextCleaner() if clean_text else None
+    if clean_text:
+        cleaner = cleaner or LegalTextCleaner()
 
     # Специальная обработка для JSON
     if file_path.lower().endswith(".json"):
-        # Используем новый модуль для обработки JSON
-        chunks = chunk_utils.process_json_file(file_path)
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, (list, dict)):
+            raise ValueError(
+                "JSON верхнего уровня должен быть массивом или объектом, "
+                f"получено: {type(data).__name__}"
+            )
+        items = data if isinstance(data, list) else list(data.values())
+        # Каталоги и прочие JSON упаковываются структурным чанкером
+        if isinstance(data, list) and all(isinstance(i, dict) for i in data):
+            chunks = chunk_utils.process_json_file(file_path)
+        else:
+            chunks = manager.json_splitter.split_json(data)
 
         # Формирование отчета
         report = f"# Отчет по чанкингу JSON-документа\n\n"
         report += f"**Файл:** `{file_path}`\n\n"
-        report += f"**Всего элементов:** {len(chunks)}\n\n"
+        report += f"**Всего элементов:** {len(items)}\n\n"
+        report += f"**Всего чанков:** {len(chunks)}\n\n"
 
         # Сохранение информации о типах элементов
         type_counts = {}
-        for chunk in chunks:
-            try:
-                item = json.loads(chunk.page_content)
+        for item in items:
+            item_type = "array" if isinstance(item, list) else "value"
+            if isinstance(item, dict):
                 item_type = "object"
                 if "url" in item and "name" in item:
                     item_type = "catalog_item"
                 elif "question" in item and "answer" in item:
                     item_type = "qa_item"
-                type_counts[item_type] = type_counts.get(item_type, 0) + 1
-            except json.JSONDecodeError:
-                continue
+            type_counts[item_type] = type_counts.get(item_type, 0) + 1
 
         report += "**Типы элементов:**\n"
         for item_type, count in type_counts.items():
@@ -144,15 +177,11 @@ def analyze_document(file_path, clean_text=True):
 
         # Для JSON добавляем специальную информацию
         if file_path.lower().endswith(".json"):
-            report += f"## Элемент {i}\n\n"
+            start = chunk.metadata.get("item_start", 0)
+            end = chunk.metadata.get("item_end", start)
+            report += f"## Чанк {i} (элементы {start}-{end})\n\n"
             report += f"**Метаданные:**\n{metadata_str}\n\n"
-            # Форматирование JSON с отступами
-            try:
-                json_content = json.loads(chunk.page_content)
-                formatted_json = json.dumps(json_content, indent=2, ensure_ascii=False)
-            except json.JSONDecodeError:
-                formatted_json = chunk.page_content
-            report += f"**Содержимое:**\n```json\n{formatted_json}\n```\n\n"
+            report += f"**Содержимое:**\n```\n{chunk.page_content}\n```\n\n"
         else:
             # Получение позиции чанка
             start_index = chunk.metadata.get("start_index", 0)
@@ -175,67 +204,116 @@ def analyze_document(file_path, clean_text=True):
     return report
 
 
-if __name__ == "__main__":
-    from config import config
-    import sys
+def process_files(
+    input_dir: Path,
+    output_dir: Path,
+    only_clean: bool,
+    clean_text: bool,
+    workers: int = config.ANALYZER_WORKERS,
+):
+    """Обрабатывает все файлы в директории с заданными параметрами.
+
+    Файлы обрабатываются параллельно: у каждого потока свой EmbeddingManager
+    (парсер, детектор, сплиттеры), модель очистки загружается один раз и
+    вызывается потоками по очереди.
+    """
+    # Создаем каталог для результатов
+    output_dir.mkdir(exist_ok=True)
+
+    # Сбор поддерживаемых файлов
+    files = []
+    for ext in config.SUPPORTED_EXTENSIONS:
+        files.extend(input_dir.glob(f"*{ext}"))
+
+    if not files:
+        print(f"В каталоге {input_dir} не найдено поддерживаемых файлов")
+        return
+
+    print(f"\nНайдено файлов для обработки: {len(files)}")
+    cleaner = _SharedCleaner(LegalTextCleaner()) if clean_text else None
+    print_lock = threading.Lock()
+    local = threading.local()
+
+    def process_file(file_path: Path) -> Path:
+        if not hasattr(local, "manager"):
+            local.manager = EmbeddingManager(config)
+        manager = local.manager
+        if only_clean:
+            # Режим только очистки текста
+            raw_text = manager.parse_document(str(file_path))
+            cleaned_text = cleaner.clean(raw_text)
+            output_path = output_dir / f"{file_path.stem}_cleaned.md"
+            content = cleaned_text
+        else:
+            # Полный анализ чанкинга
+            content = analyze_document(
+                str(file_path), clean_text=clean_text, manager=manager, cleaner=cleaner
+            )
+            suffix = "_cleaned" if clean_text else "_raw"
+            output_path = output_dir / f"{file_path.stem}{suffix}_chunk_report.md"
+
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return output_path
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(process_file, path): path for path in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            file_path = futures[future]
+            with print_lock:
+                try:
+                    output_path = future.result()
+                    print(f"[{done}/{len(files)}] {file_path.name} -> {output_path}")
+                except Exception as e:
+                    print(
+                        f"[{done}/{len(files)}] Ошибка обработки {file_path.name}: {e}"
+                    )
 
-    # Фиксированная директория для обработки
-    input_dir = Path(__file__).parent / "test_embeding"
-    output_dir = Path(__file__).parent / "test_embeding_result"
+
+if __name__ == "__main__":
+    # Директории по умолчанию
+    default_input = Path(__file__).parent / "test_embeding"
+    default_output = Path(__file__).parent / "test_embeding_result"
+
+    parser = argparse.ArgumentParser(description="Анализ чанкинга документов")
+    parser.add_argument("--input", type=Path, default=default_input)
+    parser.add_argument("--output", type=Path, default=default_output)
+    parser.add_argument("--workers", type=int, default=config.ANALYZER_WORKERS)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--no-clean", action="store_true", help="Чанкинг без очистки текста"
+    )
+    mode.add_argument(
+        "--only-clean", action="store_true", help="Только очистка текста"
+    )
+    mode.add_argument(
+        "--batch", action="store_true", help="Очистка и чанкинг без меню"
+    )
+    args = parser.parse_args()
+    input_dir, output_dir = args.input, args.output
 
     # Проверка существования директории
     if not input_dir.exists():
         print(f"Ошибка: каталог не найден - {input_dir}")
         sys.exit(1)
 
-    def process_files(only_clean: bool, clean_text: bool):
-        """Обрабатывает все файлы в директории с заданными параметрами"""
-        # Создаем каталог для результатов
-        output_dir.mkdir(exist_ok=True)
-
-        # Сбор поддерживаемых файлов
-        files = []
-        for ext in config.SUPPORTED_EXTENSIONS:
-            files.extend(input_dir.glob(f"*{ext}"))
-
-        if not files:
-            print(f"В каталоге {input_dir} не найдено поддерживаемых файлов")
-            return
-
-        print(f"\nНайдено файлов для обработки: {len(files)}")
-        for file_path in files:
-            print(f"\n=== Обработка файла: {file_path.name} ===")
-
-            if only_clean:
-                # Режим только очистки текста
-                manager = EmbeddingManager(config)
-                cleaner = LegalTextCleaner()
-                raw_text = manager.parse_document(str(file_path))
-                cleaned_text = cleaner.clean(raw_text)
-
-                # Сохранение очищенного текста
-                output_path = output_dir / f"{file_path.stem}_cleaned.md"
-                with open(output_path, "w", encoding="utf-8") as f:
-                    f.write(cleaned_text)
-                print(f"Очищенный текст сохранен: {output_path}")
-            else:
-                # Полный анализ чанкинга
-                report = analyze_document(str(file_path), clean_text=clean_text)
-
-                # Сохранение отчета
-                suffix = "_cleaned" if clean_text else "_raw"
-                filename = f"{file_path.stem}{suffix}_chunk_report.md"
-                output_path = output_dir / filename
-                with open(output_path, "w", encoding="utf-8") as f:
-                    f.write(report)
-                print(f"Отчет сохранен: {output_path}")
+    # Пакетный режим без меню
+    if args.no_clean or args.only_clean or args.batch:
+        process_files(
+            input_dir,
+            output_dir,
+            only_clean=args.only_clean,
+            clean_text=not args.no_clean,
+            workers=args.workers,
+        )
+        sys.exit(0)
 
     # Текстовое меню
     while True:
         print("\n" + "=" * 40)
         print("=== Меню анализатора чанков ===")
         print("=" * 40)
-        print("Обрабатываемая директория: test_embeding")
+        print(f"Обрабатываемая директория: {input_dir.name}")
         print("\nВыберите действие:")
         print("1. Только очистка текста")
         print("2. Очистка и чанкинг")
@@ -245,11 +323,11 @@ if __name__ == "__main__":
         choice = input("> ").strip()
 
         if choice == "1":
-            process_files(only_clean=True, clean_text=True)
+            process_files(input_dir, output_dir, only_clean=True, clean_text=True)
         elif choice == "2":
-            process_files(only_clean=False, clean_text=True)
+            process_files(input_dir, output_dir, only_clean=False, clean_text=True)
         elif choice == "3":
-            process_files(only_clean=False, clean_text=False)
+            process_files(input_dir, output_dir, only_clean=False, clean_text=False)
         elif choice == "4":
             print("Выход из программы")
             break
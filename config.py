@@ -14,9 +14,14 @@ class Config:
         self.INPUT_DIR = "data"
         self.CHROMA_DB_PATH = "./chroma_db"
         self.CHROMA_CACHE_PATH = "./chroma_cache"
+        self.PARSED_TEXT_CACHE_PATH = "./parsed_cache"  # Кэш извлеченного текста
+        self.PARSED_TEXT_CACHE_ENABLED = True
 
         # Модель для эмбеддинга
         self.EMBEDDING_MODEL = "ai-forever/sbert_large_nlu_ru"
+        # huggingface | hashing (детерминированные эмбеддинги без модели, офлайн)
+        self.EMBEDDING_BACKEND = "huggingface"
+        self.HASHING_EMBEDDING_DIM = 256  # Размерность эмбеддингов hashing
         self.LLM_TEMPERATURE = 0.5
 
         # Настройки провайдеров LLM
@@ -49,6 +54,27 @@ class Config:
             "OPENROUTER_API_KEY", ""
         )  # API key for OpenRouter
 
+        # Лимиты вызовов LLM по провайдерам (запросов в минуту - 0 без лимита,
+        # одновременных)
+        self.LLM_RATE_LIMITS = {
+            "openai": {"requests_per_minute": 500, "concurrency": 8},
+            "yandex": {"requests_per_minute": 60, "concurrency": 4},
+            "sber": {"requests_per_minute": 60, "concurrency": 1},
+            "openrouter": {"requests_per_minute": 20, "concurrency": 2},
+        }
+        self.LLM_MAX_RETRIES = 3  # Повторы при 429, 5xx и таймаутах
+        self.LLM_RETRY_BASE_DELAY = 1.0  # Начальная пауза перед повтором (с)
+        self.LLM_RETRY_MAX_DELAY = 30.0  # Максимальная пауза перед повтором (с)
+        self.LLM_HTTP_TIMEOUT = 60.0  # Таймаут HTTP-запроса к провайдеру LLM (с)
+        self.LLM_TOKEN_REFRESH_MARGIN = 120.0  # Обновлять токен GigaChat заранее (с)
+
+        # Дублирование медленных запросов на резервные провайдеры LLM
+        self.LLM_HEDGE_PROVIDERS = []  # ["sber", "openrouter"]: первый - основной
+        self.LLM_HEDGE_PERCENTILE = 0.95  # Дублировать запрос дольше этого процентиля
+        self.LLM_HEDGE_DEFAULT_DELAY = 5.0  # Порог дублирования, пока замеров мало (с)
+        self.LLM_HEALTH_WINDOW = 100  # Окно статистики задержек и ошибок провайдера
+        self.LLM_HEDGE_MAX_INFLIGHT = 4  # Максимум одновременных дублирующих запросов
+
         # Провайдеры чата
         self.CHAT_PROVIDERS = {
             "console": {
@@ -58,9 +84,24 @@ class Config:
             "telegram": {
                 "enabled": True,
                 "class": "providers.telegram_provider.TelegramProvider",
-                "params": {"token": os.getenv("TELEGRAM_TOKEN", "")},
+                "params": {
+                    "token": os.getenv("TELEGRAM_TOKEN", ""),
+                    "stream_edit_interval": 1.0,  # Секунд между правками ответа
+                },
             },
         }
+        self.STREAM_ANSWERS = True  # Выводить ответ LLM по мере генерации
+
+        # Пул обработки запросов чат-провайдеров
+        self.QUERY_WORKERS = 4  # Одновременно обрабатываемых запросов
+        self.QUERY_QUEUE_SIZE = 100  # Максимум запросов в очереди
+        self.QUERY_USER_MAX_PENDING = 3  # Максимум запросов в очереди от одного чата
+        self.QUERY_USER_RATE_PER_MINUTE = 10  # Запросов в минуту от одного чата
+        self.QUERY_USER_BURST = 5  # Запросов подряд сверх средней частоты
+        self.QUERY_TIMEOUT_SECONDS = 60  # Дедлайн ожидания запроса в очереди
+        self.QUERY_EXECUTION_TIMEOUT_SECONDS = 90  # Дедлайн выполнения запроса
+        self.QUERY_ASYNC_CONCURRENCY = 16  # Одновременных асинхронных запросов
+        self.QUERY_UNLIMITED_USERS = ["console"]  # Без ограничения частоты запросов
 
         # Настройки обработки документов
         self.SUPPORTED_EXTENSIONS = (
@@ -85,12 +126,61 @@ class Config:
         self.RETRIEVER_K_DEFAULT = (
             3  # Количество возвращаемых документов для других типов
         )
-        self.RETRIEVER_SCORE_THRESHOLD_LEGAL = 0.75  # Порог для retriever (legal)
-        self.RETRIEVER_SCORE_THRESHOLD_DEFAULT = 0.65  # Порог для retriever (другие)
+        # Пороги - косинусное сходство (коллекция с метрикой cosine)
+        self.RETRIEVER_SCORE_THRESHOLD_LEGAL = 0.45  # Минимум для фрагмента (legal)
+        self.RETRIEVER_SCORE_THRESHOLD_DEFAULT = 0.4  # Минимум для фрагмента (другие)
+        self.RETRIEVER_SCORE_MARGIN = 0.1  # Отставание фрагмента от лучшего найденного
+        self.CONTEXT_TOKEN_BUDGET = 2000  # Бюджет токенов контекста промпта
+        self.CONTEXT_CHARS_PER_TOKEN = 3.0  # Оценка символов на токен (кириллица)
+        self.CONTEXT_MERGE_GAP_CHARS = 10  # Склеивать фрагменты с таким разрывом
+        self.RETRIEVAL_CACHE_SIZE = 1000  # Результатов поиска в кэше (0 - отключен)
+        self.NO_ANSWER_SHORT_CIRCUIT = True  # Без LLM, если фрагменты ниже порога
+        self.NEGATIVE_CACHE_TTL_SECONDS = 300  # Кэш вопросов без ответа (0 - откл.)
+        self.NEGATIVE_CACHE_SIZE = 2000  # Максимум вопросов без ответа в кэше
+
+        # Маршрутизация запросов по типам документов
+        self.ROUTER_MAX_TYPES = 2  # Не больше стольких типов ищутся параллельно
+        self.ROUTER_SCORE_MARGIN = 0.05  # Отставание второго типа от лучшего
+        self.ROUTER_KEYWORD_WEIGHT = 0.05  # Бонус за ключевое слово типа в вопросе
+        self.ROUTER_CENTROID_SAMPLE = 500  # Векторов типа для расчета центроида
+        self.ROUTER_CENTROID_TTL_SECONDS = 600  # Период пересчета центроидов
+
+        # Задержка удаления старой коллекции после миграции индекса
+        self.MIGRATION_DROP_DELAY_SECONDS = 60
+
+        # Режим наблюдения за INPUT_DIR
+        self.WATCH_DEBOUNCE_MS = 2000  # Окно группировки событий файловой системы
+        self.WATCH_BATCH_SIZE = 20  # Количество файлов в одном батче переиндексации
+        self.WATCH_INITIAL_SCAN = True  # Полный проход по каталогу при старте
 
         self.PDF_MAX_PAGES_PROCESS = (
-            100  # Максимальное количество страниц для обработки PDF
+            100  # Максимальное количество страниц для обработки PDF (без потоковой обработки)
         )
+        self.PDF_STREAMING = True  # Постраничная обработка PDF с ограниченной памятью
+        self.PDF_STREAM_PAGE_WINDOW = 10  # Страниц PDF в одном окне разбора
+        self.STREAM_CHUNK_BUFFER_CHARS = 20000  # Размер буфера текста для чанкинга
+        self.STREAM_DETECTION_CHARS = 20000  # Объем текста для определения типа
+        self.DETECTION_WINDOW_CHARS = 20000  # Префикс текста для анализа (0 - весь)
+        self.INDEX_WRITE_BATCH_SIZE = 256  # Чанков в одном батче эмбеддинга/записи
+        self.INDEXING_METRICS_ENABLED = True  # Замеры этапов индексации
+        self.INDEXING_REPORT_DIR = "./reports/indexing"  # JSON-отчеты запусков
+        self.INDEXING_REPORT_SLOWEST_FILES = 20  # Самых медленных файлов в отчете
+        self.MEMORY_PROFILING_ENABLED = False  # RSS и tracemalloc (замедляет работу)
+        self.MEMORY_PROFILE_TOP_SITES = 10  # Мест выделения памяти на тип файла
+
+        # Удаление колонтитулов и артефактов перед чанкингом
+        self.BOILERPLATE_FILTER_ENABLED = True
+        self.BOILERPLATE_SAMPLE_PAGES = 10  # Страниц для определения колонтитулов
+        self.BOILERPLATE_EDGE_LINES = 3  # Проверяемых строк сверху и снизу страницы
+        self.BOILERPLATE_PAGE_RATIO = 0.5  # Доля страниц с повтором строки
+        self.BOILERPLATE_MAX_LINE_CHARS = 200  # Более длинные строки не проверяются
+
+        # Анализатор чанков (chunk_analyzer) и очистка текста кластеризацией
+        self.ANALYZER_WORKERS = 4  # Файлов, обрабатываемых параллельно
+        self.CLEANER_ENCODE_BATCH_SIZE = 64  # Предложений в батче эмбеддинга
+        self.CLEANER_EXACT_CLUSTER_LIMIT = 3000  # До этого числа - точный DBSCAN
+        self.CLEANER_LSH_TABLES = 8  # Таблиц LSH для приближенного графа соседей
+        self.CLEANER_LSH_BITS = 12  # Бит хэша в таблице LSH
 
         self.PDF_PROCESSING = {
             "default_strategy": "fast",
@@ -140,8 +230,16 @@ config = Config()
 
 def validate_config(config):
     """Проверка обязательных параметров конфигурации"""
-    provider = config.LLM_PROVIDER
+    # Провайдеры дублирования проверяются так же, как основной
+    providers = [config.LLM_PROVIDER]
+    if len(config.LLM_HEDGE_PROVIDERS) > 1:
+        providers += config.LLM_HEDGE_PROVIDERS
+    for provider in dict.fromkeys(providers):
+        _validate_provider(config, provider)
+
 
+def _validate_provider(config, provider):
+    """Проверка модели и ключа одного провайдера LLM"""
     if provider == "openai":
         if not config.OPENAI_MODEL_ID:
             raise ValueError("OPENAI_MODEL_ID must be set for OpenAI provider")
@@ -1,9 +1,41 @@
+import asyncio
+import inspect
 from abc import ABC, abstractmethod
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, Union
+
+# Обработчик сообщений: функция или корутина handler(message, user_id) -> str
+MessageHandler = Callable[[str, str], Union[str, Awaitable[str]]]
+# Потоковый обработчик: генератор (синхронный или асинхронный) фрагментов ответа
+StreamHandler = Callable[[str, str], Union[Iterator[str], AsyncIterator[str]]]
+
+
+async def call_handler(handler: MessageHandler, message: str, user_id: str) -> str:
+    """Вызывает обработчик из цикла событий, не блокируя его.
+
+    Асинхронный обработчик ожидается напрямую, синхронный выполняется
+    в пуле потоков цикла.
+    """
+    if inspect.iscoroutinefunction(handler):
+        return await handler(message, user_id)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, handler, message, user_id)
+
+
+def call_handler_sync(handler: MessageHandler, message: str, user_id: str) -> str:
+    """Вызывает обработчик из синхронного кода (консоль)"""
+    if inspect.iscoroutinefunction(handler):
+        return asyncio.run(handler(message, user_id))
+    return handler(message, user_id)
 
 
 class ChatProvider(ABC):
     """Абстрактный базовый класс для провайдеров чата"""
 
+    # Провайдер работает в цикле событий и ожидает асинхронный обработчик
+    async_handlers = False
+    # Потоковый обработчик; если задан, ответ выводится по мере генерации
+    stream_handler: Optional[StreamHandler] = None
+
     @abstractmethod
     def start(self):
         """Запускает провайдер для приема сообщений"""
@@ -15,14 +47,27 @@ class ChatProvider(ABC):
         pass
 
     @abstractmethod
-    def register_message_handler(self, handler: callable):
+    def register_message_handler(self, handler: MessageHandler):
         """Регистрирует обработчик входящих сообщений
 
         Args:
-            handler: Функция обработки сообщений вида handler(message: str) -> str
+            handler: Функция обработки сообщений вида
+                handler(message: str, user_id: str) -> str или такая же корутина.
+                user_id - идентификатор собеседника (чата) для ограничения
+                частоты запросов. Провайдеры вызывают обработчик через
+                call_handler / call_handler_sync.
         """
         pass
 
+    def register_stream_handler(self, handler: StreamHandler):
+        """Регистрирует потоковый обработчик сообщений
+
+        Args:
+            handler: Генератор handler(message, user_id) -> Iterator[str], для
+                провайдеров с async_handlers - асинхронный генератор
+        """
+        self.stream_handler = handler
+
     @abstractmethod
     def stop(self):
         """Останавливает провайдер и освобождает ресурсы"""
@@ -1,10 +1,340 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import queue
+import threading
+import time
 from abc import ABC, abstractmethod
-from langchain_core.language_models import BaseLanguageModel
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from langchain_core.language_models import BaseLanguageModel, LanguageModelLike
+from langchain_core.runnables import Runnable, RunnableConfig
+
+# Приоритет вызова LLM (меньше - раньше) передается в
+# config={"metadata": {"llm_priority": ...}}; вопросы пользователей - 0
+PRIORITY_INTERACTIVE = 0
+
+# Статусы HTTP, после которых запрос повторяется
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted", "cancelled")
+
+    def __init__(self, wake) -> None:
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class LLMRateLimiter:
+    """Ограничитель вызовов провайдера LLM: запросы в минуту и параллельность.
+
+    Разрешения выдаются ожидающим в порядке приоритета (затем очередности) из
+    корзины токенов со скоростью rate и не больше concurrency одновременно.
+    После 429 выдача приостанавливается на Retry-After, а скорость снижается
+    вдвое; каждый успешный вызов возвращает 10% исходной скорости, поэтому
+    поток запросов держится у фактического лимита провайдера.
+    requests_per_minute <= 0 - без ограничения частоты (остаются
+    параллельность и пауза после 429).
+    """
+
+    def __init__(self, requests_per_minute: float, concurrency: int) -> None:
+        self.unlimited = requests_per_minute <= 0
+        self.max_rate = max(0.0, requests_per_minute) / 60
+        self.rate = self.max_rate
+        self.concurrency = max(1, concurrency)
+        self.tokens = 1.0
+        self.active = 0
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[int, int, _Waiter]] = []
+        self._order = itertools.count()
+        self._timer: Optional[threading.Timer] = None
+
+    def _dispatch(self) -> None:
+        """Выдает разрешения ожидающим; вызывается под self._lock"""
+        now = time.monotonic()
+        self.tokens = min(
+            float(self.concurrency), self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        delay = 0.0
+        while self._waiters and self.active < self.concurrency:
+            if self._waiters[0][2].cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if now < self.paused_until:
+                delay = self.paused_until - now
+                break
+            if self.tokens < 1 and not self.unlimited:
+                delay = (1 - self.tokens) / self.rate
+                break
+            waiter = heapq.heappop(self._waiters)[2]
+            self.tokens -= 1
+            self.active += 1
+            waiter.granted = True
+            waiter.wake()
+        if delay and self._timer is None:
+            self._timer = threading.Timer(delay, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _enqueue(self, priority: int, wake) -> _Waiter:
+        waiter = _Waiter(wake)
+        with self._lock:
+            heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+            self._dispatch()
+        return waiter
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> None:
+        event = threading.Event()
+        self._enqueue(priority, event.set)
+        event.wait()
+
+    async def aacquire(self, priority: int = PRIORITY_INTERACTIVE) -> None:
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(
+                lambda: granted.done() or granted.set_result(None)
+            )
+
+        waiter = self._enqueue(priority, wake)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                if waiter.granted:
+                    self.active -= 1
+                    self._dispatch()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.active -= 1
+            self._dispatch()
+
+    def on_success(self) -> None:
+        if self.unlimited:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    def on_rate_limited(self, retry_after: float) -> None:
+        with self._lock:
+            if not self.unlimited:
+                self.rate = max(self.max_rate * 0.1, self.rate / 2)
+                self.tokens = 0.0
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Значение заголовка Retry-After: секунды или HTTP-дата"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_status(error: Exception) -> Tuple[Optional[int], Optional[float]]:
+    """Статус HTTP и Retry-After из исключения клиента LLM.
+
+    Поддерживаются исключения openai (status_code, response.headers), httpx
+    (response) и gigachat ResponseError(url, status_code, content, headers).
+    """
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    if status is None and len(error.args) >= 4 and isinstance(error.args[1], int):
+        status, headers = error.args[1], error.args[3]
+    retry_after = None
+    if headers is not None and hasattr(headers, "get"):
+        retry_after = _retry_after_seconds(
+            headers.get("retry-after") or headers.get("Retry-After")
+        )
+    return status, retry_after
+
+
+class RateLimitedLLM(Runnable):
+    """Обертка LLM: вызовы через LLMRateLimiter провайдера с повторами.
+
+    Повторяются ответы 429 и 5xx, а также таймауты и ошибки соединения:
+    до max_retries раз с экспоненциальной задержкой со случайным разбросом
+    (для 429 - не меньше Retry-After). Поток ответа повторяется, только если
+    ошибка произошла до первого фрагмента.
+    """
+
+    def __init__(
+        self,
+        llm: BaseLanguageModel,
+        limiter: LLMRateLimiter,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ) -> None:
+        self.llm = llm
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def _priority(config: Optional[RunnableConfig]) -> int:
+        metadata = (config or {}).get("metadata") or {}
+        return metadata.get("llm_priority", PRIORITY_INTERACTIVE)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Пауза перед повтором или None, если ошибку нужно пробросить"""
+        if attempt >= self.max_retries:
+            return None
+        status, retry_after = error_status(error)
+        transient = any(
+            marker in type(error).__name__ for marker in ("Timeout", "Connection")
+        )
+        if status not in RETRY_STATUSES and not transient:
+            return None
+        backoff = min(self.max_delay, self.base_delay * 2**attempt)
+        delay = random.uniform(backoff / 2, backoff)
+        if status == 429:
+            # Пауза ограничителя задерживает все вызовы провайдера
+            self.limiter.on_rate_limited(max(delay, retry_after or 0.0))
+            return 0.0
+        return delay
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        priority = self._priority(config)
+        for attempt in itertools.count():
+            self.limiter.acquire(priority)
+            try:
+                result = self.llm.invoke(input, config, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.limiter.on_success()
+                return result
+            finally:
+                self.limiter.release()
+            time.sleep(delay)
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        priority = self._priority(config)
+        for attempt in itertools.count():
+            await self.limiter.aacquire(priority)
+            try:
+                result = await self.llm.ainvoke(input, config, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.limiter.on_success()
+                return result
+            finally:
+                self.limiter.release()
+            await asyncio.sleep(delay)
+
+    def stream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Iterator[Any]:
+        priority = self._priority(config)
+        for attempt in itertools.count():
+            self.limiter.acquire(priority)
+            started = False
+            try:
+                for chunk in self.llm.stream(input, config, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.limiter.on_success()
+                return
+            finally:
+                self.limiter.release()
+            time.sleep(delay)
+
+    async def astream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        priority = self._priority(config)
+        for attempt in itertools.count():
+            await self.limiter.aacquire(priority)
+            started = False
+            try:
+                async for chunk in self.llm.astream(input, config, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.limiter.on_success()
+                return
+            finally:
+                self.limiter.release()
+            await asyncio.sleep(delay)
+
+
+# Ограничители общие для всех экземпляров RAGSystem одного процесса
+_rate_limiters: Dict[str, LLMRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider_type: str, config: dict) -> LLMRateLimiter:
+    """Ограничитель провайдера по настройкам LLM_RATE_LIMITS"""
+    with _rate_limiters_lock:
+        if provider_type not in _rate_limiters:
+            limits = config.get("LLM_RATE_LIMITS", {}).get(provider_type, {})
+            _rate_limiters[provider_type] = LLMRateLimiter(
+                limits.get("requests_per_minute", 60), limits.get("concurrency", 4)
+            )
+        return _rate_limiters[provider_type]
 
 
 class LLMProvider(ABC):
     @abstractmethod
-    def get_llm(self) -> BaseLanguageModel:
+    def get_llm(self) -> LanguageModelLike:
         pass
 
     @abstractmethod
@@ -12,15 +342,74 @@ class LLMProvider(ABC):
         """Return the name of the model being used"""
         pass
 
+    def warm_up(self) -> None:
+        """Подготовка к первому запросу (токены доступа и т.п.)"""
+
+    def close(self) -> None:
+        """Закрывает HTTP-клиенты и фоновые потоки провайдера"""
+        for client in getattr(self, "http_clients", ()):
+            if hasattr(client, "aclose"):
+                _close_async_client(client)
+            else:
+                client.close()
+
+
+def _close_async_client(client: Any, timeout: float = 5.0) -> None:
+    """Закрывает асинхронный httpx-клиент в собственном цикле событий.
+
+    Из работающего цикла asyncio.run вызвать нельзя, поэтому закрытие
+    выполняется в отдельном потоке со своим циклом.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        asyncio.run(client.aclose())
+        return
+    closer = threading.Thread(
+        target=asyncio.run, args=(client.aclose(),), name="httpx-close", daemon=True
+    )
+    closer.start()
+    closer.join(timeout)
+
+
+def _http_clients(pool_size: int, timeout: float) -> Tuple[Any, Any]:
+    """Синхронный и асинхронный httpx-клиенты с пулом keep-alive соединений"""
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=60.0,
+    )
+    return (
+        httpx.Client(limits=limits, timeout=timeout),
+        httpx.AsyncClient(limits=limits, timeout=timeout),
+    )
+
 
 class OpenAILLMProvider(LLMProvider):
-    def __init__(self, model_name: str, temperature: float):
+    def __init__(
+        self,
+        model_name: str,
+        temperature: float,
+        pool_size: int = 4,
+        timeout: float = 60.0,
+    ):
         from langchain_openai import ChatOpenAI
 
         self.model_name = model_name
-        self.llm = ChatOpenAI(model=model_name, temperature=temperature)
+        http_client, http_async_client = _http_clients(pool_size, timeout)
+        self.http_clients = (http_client, http_async_client)
+        # Повторы выполняет RateLimitedLLM с учетом лимитов провайдера
+        self.llm = ChatOpenAI(
+            model=model_name,
+            temperature=temperature,
+            max_retries=0,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
 
-    def get_llm(self) -> BaseLanguageModel:
+    def get_llm(self) -> LanguageModelLike:
         return self.llm
 
     def get_model_name(self) -> str:
@@ -39,7 +428,7 @@ class YandexLLMProvider(LLMProvider):
             temperature=temperature,
         )
 
-    def get_llm(self) -> BaseLanguageModel:
+    def get_llm(self) -> LanguageModelLike:
         return self.llm
 
     def get_model_name(self) -> str:
@@ -47,50 +436,543 @@ class YandexLLMProvider(LLMProvider):
 
 
 class SberLLMProvider(LLMProvider):
+    """GigaChat с фоновым обновлением OAuth-токена до истечения срока.
+
+    Клиент gigachat держит keep-alive соединения своего httpx-клиента, поэтому
+    провайдер переиспользуется через get_llm_provider, а размер пула
+    ограничивается pool_size, как у провайдеров OpenAI. warm_up получает токен
+    заранее (TLS-рукопожатие и авторизация не попадают в первый запрос) и
+    обновляет его за token_refresh_margin секунд до истечения.
+    """
+
     def __init__(
-        self, model_id: str, api_key: str, temperature: float, ca_bundle_file: str
+        self,
+        model_id: str,
+        api_key: str,
+        temperature: float,
+        ca_bundle_file: str,
+        token_refresh_margin: float = 120.0,
+        pool_size: int = 4,
+        timeout: float = 60.0,
     ):
         from langchain_community.chat_models import GigaChat
 
         self.model_id = model_id
-        self.llm = GigaChat(
+        self.token_refresh_margin = token_refresh_margin
+        pool_settings: Dict[str, Any] = {"timeout": timeout}
+        if "max_connections" in getattr(GigaChat, "model_fields", {}):
+            pool_settings["max_connections"] = pool_size
+        else:
+            # Старые версии читают лимит пула только из настроек gigachat
+            os.environ.setdefault("GIGACHAT_MAX_CONNECTIONS", str(pool_size))
+        self.chat_model = GigaChat(
             credentials=api_key,
             model=model_id,
             ca_bundle_file=ca_bundle_file,
+            **pool_settings,
         )
+        self.llm = self.chat_model
+        self.logger = logging.getLogger(__name__)
+        self._stop = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
 
-    def get_llm(self) -> BaseLanguageModel:
+    def get_llm(self) -> LanguageModelLike:
         return self.llm
 
     def get_model_name(self) -> str:
         return self.model_id
 
+    def warm_up(self) -> None:
+        # Клиент gigachat.GigaChat, создаваемый langchain при первом обращении
+        client = getattr(self.chat_model, "_client", None)
+        if client is None or not hasattr(client, "get_token"):
+            return
+        if self._refresher is None:
+            self._refresher = threading.Thread(
+                target=self._refresh_token,
+                args=(client,),
+                name="gigachat-token",
+                daemon=True,
+            )
+            self._refresher.start()
+
+    def _refresh_token(self, client: Any) -> None:
+        while not self._stop.is_set():
+            try:
+                token = client.get_token()
+                # expires_at - время истечения токена в миллисекундах
+                expires_at = getattr(token, "expires_at", 0) / 1000
+                wait = expires_at - time.time() - self.token_refresh_margin
+                self.logger.info("Токен GigaChat обновлен")
+            except Exception as e:
+                self.logger.warning(f"Не удалось обновить токен GigaChat: {e}")
+                wait = 0.0
+            self._stop.wait(max(30.0, wait))
+
+    def close(self) -> None:
+        self._stop.set()
+
 
 class OpenRouterLLMProvider(LLMProvider):
-    def __init__(self, model_name: str, api_key: str, temperature: float):
+    def __init__(
+        self,
+        model_name: str,
+        api_key: str,
+        temperature: float,
+        pool_size: int = 4,
+        timeout: float = 60.0,
+    ):
         from langchain_openai import ChatOpenAI
 
         self.model_name = model_name
+        http_client, http_async_client = _http_clients(pool_size, timeout)
+        self.http_clients = (http_client, http_async_client)
         self.llm = ChatOpenAI(
             model=model_name,
             temperature=temperature,
             openai_api_key=api_key,
             openai_api_base="https://openrouter.ai/api/v1",
+            max_retries=0,  # Повторы выполняет RateLimitedLLM
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
 
-    def get_llm(self) -> BaseLanguageModel:
+    def get_llm(self) -> LanguageModelLike:
         return self.llm
 
     def get_model_name(self) -> str:
         return self.model_name
 
 
+class ProviderHealth:
+    """Задержка успешных ответов и доля ошибок провайдера в скользящем окне.
+
+    Пока замеров меньше MIN_SAMPLES, недостающие замеры в оценке score
+    заменяются априорной задержкой prior_latency.
+    """
+
+    # Минимум замеров, после которого доверяем процентилям
+    MIN_SAMPLES = 10
+
+    def __init__(self, window: int = 100, prior_latency: float = 5.0) -> None:
+        self.prior_latency = prior_latency
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self._outcomes.append(True)
+
+    def record_error(self) -> None:
+        with self._lock:
+            self._outcomes.append(False)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < self.MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def score(self) -> float:
+        """Ожидаемая задержка с учетом ошибок (меньше - лучше)"""
+        with self._lock:
+            latencies = list(self._latencies)
+        missing = self.MIN_SAMPLES - len(latencies)
+        if missing > 0:
+            latencies += [self.prior_latency] * missing
+        median = sorted(latencies)[len(latencies) // 2]
+        return median / (1 - min(self.error_rate, 0.9))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "error_rate": self.error_rate,
+            "samples": len(self._outcomes),
+        }
+
+
+class _Backend:
+    __slots__ = ("name", "llm", "health")
+
+    def __init__(
+        self, name: str, llm: LanguageModelLike, window: int, prior_latency: float
+    ) -> None:
+        self.name = name
+        self.llm = llm
+        self.health = ProviderHealth(window, prior_latency)
+
+
+class HedgedLLM(Runnable):
+    """LLM из нескольких провайдеров с дублированием медленных запросов.
+
+    Запрос отправляется лучшему по ProviderHealth.score провайдеру (без
+    замеров провайдеры равны и идут в порядке настройки). Если ответа (для
+    потока - первого фрагмента) нет дольше процентиля percentile задержек
+    этого провайдера, запрос дублируется следующему провайдеру, если
+    одновременно выполняется меньше max_hedges дублей; после ошибки запрос
+    передается следующему провайдеру всегда. Берется первый успешный ответ,
+    остальные отменяются: потоки фрагментов закрываются на следующем
+    фрагменте, синхронный invoke дорабатывает в фоне и занимает место дубля.
+    """
+
+    def __init__(
+        self,
+        backends: List[_Backend],
+        percentile: float,
+        default_delay: float,
+        max_hedges: int = 4,
+    ) -> None:
+        self.backends = backends
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self._hedge_slots = threading.BoundedSemaphore(max(1, max_hedges))
+
+    def ranked(self) -> List[_Backend]:
+        return sorted(self.backends, key=lambda backend: backend.health.score())
+
+    def _hedge_delay(self, backend: _Backend) -> float:
+        delay = backend.health.percentile(self.percentile)
+        return self.default_delay if delay is None else delay
+
+    def _race(self, run: Callable[[_Backend], Iterator[Any]]) -> Iterator[Any]:
+        """Фрагменты первого ответившего провайдера; run(backend) - его поток"""
+        events: queue.Queue = queue.Queue()
+        cancelled: List[bool] = []
+
+        def pump(index: int, backend: _Backend, hedge: bool) -> None:
+            started = time.monotonic()
+            first = True
+            chunks = run(backend)
+            try:
+                for chunk in chunks:
+                    # Задержка проигравшего тоже учитывается в статистике
+                    if first:
+                        backend.health.record_success(time.monotonic() - started)
+                        first = False
+                    if cancelled[index]:
+                        return
+                    events.put((index, "chunk", chunk))
+                events.put((index, "end", None))
+            except Exception as e:
+                backend.health.record_error()
+                events.put((index, "error", e))
+            finally:
+                # Закрытие потока освобождает соединение и место ограничителя
+                chunks.close()
+                if hedge:
+                    self._hedge_slots.release()
+
+        pending = self.ranked()
+        running: List[_Backend] = []
+
+        def launch(hedge: bool = False) -> Optional[float]:
+            """Запуск следующего провайдера; None - нет свободного места дубля"""
+            if hedge and not self._hedge_slots.acquire(blocking=False):
+                return None
+            backend = pending.pop(0)
+            running.append(backend)
+            cancelled.append(False)
+            threading.Thread(
+                target=pump, args=(len(running) - 1, backend, hedge), daemon=True
+            ).start()
+            return time.monotonic() + self._hedge_delay(backend)
+
+        winner: Optional[int] = None
+        failed = 0
+        hedge_at = launch()
+        try:
+            while True:
+                timeout = None
+                if winner is None and pending and hedge_at is not None:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                try:
+                    index, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge_at = launch(hedge=True)
+                    continue
+                if winner is not None and index != winner:
+                    continue
+                if kind == "error":
+                    if winner is not None:
+                        raise payload
+                    failed += 1
+                    if pending:
+                        hedge_at = launch()
+                    elif failed == len(running):
+                        raise payload
+                    continue
+                if winner is None:
+                    winner = index
+                    for other in range(len(cancelled)):
+                        cancelled[other] = other != winner
+                if kind == "end":
+                    return
+                yield payload
+        finally:
+            for index in range(len(cancelled)):
+                cancelled[index] = True
+
+    async def _arace(
+        self, run: Callable[[_Backend], AsyncIterator[Any]]
+    ) -> AsyncIterator[Any]:
+        """Асинхронный _race: проигравшие задачи отменяются"""
+        events: asyncio.Queue = asyncio.Queue()
+        tasks: List[asyncio.Task] = []
+
+        async def pump(index: int, backend: _Backend, hedge: bool) -> None:
+            started = time.monotonic()
+            first = True
+            try:
+                async for chunk in run(backend):
+                    if first:
+                        backend.health.record_success(time.monotonic() - started)
+                        first = False
+                    await events.put((index, "chunk", chunk))
+                await events.put((index, "end", None))
+            except asyncio.CancelledError:
+                if first:
+                    # Отмененный проигравший отвечал не быстрее этого
+                    backend.health.record_success(time.monotonic() - started)
+                raise
+            except Exception as e:
+                backend.health.record_error()
+                await events.put((index, "error", e))
+            finally:
+                if hedge:
+                    self._hedge_slots.release()
+
+        pending = self.ranked()
+
+        def launch(hedge: bool = False) -> Optional[float]:
+            if hedge and not self._hedge_slots.acquire(blocking=False):
+                return None
+            backend = pending.pop(0)
+            tasks.append(asyncio.ensure_future(pump(len(tasks), backend, hedge)))
+            return time.monotonic() + self._hedge_delay(backend)
+
+        winner: Optional[int] = None
+        failed = 0
+        hedge_at = launch()
+        try:
+            while True:
+                try:
+                    if winner is None and pending and hedge_at is not None:
+                        index, kind, payload = await asyncio.wait_for(
+                            events.get(), max(0.0, hedge_at - time.monotonic())
+                        )
+                    else:
+                        index, kind, payload = await events.get()
+                except asyncio.TimeoutError:
+                    hedge_at = launch(hedge=True)
+                    continue
+                if winner is not None and index != winner:
+                    continue
+                if kind == "error":
+                    if winner is not None:
+                        raise payload
+                    failed += 1
+                    if pending:
+                        hedge_at = launch()
+                    elif failed == len(tasks):
+                        raise payload
+                    continue
+                if winner is None:
+                    winner = index
+                    for other, task in enumerate(tasks):
+                        if other != winner:
+                            task.cancel()
+                if kind == "end":
+                    return
+                yield payload
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        def run(backend: _Backend) -> Iterator[Any]:
+            yield backend.llm.invoke(input, config, **kwargs)
+
+        race = self._race(run)
+        try:
+            return next(race)
+        finally:
+            race.close()
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        async def run(backend: _Backend) -> AsyncIterator[Any]:
+            yield await backend.llm.ainvoke(input, config, **kwargs)
+
+        race = self._arace(run)
+        try:
+            return await race.__anext__()
+        finally:
+            await race.aclose()
+
+    def stream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Iterator[Any]:
+        yield from self._race(
+            lambda backend: backend.llm.stream(input, config, **kwargs)
+        )
+
+    async def astream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        race = self._arace(lambda backend: backend.llm.astream(input, config, **kwargs))
+        try:
+            async for chunk in race:
+                yield chunk
+        finally:
+            await race.aclose()
+
+
+class HedgedLLMProvider(LLMProvider):
+    """Составной провайдер: HedgedLLM поверх нескольких настроенных провайдеров"""
+
+    def __init__(
+        self,
+        providers: List[Tuple[str, LLMProvider]],
+        percentile: float = 0.95,
+        default_delay: float = 5.0,
+        window: int = 100,
+        max_hedges: int = 4,
+    ):
+        self.providers = providers
+        backends = [
+            _Backend(name, provider.get_llm(), window, default_delay)
+            for name, provider in providers
+        ]
+        self.llm = HedgedLLM(backends, percentile, default_delay, max_hedges)
+
+    def get_llm(self) -> LanguageModelLike:
+        return self.llm
+
+    def get_model_name(self) -> str:
+        names = [f"{name}:{p.get_model_name()}" for name, p in self.providers]
+        return f"hedged({', '.join(names)})"
+
+    def warm_up(self) -> None:
+        for _, provider in self.providers:
+            provider.warm_up()
+
+    def close(self) -> None:
+        for _, provider in self.providers:
+            provider.close()
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """Задержки и доля ошибок провайдеров"""
+        return {backend.name: backend.health.as_dict() for backend in self.llm.backends}
+
+
+# Общие провайдеры процесса: один набор клиентов на конфигурацию LLM
+_providers: Dict[Tuple, LLMProvider] = {}
+_providers_lock = threading.Lock()
+# Настройки, от которых зависит провайдер; QUERY_WORKERS задает размер пула
+_PROVIDER_SETTINGS = (
+    "LLM_",
+    "OPENAI_",
+    "YANDEX_",
+    "SBER_",
+    "OPENROUTER_",
+    "CA_",
+    "QUERY_WORKERS",
+)
+
+
+def get_llm_provider(config: dict) -> LLMProvider:
+    """Общий провайдер LLM для настроек config.
+
+    Повторные вызовы с теми же настройками LLM возвращают тот же провайдер,
+    поэтому HTTP-клиенты, пулы соединений и токены доступа переиспользуются
+    всеми экземплярами RAGSystem. Новый провайдер сразу выполняет warm_up.
+    """
+    key = tuple(
+        sorted(
+            (name, repr(value))
+            for name, value in config.items()
+            if name.startswith(_PROVIDER_SETTINGS)
+        )
+    )
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _providers[key] = create_llm_provider(config)
+            provider.warm_up()
+        return provider
+
+
+def close_llm_providers() -> None:
+    """Закрывает общие провайдеры (при завершении программы)"""
+    with _providers_lock:
+        for provider in _providers.values():
+            provider.close()
+        _providers.clear()
+
+
 def create_llm_provider(config: dict) -> LLMProvider:
+    """Провайдер LLM, вызовы которого идут через ограничитель провайдера.
+
+    Если задан LLM_HEDGE_PROVIDERS, возвращается HedgedLLMProvider поверх
+    перечисленных провайдеров (первый - основной).
+    """
+    hedge_providers = config.get("LLM_HEDGE_PROVIDERS") or []
+    if len(hedge_providers) > 1:
+        return HedgedLLMProvider(
+            [
+                (name, _rate_limited_provider({**config, "LLM_PROVIDER": name}))
+                for name in hedge_providers
+            ],
+            percentile=config.get("LLM_HEDGE_PERCENTILE", 0.95),
+            default_delay=config.get("LLM_HEDGE_DEFAULT_DELAY", 5.0),
+            window=config.get("LLM_HEALTH_WINDOW", 100),
+            max_hedges=config.get("LLM_HEDGE_MAX_INFLIGHT", 4),
+        )
+    return _rate_limited_provider(config)
+
+
+def _rate_limited_provider(config: dict) -> LLMProvider:
+    provider = _create_llm_provider(config)
+    provider.llm = RateLimitedLLM(
+        provider.llm,
+        get_rate_limiter(config.get("LLM_PROVIDER", "openai"), config),
+        max_retries=config.get("LLM_MAX_RETRIES", 3),
+        base_delay=config.get("LLM_RETRY_BASE_DELAY", 1.0),
+        max_delay=config.get("LLM_RETRY_MAX_DELAY", 30.0),
+    )
+    return provider
+
+
+def _pool_size(provider_type: str, config: dict) -> int:
+    """Размер пула соединений: одновременных запросов планировщика и провайдера"""
+    limits = config.get("LLM_RATE_LIMITS", {}).get(provider_type, {})
+    return max(1, min(config.get("QUERY_WORKERS", 4), limits.get("concurrency", 4)))
+
+
+def _create_llm_provider(config: dict) -> LLMProvider:
     provider_type = config.get("LLM_PROVIDER", "openai")
     temperature = config.get("LLM_TEMPERATURE", 0.7)
+    pool_size = _pool_size(provider_type, config)
+    timeout = config.get("LLM_HTTP_TIMEOUT", 60.0)
 
     if provider_type == "openai":
-        return OpenAILLMProvider(config["OPENAI_MODEL_ID"], temperature)
+        return OpenAILLMProvider(
+            config["OPENAI_MODEL_ID"], temperature, pool_size, timeout
+        )
     elif provider_type == "yandex":
         return YandexLLMProvider(
             config["YANDEX_MODEL_ID"],
@@ -105,11 +987,16 @@ def create_llm_provider(config: dict) -> LLMProvider:
             config.get("SBER_API_KEY", ""),
             temperature,
             ca_bundle_file,
+            config.get("LLM_TOKEN_REFRESH_MARGIN", 120.0),
+            pool_size,
+            timeout,
         )
     elif provider_type == "openrouter":
         return OpenRouterLLMProvider(
             config["OPENROUTER_MODEL_ID"],
             config.get("OPENROUTER_API_KEY", ""),
             temperature,
+            pool_size,
+            timeout,
         )
     raise ValueError(f"Неподдерживаемый провайдер LLM: {provider_type}")
@@ -6,7 +6,10 @@ from services.rag_system import (
     run_indexing,
 )
 from config import config
+from core.llm_manager import close_llm_providers
 from managers.embedding_manager import EmbeddingManager
+from services.migration_service import start_index_migration
+from services.watch_service import start_watch, stop_watch
 
 
 def display_menu():
@@ -16,6 +19,8 @@ def display_menu():
     print("2. Индексировать документы")
     print("3. Интерактивный чат")
     print("4. Очистить кеш семантики")
+    print("5. Наблюдать за каталогом документов (включить/выключить)")
+    print("6. Миграция индекса после изменения настроек чанкинга/модели")
     print("0. Выход")
     print("=" * 50)
 
@@ -55,6 +60,11 @@ def main():
                     print("Консольный провайдер не доступен")
             elif choice == "4":
                 clear_semantic_cache(vector_db)
+            elif choice == "5":
+                if not stop_watch():
+                    start_watch(vector_db, config.INPUT_DIR)
+            elif choice == "6":
+                start_index_migration(vector_db)
             elif choice == "0":
                 print("\nЗавершение работы программы...")
                 break
@@ -64,12 +74,16 @@ def main():
     except Exception as e:
         print(f"\nКритическая ошибка: {e}")
     finally:
+        # Останавливаем наблюдение за каталогом
+        stop_watch(timeout=5)
         # Явно останавливаем менеджер провайдеров перед выходом
         if provider_manager:
             provider_manager.stop_all()
         # Закрываем векторную базу данных
         if vector_db:
             vector_db.close()
+        # Закрываем HTTP-клиенты провайдеров LLM
+        close_llm_providers()
         print("Программа завершена.")
         exit(0)  # Гарантированное завершение работы
 
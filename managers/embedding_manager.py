@@ -1,16 +1,18 @@
 import hashlib
 import json
 import os
-import re
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
 from config import Config, config
 from services.document_type_detector import DocumentType, DocumentTypeDetector
 from services.document_parser import DocumentParser
 from services.embedding_service import EmbeddingService
+from utils.boilerplate import BOILERPLATE_VERSION, BoilerplateFilter
+from utils.indexing_metrics import stage
+from utils.json_splitter import JSON_CHUNKER_VERSION, JsonTextSplitter
+from utils.offset_splitter import OffsetTextSplitter
 
 
 class EmbeddingManager:
@@ -19,7 +21,12 @@ class EmbeddingManager:
         self.type_detector = DocumentTypeDetector(config)
         self.document_parser = DocumentParser(config)
         self.embedding_service = EmbeddingService(config)
+        self.boilerplate_filter = BoilerplateFilter(config)
+        self.splitter_params: Dict[str, Dict[str, Any]] = {}
         self.splitters = self._init_splitters()
+        self.json_splitter = JsonTextSplitter(
+            self.splitter_params["json"]["chunk_size"]
+        )
 
     def get_embeddings(self, doc_type: DocumentType = "default"):
         """Возвращает модель эмбеддингов для указанного типа документа"""
@@ -30,40 +37,70 @@ class EmbeddingManager:
         """Свойство для совместимости (возвращает модель по умолчанию)"""
         return self.embedding_service.get_embeddings("default")
 
-    def _init_splitters(self) -> Dict[DocumentType, RecursiveCharacterTextSplitter]:
-        splitters = {
-            "default": RecursiveCharacterTextSplitter(
-                chunk_size=500,
-                chunk_overlap=100,
-                separators=["\n\n", "\n", " "],
-                length_function=len,
-                add_start_index=True,
-            )
+    def _init_splitters(self) -> Dict[DocumentType, OffsetTextSplitter]:
+        self.splitter_params = {
+            "default": {
+                "chunk_size": 500,
+                "chunk_overlap": 100,
+                "separators": ["\n\n", "\n", " "],
+            }
         }
-        for doc_type in ["legal", "qa"]:
+        # JSON без настроек упаковывается в чанки размера по умолчанию
+        self.splitter_params["json"] = dict(self.splitter_params["default"])
+        for doc_type in ["legal", "qa", "json"]:
             if doc_type in self.config.DOCUMENT_TYPE_CONFIG:
                 params = self.config.DOCUMENT_TYPE_CONFIG[doc_type]
-                splitters[doc_type] = RecursiveCharacterTextSplitter(
-                    chunk_size=params["chunk_size"],
-                    chunk_overlap=params["chunk_overlap"],
-                    separators=params["separators"],
-                    length_function=len,
-                    add_start_index=True,
-                )
-        return splitters
+                self.splitter_params[doc_type] = {
+                    "chunk_size": params["chunk_size"],
+                    "chunk_overlap": params["chunk_overlap"],
+                    "separators": params["separators"],
+                }
+
+        return {
+            doc_type: OffsetTextSplitter(
+                **params, length_function=len, add_start_index=True
+            )
+            for doc_type, params in self.splitter_params.items()
+        }
+
+    def get_config_fingerprint(self, doc_type: str) -> str:
+        """Fingerprint of chunking and embedding settings of a document type.
+
+        Stored with every chunk, so a migration can find chunks built with an
+        outdated configuration. JSON catalogs are packed by the structural JSON
+        chunker, only its chunk size and version matter for them.
+        """
+        settings: Dict[str, Any] = {"embedding_model": self.config.EMBEDDING_MODEL}
+        if self.config.EMBEDDING_BACKEND == "hashing":
+            settings["embedding_model"] = (
+                f"hashing:{self.config.HASHING_EMBEDDING_DIM}"
+            )
+        if doc_type in ("catalog", "json"):
+            settings["json_chunker"] = JSON_CHUNKER_VERSION
+        if doc_type == "catalog":
+            settings["chunk_size"] = self.splitter_params["json"]["chunk_size"]
+        else:
+            settings.update(self.splitter_params.get(doc_type, {}))
+            if self.config.BOILERPLATE_FILTER_ENABLED:
+                settings["boilerplate"] = BOILERPLATE_VERSION
+        payload = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
 
     def get_file_hash(self, file_path: str) -> str:
         hasher = hashlib.sha256()
-        if file_path.lower().endswith(".json"):
-            with open(file_path, "r", encoding="utf-8-sig") as f:
-                data = json.load(f)
-                hasher.update(
-                    json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")
-                )
-        else:
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hasher.update(chunk)
+        with stage("hash", os.path.getsize(file_path), 1):
+            if file_path.lower().endswith(".json"):
+                with open(file_path, "r", encoding="utf-8-sig") as f:
+                    data = json.load(f)
+                    hasher.update(
+                        json.dumps(data, sort_keys=True, ensure_ascii=False).encode(
+                            "utf-8"
+                        )
+                    )
+            else:
+                with open(file_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(4096), b""):
+                        hasher.update(chunk)
         return hasher.hexdigest()
 
     def process_document(self, file_path: str) -> List[Document]:
@@ -89,11 +126,68 @@ class EmbeddingManager:
     def create_document_chunks(self, content: str, metadata: dict) -> List[Document]:
         """Create document chunks based on document type."""
         doc_type = metadata.get("document_type", "default")
-        return self.splitters[doc_type].create_documents([content], [metadata])
+        with stage("split", len(content)) as timer:
+            chunks = self.splitters[doc_type].create_documents([content], [metadata])
+            timer.rows = len(chunks)
+        return chunks
+
+    def iter_document_chunks(
+        self, pages: Iterable[str], metadata: dict
+    ) -> Iterator[Document]:
+        """Incrementally chunk a stream of pages (e.g. PDF pages).
+
+        Text is accumulated until STREAM_CHUNK_BUFFER_CHARS, chunks that end at
+        least one chunk_size before the buffer end are emitted, the rest of the
+        buffer is carried over starting at the first pending chunk, so overlap
+        with the last emitted chunk is preserved. start_index stays absolute.
+        """
+        doc_type = metadata.get("document_type", "default")
+        splitter = self.splitters[doc_type]
+        chunk_size = self.splitter_params[doc_type]["chunk_size"]
+        buffer_limit = max(self.config.STREAM_CHUNK_BUFFER_CHARS, 4 * chunk_size)
+
+        buffer = ""
+        offset = 0  # Позиция начала буфера в полном тексте документа
+        for page in pages:
+            if not page or not page.strip():
+                continue
+            buffer = f"{buffer}\n\n{page}" if buffer else page
+            if len(buffer) < buffer_limit:
+                continue
+
+            with stage("split", len(buffer)) as timer:
+                chunks = splitter.create_documents([buffer], [metadata])
+                timer.rows = len(chunks)
+            safe_end = len(buffer) - chunk_size
+            emitted = 0
+            for chunk in chunks:
+                start = chunk.metadata["start_index"]
+                if start + len(chunk.page_content) > safe_end:
+                    break
+                chunk.metadata["start_index"] = offset + start
+                emitted += 1
+                yield chunk
+
+            if emitted:
+                carry_from = (
+                    chunks[emitted].metadata["start_index"]
+                    if emitted < len(chunks)
+                    else len(buffer)
+                )
+                offset += carry_from
+                buffer = buffer[carry_from:]
+
+        if buffer:
+            with stage("split", len(buffer)) as timer:
+                chunks = splitter.create_documents([buffer], [metadata])
+                timer.rows = len(chunks)
+            for chunk in chunks:
+                chunk.metadata["start_index"] += offset
+                yield chunk
 
-    def parse_document(self, file_path: str) -> str:
+    def parse_document(self, file_path: str, file_hash: Optional[str] = None) -> str:
         """Proxy method to document parser"""
-        return self.document_parser.parse_document(file_path)
+        return self.document_parser.parse_document(file_path, file_hash)
 
     def get_current_device(self) -> str:
         """Возвращает текущее устройство (CPU/GPU) для моделей эмбеддингов."""
@@ -0,0 +1,429 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Ограничение sqlite на число параметров в одном запросе
+_IN_BATCH = 500
+
+
+class IndexCatalog:
+    """Durable indexing state stored next to ChromaDB (sqlite).
+
+    Keeps committed file states and indexing jobs with their work queue, so an
+    interrupted run can be resumed from the last committed file. Chunk
+    references map deduplicated chunks (one vector per content hash) to every
+    file that contains them.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    file_path TEXT PRIMARY KEY,
+                    file_hash TEXT NOT NULL,
+                    last_modified REAL NOT NULL,
+                    ingest_id TEXT NOT NULL,
+                    chunk_count INTEGER NOT NULL,
+                    committed_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    directory TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    finished_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    file_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    ingest_id TEXT,
+                    PRIMARY KEY (job_id, file_path)
+                );
+                CREATE INDEX IF NOT EXISTS idx_job_items_status
+                    ON job_items (job_id, status, position);
+                CREATE TABLE IF NOT EXISTS chunk_refs (
+                    collection TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    ingest_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (collection, file_path, ingest_id, position)
+                );
+                CREATE INDEX IF NOT EXISTS idx_chunk_refs_hash
+                    ON chunk_refs (collection, content_hash);
+                CREATE INDEX IF NOT EXISTS idx_chunk_refs_ingest
+                    ON chunk_refs (collection, ingest_id);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                """
+            )
+            columns = {
+                row["name"]
+                for row in self._conn.execute("PRAGMA table_info(files)").fetchall()
+            }
+            for column in ("doc_type", "fingerprint"):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} TEXT")
+            # Поколение индекса новой базы начинается с текущего времени (мс),
+            # чтобы не совпасть со значениями удаленной базы
+            self._conn.execute(
+                "INSERT OR IGNORE INTO meta VALUES ('index_generation', ?)",
+                (str(int(time.time() * 1000)),),
+            )
+
+    # --- Служебные значения ---
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value)
+            )
+
+    def increment_meta(self, key: str) -> int:
+        """Atomically increment an integer value, returns the new value"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+            value = int(row["value"]) + 1 if row else 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value))
+            )
+        return value
+
+    # --- Состояние файлов ---
+
+    def get_file(self, file_path: str) -> Optional[Dict]:
+        """Return committed state of the file or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM files WHERE file_path = ?", (file_path,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list_files(self) -> List[str]:
+        """Return paths of all committed files"""
+        with self._lock:
+            rows = self._conn.execute("SELECT file_path FROM files").fetchall()
+        return [row["file_path"] for row in rows]
+
+    def list_file_states(self) -> List[Dict]:
+        """Return committed states of all files"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM files").fetchall()
+        return [dict(row) for row in rows]
+
+    def commit_file(
+        self,
+        file_path: str,
+        file_hash: str,
+        last_modified: float,
+        ingest_id: str,
+        chunk_count: int,
+        job_id: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        """Atomically record the file as committed (and its job item, if any)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_path, file_hash, last_modified, "
+                "ingest_id, chunk_count, committed_at, doc_type, fingerprint) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    file_path,
+                    file_hash,
+                    last_modified,
+                    ingest_id,
+                    chunk_count,
+                    datetime.now().isoformat(),
+                    doc_type,
+                    fingerprint,
+                ),
+            )
+            if job_id:
+                self._conn.execute(
+                    "UPDATE job_items SET status = 'committed', ingest_id = ? "
+                    "WHERE job_id = ? AND file_path = ?",
+                    (ingest_id, job_id, file_path),
+                )
+
+    def update_file_config(
+        self, file_path: str, doc_type: Optional[str], fingerprint: Optional[str]
+    ) -> None:
+        """Record chunking/embedding config the file is currently indexed with"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET doc_type = ?, fingerprint = ? WHERE file_path = ?",
+                (doc_type, fingerprint, file_path),
+            )
+
+    def remove_file(self, file_path: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE file_path = ?", (file_path,))
+
+    # --- Ссылки на дедуплицированные чанки ---
+
+    def add_refs(
+        self,
+        collection: str,
+        file_path: str,
+        ingest_id: str,
+        refs: Iterable[Tuple[str, int]],
+    ) -> None:
+        """Record (content_hash, position) references of the file's chunks"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_refs VALUES (?, ?, ?, ?, ?)",
+                [
+                    (collection, content_hash, file_path, ingest_id, position)
+                    for content_hash, position in refs
+                ],
+            )
+
+    def _remaining_owners(
+        self, collection: str, hashes: Set[str], prefer: Optional[str]
+    ) -> Dict[str, str]:
+        """Return a file still containing each chunk (prefer keeps ownership)"""
+        owners: Dict[str, str] = {}
+        hashes_list = sorted(hashes)
+        for start in range(0, len(hashes_list), _IN_BATCH):
+            batch = hashes_list[start : start + _IN_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                "SELECT content_hash, MAX(file_path = ?) AS keeps, "
+                "MIN(file_path) AS file_path FROM chunk_refs "
+                f"WHERE collection = ? AND content_hash IN ({placeholders}) "
+                "GROUP BY content_hash",
+                (prefer, collection, *batch),
+            ).fetchall()
+            for row in rows:
+                owners[row["content_hash"]] = (
+                    prefer if row["keeps"] else row["file_path"]
+                )
+        return owners
+
+    def _release(
+        self,
+        collection: str,
+        condition: str,
+        params: tuple,
+        prefer: Optional[str] = None,
+    ) -> Tuple[List[str], Dict[str, str]]:
+        with self._lock, self._conn:
+            released = {
+                row["content_hash"]
+                for row in self._conn.execute(
+                    "SELECT DISTINCT content_hash FROM chunk_refs "
+                    f"WHERE collection = ? AND {condition}",
+                    (collection, *params),
+                ).fetchall()
+            }
+            self._conn.execute(
+                f"DELETE FROM chunk_refs WHERE collection = ? AND {condition}",
+                (collection, *params),
+            )
+            owners = self._remaining_owners(collection, released, prefer)
+        return sorted(released - owners.keys()), owners
+
+    def release_file_refs(
+        self, collection: str, file_path: str, keep_ingest_id: Optional[str] = None
+    ) -> Tuple[List[str], Dict[str, str]]:
+        """Drop references of the file except those of keep_ingest_id.
+
+        Returns hashes that are no longer referenced by any file and, for the
+        still shared ones, a file that contains them (the released file itself
+        if its current version still does).
+        """
+        return self._release(
+            collection,
+            "file_path = ? AND ingest_id IS NOT ?",
+            (file_path, keep_ingest_id),
+            prefer=file_path,
+        )
+
+    def release_ingest_refs(
+        self, collection: str, ingest_id: str
+    ) -> Tuple[List[str], Dict[str, str]]:
+        """Drop references written by a single (rolled back) ingestion"""
+        return self._release(collection, "ingest_id = ?", (ingest_id,))
+
+    def list_hashes(self, collection: str) -> List[str]:
+        """Return all referenced chunk hashes of the collection"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT content_hash FROM chunk_refs WHERE collection = ?",
+                (collection,),
+            ).fetchall()
+        return [row["content_hash"] for row in rows]
+
+    def get_sources(
+        self, collection: str, content_hashes: Iterable[str]
+    ) -> Dict[str, List[str]]:
+        """Return all files containing each of the chunks"""
+        hashes_list = sorted(set(content_hashes))
+        sources: Dict[str, List[str]] = {}
+        with self._lock:
+            for start in range(0, len(hashes_list), _IN_BATCH):
+                batch = hashes_list[start : start + _IN_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    "SELECT DISTINCT content_hash, file_path FROM chunk_refs "
+                    f"WHERE collection = ? AND content_hash IN ({placeholders}) "
+                    "ORDER BY file_path",
+                    (collection, *batch),
+                ).fetchall()
+                for row in rows:
+                    sources.setdefault(row["content_hash"], []).append(
+                        row["file_path"]
+                    )
+        return sources
+
+    def copy_refs(
+        self,
+        source: str,
+        target: str,
+        exclude_files: Iterable[str] = (),
+        only_files: Optional[Iterable[str]] = None,
+    ) -> None:
+        """Copy references between collections (used by index migration)"""
+        excluded = set(exclude_files)
+        included = set(only_files) if only_files is not None else None
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT content_hash, file_path, ingest_id, position FROM chunk_refs "
+                "WHERE collection = ?",
+                (source,),
+            ).fetchall()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_refs VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        target,
+                        row["content_hash"],
+                        row["file_path"],
+                        row["ingest_id"],
+                        row["position"],
+                    )
+                    for row in rows
+                    if row["file_path"] not in excluded
+                    and (included is None or row["file_path"] in included)
+                ],
+            )
+
+    def drop_refs(self, collection: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM chunk_refs WHERE collection = ?", (collection,)
+            )
+
+    # --- Задания индексации ---
+
+    def get_running_job(self, directory: str) -> Optional[str]:
+        """Return id of an unfinished job for the directory"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE directory = ? AND status = 'running' "
+                "ORDER BY created_at DESC LIMIT 1",
+                (directory,),
+            ).fetchone()
+        return row["job_id"] if row else None
+
+    def create_job(self, directory: str) -> str:
+        job_id = str(uuid.uuid4())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, 'running', ?, NULL)",
+                (job_id, directory, datetime.now().isoformat()),
+            )
+        return job_id
+
+    def enqueue(self, job_id: str, file_paths: List[str]) -> None:
+        """Add files to the job queue (already queued files are kept as is)"""
+        with self._lock, self._conn:
+            start = self._conn.execute(
+                "SELECT COALESCE(MAX(position), -1) + 1 FROM job_items WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO job_items VALUES (?, ?, ?, 'pending', NULL)",
+                [(job_id, start + i, path) for i, path in enumerate(file_paths)],
+            )
+
+    def get_interrupted_items(self, job_id: str) -> List[Dict]:
+        """Return items that were being written when the job was interrupted"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_path, ingest_id FROM job_items "
+                "WHERE job_id = ? AND status = 'in_progress'",
+                (job_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_pending_items(self, job_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_path FROM job_items WHERE job_id = ? "
+                "AND status IN ('pending', 'in_progress') ORDER BY position",
+                (job_id,),
+            ).fetchall()
+        return [row["file_path"] for row in rows]
+
+    def count_items(self, job_id: str, status: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status = ?",
+                (job_id, status),
+            ).fetchone()[0]
+
+    def mark_item(
+        self,
+        job_id: str,
+        file_path: str,
+        status: str,
+        ingest_id: Optional[str] = None,
+    ) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE job_items SET status = ?, ingest_id = ? "
+                "WHERE job_id = ? AND file_path = ?",
+                (status, ingest_id, job_id, file_path),
+            )
+
+    def finish_job(self, job_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ? WHERE job_id = ?",
+                (datetime.now().isoformat(), job_id),
+            )
+            self._conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,9 +1,10 @@
 import importlib
 import logging
-from typing import Dict, Callable
-from core.chat_provider import ChatProvider
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+from core.chat_provider import ChatProvider, MessageHandler
 from services.rag_system import RAGSystem
 from config import Config
+from managers.query_scheduler import QueryScheduler
 from managers.vector_db_manager import VectorDatabase
 
 
@@ -19,10 +20,15 @@ class ProviderManager:
         self.rag_system = RAGSystem(config)
         self.rag_system.vector_db = vector_db
         self.rag_system.load_for_query()
+        # Пул обработки запросов: очередь, лимиты пользователей, дедлайны
+        self.scheduler = QueryScheduler(config)
         self.start_providers()  # Загружаем и запускаем провайдеры
 
-        # Регистрируем обработчик сообщений
-        self.register_message_handler(self._handle_message)
+        # Регистрируем обработчики сообщений (асинхронный - для провайдеров
+        # с циклом событий)
+        self.register_message_handler(self._handle_message, self._ahandle_message)
+        if config.STREAM_ANSWERS:
+            self.register_stream_handler(self._stream_message, self._astream_message)
 
     def start_providers(self):
         """Загружает и запускает всех провайдеров из конфигурации"""
@@ -55,7 +61,7 @@ class ProviderManager:
                 self.logger.error(f"Ошибка инициализации провайдера '{name}': {e}")
 
     def stop_all(self):
-        """Останавливает все провайдеры, кроме консольного"""
+        """Останавливает все провайдеры, кроме консольного, и пул запросов"""
         for name, provider in self.providers.items():
             try:
                 # Консольный провайдер не требует остановки
@@ -64,17 +70,65 @@ class ProviderManager:
                     self.logger.info(f"Провайдер '{name}' остановлен")
             except Exception as e:
                 self.logger.error(f"Ошибка остановки провайдера '{name}': {e}")
+        self.logger.info(f"Метрики очереди запросов: {self.scheduler.metrics()}")
+        self.scheduler.shutdown(wait=False)
 
-    def register_message_handler(self, handler: Callable[[str], str]):
-        """Регистрирует обработчик входящих сообщений для всех провайдеров"""
+    def register_message_handler(
+        self,
+        handler: Callable[[str, str], str],
+        async_handler: Optional[MessageHandler] = None,
+    ):
+        """Регистрирует обработчик входящих сообщений для всех провайдеров.
+
+        Провайдеры с async_handlers получают async_handler, если он задан.
+        """
+        for provider in self.providers.values():
+            if async_handler and provider.async_handlers:
+                provider.register_message_handler(async_handler)
+            else:
+                provider.register_message_handler(handler)
+
+    def register_stream_handler(
+        self,
+        handler: Callable[[str, str], Iterator[str]],
+        async_handler: Callable[[str, str], AsyncIterator[str]],
+    ):
+        """Регистрирует потоковые обработчики (асинхронный - для async_handlers)"""
         for provider in self.providers.values():
-            provider.register_message_handler(handler)
+            provider.register_stream_handler(
+                async_handler if provider.async_handlers else handler
+            )
 
-    def _handle_message(self, message: str) -> str:
+    def _handle_message(self, message: str, user_id: str) -> str:
         """Обработчик входящих сообщений для всех провайдеров"""
         if message.lower() == "menu":
             return "Возврат в главное меню..."
-        return self.rag_system.query(message)
+        return self.scheduler.ask(user_id, self.rag_system.query, message)
+
+    async def _ahandle_message(self, message: str, user_id: str) -> str:
+        """Асинхронный обработчик: запрос выполняется в цикле событий провайдера"""
+        if message.lower() == "menu":
+            return "Возврат в главное меню..."
+        return await self.scheduler.aask(user_id, self.rag_system.aquery, message)
+
+    def _stream_message(self, message: str, user_id: str) -> Iterator[str]:
+        """Потоковый обработчик: фрагменты ответа по мере генерации"""
+        if message.lower() == "menu":
+            yield "Возврат в главное меню..."
+            return
+        yield from self.scheduler.stream(
+            user_id, self.rag_system.stream_query, message
+        )
+
+    async def _astream_message(self, message: str, user_id: str) -> AsyncIterator[str]:
+        """Асинхронный потоковый обработчик"""
+        if message.lower() == "menu":
+            yield "Возврат в главное меню..."
+            return
+        async for chunk in self.scheduler.astream(
+            user_id, self.rag_system.astream_query, message
+        ):
+            yield chunk
 
     def send_to_provider(self, provider_name: str, message: str):
         """Отправляет сообщение через указанный провайдер"""
@@ -0,0 +1,520 @@
+import asyncio
+import inspect
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional
+
+from config import Config
+
+_END = object()  # Маркер конца потока фрагментов
+
+
+class QueryRejected(Exception):
+    """Запрос не принят планировщиком; текст исключения - ответ пользователю"""
+
+
+class QueryTimeout(QueryRejected):
+    """Запрос не начал выполняться или не ответил до дедлайна"""
+
+
+_TIMEOUT_MESSAGE = "Превышено время ожидания ответа, повторите запрос"
+
+
+class TokenBucket:
+    """Ограничение частоты: rate токенов в секунду, не больше burst подряд"""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+@dataclass
+class _Job:
+    user_id: str
+    fn: Callable[..., Any]
+    args: tuple
+    deadline: float
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: Future = field(default_factory=Future)
+    # Цикл событий, в котором выполняется корутина fn (None - поток пула)
+    loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class QueryScheduler:
+    """Пул обработчиков запросов между провайдерами чата и RAGSystem.
+
+    Запросы выполняются QUERY_WORKERS потоками. У каждого пользователя (чата)
+    своя очередь, потоки выбирают пользователей по кругу, поэтому поток
+    сообщений из одного чата не задерживает остальных. Общая очередь
+    ограничена QUERY_QUEUE_SIZE, очередь пользователя - QUERY_USER_MAX_PENDING,
+    частота запросов пользователя - QUERY_USER_RATE_PER_MINUTE (с запасом
+    QUERY_USER_BURST), пользователи из QUERY_UNLIMITED_USERS не ограничиваются
+    по частоте. Запрос, не начавший выполняться за QUERY_TIMEOUT_SECONDS,
+    отменяется. На выполнение (для потока - до первого фрагмента) отводится
+    QUERY_EXECUTION_TIMEOUT_SECONDS: после него корутина отменяется, поток
+    фрагментов останавливается на следующем фрагменте, а синхронный вызов
+    дорабатывает без ожидающего и учитывается в метрике abandoned_running.
+
+    Корутины и асинхронные генераторы (aask/astream) проходят ту же очередь,
+    но выполняются в цикле событий вызывающего: поток пула только запускает
+    их, одновременно выполняется не больше QUERY_ASYNC_CONCURRENCY.
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+        self.timeout = config.QUERY_TIMEOUT_SECONDS
+        self.execution_timeout = config.QUERY_EXECUTION_TIMEOUT_SECONDS
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[_Job]] = {}
+        self._ready: Deque[str] = deque()  # Пользователи с ожидающими запросами
+        self._pending = 0
+        self._async_running = 0
+        self._abandoned_running = 0
+        # Отмена выполняющихся запросов: задача корутины или остановка потока
+        self._cancels: Dict[Future, Callable[[], Any]] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._max_buckets = 1024  # Порог очистки ограничителей неактивных чатов
+        self._running = True
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self._counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected_rate": 0,
+            "rejected_full": 0,
+            "timeouts": 0,
+            "execution_timeouts": 0,
+            "max_queue_depth": 0,
+        }
+        self._workers = [
+            threading.Thread(
+                target=self._work, name=f"rag-query-{number}", daemon=True
+            )
+            for number in range(config.QUERY_WORKERS)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _allow(self, user_id: str) -> bool:
+        if user_id in self.config.QUERY_UNLIMITED_USERS:
+            return True
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self._max_buckets:
+                self._prune_buckets()
+            bucket = self._buckets[user_id] = TokenBucket(
+                self.config.QUERY_USER_RATE_PER_MINUTE / 60,
+                self.config.QUERY_USER_BURST,
+            )
+        return bucket.take()
+
+    def _prune_buckets(self) -> None:
+        """Удаляет ограничители, которые успели заполниться (пользователь неактивен)"""
+        now = time.monotonic()
+        self._buckets = {
+            user_id: bucket
+            for user_id, bucket in self._buckets.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.rate < bucket.capacity
+        }
+
+    def submit(
+        self,
+        user_id: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> Future:
+        """Ставит fn(*args) в очередь пользователя.
+
+        С loop fn - корутинная функция, выполняемая в этом цикле событий.
+
+        Raises:
+            QueryRejected: превышена частота запросов или очередь заполнена
+        """
+        with self._cond:
+            if not self._running:
+                raise QueryRejected("Сервис останавливается, попробуйте позже")
+            if not self._allow(user_id):
+                self._counters["rejected_rate"] += 1
+                raise QueryRejected(
+                    "Слишком много запросов, подождите немного и повторите"
+                )
+            user_queue = self._queues.setdefault(user_id, deque())
+            if (
+                self._pending >= self.config.QUERY_QUEUE_SIZE
+                or len(user_queue) >= self.config.QUERY_USER_MAX_PENDING
+            ):
+                self._counters["rejected_full"] += 1
+                raise QueryRejected("Сервер занят обработкой запросов, повторите позже")
+
+            job = _Job(user_id, fn, args, time.monotonic() + self.timeout, loop=loop)
+            if not user_queue:
+                self._ready.append(user_id)
+            user_queue.append(job)
+            self._pending += 1
+            self._counters["submitted"] += 1
+            self._counters["max_queue_depth"] = max(
+                self._counters["max_queue_depth"], self._pending
+            )
+            self._cond.notify()
+            return job.future
+
+    def _next_job(self) -> Optional[_Job]:
+        """Следующий запрос по кругу пользователей; None при остановке"""
+        with self._cond:
+            while self._running and not self._ready:
+                self._cond.wait()
+            if not self._ready:
+                return None
+            user_id = self._ready.popleft()
+            user_queue = self._queues[user_id]
+            job = user_queue.popleft()
+            if user_queue:
+                self._ready.append(user_id)
+            else:
+                del self._queues[user_id]
+            self._pending -= 1
+            return job
+
+    def _work(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue  # Отменен ожидающим (истек дедлайн)
+
+            started = time.monotonic()
+            if started > job.deadline:
+                self._count("timeouts")
+                job.future.set_exception(QueryTimeout(_TIMEOUT_MESSAGE))
+                continue
+            with self._cond:
+                self._waits.append(started - job.enqueued_at)
+            if job.loop is not None:
+                self._start_async(job)
+                continue
+            try:
+                job.future.set_result(job.fn(*job.args))
+                self._count("completed")
+            except Exception as e:
+                self.logger.error(f"Ошибка обработки запроса {job.user_id}: {e}")
+                self._count("failed")
+                job.future.set_exception(e)
+
+    def _start_async(self, job: _Job) -> None:
+        """Запускает корутину в цикле событий, не дожидаясь ее завершения"""
+        with self._cond:
+            while (
+                self._running
+                and self._async_running >= self.config.QUERY_ASYNC_CONCURRENCY
+            ):
+                self._cond.wait()
+            if not self._running:
+                job.future.set_exception(
+                    QueryRejected("Сервис останавливается, попробуйте позже")
+                )
+                return
+            self._async_running += 1
+        try:
+            task = asyncio.run_coroutine_threadsafe(job.fn(*job.args), job.loop)
+        except Exception as e:
+            # Цикл событий уже закрыт
+            self._finish_async(job, None, e)
+            return
+        with self._cond:
+            self._cancels[job.future] = task.cancel
+        task.add_done_callback(lambda done: self._finish_async(job, done))
+
+    def _finish_async(
+        self, job: _Job, task: Optional[Future], error: Optional[BaseException] = None
+    ) -> None:
+        with self._cond:
+            self._async_running -= 1
+            self._cancels.pop(job.future, None)
+            self._cond.notify_all()
+        if task is not None and task.cancelled():
+            error = QueryRejected("Запрос отменен")
+        elif task is not None:
+            error = task.exception()
+        if error is None:
+            job.future.set_result(task.result())
+            self._count("completed")
+            return
+        self.logger.error(f"Ошибка обработки запроса {job.user_id}: {error}")
+        self._count("failed")
+        job.future.set_exception(error)
+
+    def _count(self, name: str) -> None:
+        with self._cond:
+            self._counters[name] += 1
+
+    def _queue_timeout(self, future: Future) -> bool:
+        """Отменяет запрос, не начавший выполняться; False - он уже выполняется"""
+        if not future.cancel():
+            return False
+        self._count("timeouts")
+        return True
+
+    def _abandon(self, future: Future) -> str:
+        """Ожидающий больше не ждет выполняющийся запрос: запрос отменяется"""
+        with self._cond:
+            self._counters["execution_timeouts"] += 1
+            cancel = self._cancels.get(future)
+            if not future.done():
+                self._abandoned_running += 1
+                future.add_done_callback(self._abandoned_done)
+        if cancel is not None:
+            cancel()
+        return _TIMEOUT_MESSAGE
+
+    def _abandoned_done(self, _: Future) -> None:
+        with self._cond:
+            self._abandoned_running -= 1
+
+    def ask(self, user_id: str, fn: Callable[..., str], *args: Any) -> str:
+        """Выполняет fn(*args) в пуле и ждет ответ; отказы возвращаются текстом"""
+        try:
+            future = self.submit(user_id, fn, *args)
+        except QueryRejected as e:
+            return str(e)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if self._queue_timeout(future):
+                return _TIMEOUT_MESSAGE
+        except QueryRejected as e:
+            return str(e)
+        try:
+            return future.result(timeout=self.execution_timeout)
+        except FutureTimeoutError:
+            return self._abandon(future)
+        except QueryRejected as e:
+            return str(e)
+
+    async def aask(self, user_id: str, fn: Callable[..., Any], *args: Any) -> str:
+        """ask для цикла событий: ожидание не блокирует другие сообщения.
+
+        Корутинная fn выполняется в текущем цикле событий, обычная - в пуле.
+        """
+        loop = asyncio.get_running_loop() if inspect.iscoroutinefunction(fn) else None
+        try:
+            future = self.submit(user_id, fn, *args, loop=loop)
+        except QueryRejected as e:
+            return str(e)
+        result = asyncio.wrap_future(future)
+        try:
+            # shield: истечение ожидания не отменяет выполняющийся запрос
+            return await asyncio.wait_for(asyncio.shield(result), self.timeout)
+        except asyncio.TimeoutError:
+            if self._queue_timeout(future):
+                return _TIMEOUT_MESSAGE
+        except QueryRejected as e:
+            return str(e)
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(result), self.execution_timeout
+            )
+        except asyncio.TimeoutError:
+            return self._abandon(future)
+        except QueryRejected as e:
+            return str(e)
+
+    def _submit_stream(
+        self,
+        user_id: str,
+        fn: Callable[..., Any],
+        args: tuple,
+        emit,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> Future:
+        """Задача, передающая фрагменты fn(*args) в emit; в конце - _END.
+
+        Асинхронный генератор fn читается в цикле событий loop.
+        """
+        if inspect.isasyncgenfunction(fn):
+
+            async def aproduce() -> None:
+                async for chunk in fn(*args):
+                    emit(chunk)
+
+            future = self.submit(user_id, aproduce, loop=loop)
+        else:
+            stop = threading.Event()
+
+            def produce() -> None:
+                chunks = fn(*args)
+                try:
+                    for chunk in chunks:
+                        if stop.is_set():
+                            return  # Ожидающий ушел по таймауту
+                        emit(chunk)
+                finally:
+                    close = getattr(chunks, "close", None)
+                    if close:
+                        close()
+
+            future = self.submit(user_id, produce)
+            with self._cond:
+                self._cancels[future] = stop.set
+        future.add_done_callback(self._forget_cancel)
+        future.add_done_callback(lambda _: emit(_END))
+        return future
+
+    def _forget_cancel(self, future: Future) -> None:
+        with self._cond:
+            self._cancels.pop(future, None)
+
+    @staticmethod
+    def _stream_error(future: Future) -> Optional[str]:
+        """Текст отказа задачи или исключение выполнения"""
+        if future.cancelled():
+            return None
+        error = future.exception()
+        if isinstance(error, QueryRejected):
+            return str(error)
+        if error is not None:
+            raise error
+        return None
+
+    def stream(
+        self, user_id: str, fn: Callable[..., Iterator[str]], *args: Any
+    ) -> Iterator[str]:
+        """Потоковый ask: фрагменты генератора fn(*args), выполняемого в пуле.
+
+        Дедлайны очереди и выполнения ограничивают ожидание первого фрагмента.
+        """
+        chunks: queue.Queue = queue.Queue()
+        try:
+            future = self._submit_stream(user_id, fn, args, chunks.put)
+        except QueryRejected as e:
+            yield str(e)
+            return
+
+        deadline = time.monotonic() + self.timeout
+        first = True
+        running = False
+        while True:
+            try:
+                chunk = chunks.get(
+                    timeout=max(0.0, deadline - time.monotonic()) if first else None
+                )
+            except queue.Empty:
+                if self._queue_timeout(future):
+                    yield _TIMEOUT_MESSAGE
+                    return
+                if not running:
+                    # Запрос выполняется: ожидание первого фрагмента продлевается
+                    running = True
+                    deadline = time.monotonic() + self.execution_timeout
+                    continue
+                yield self._abandon(future)
+                return
+            if chunk is _END:
+                break
+            first = False
+            yield chunk
+        error = self._stream_error(future)
+        if error:
+            yield error
+
+    async def astream(
+        self, user_id: str, fn: Callable[..., Any], *args: Any
+    ) -> AsyncIterator[str]:
+        """stream для цикла событий; fn - генератор или асинхронный генератор"""
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        try:
+            future = self._submit_stream(
+                user_id,
+                fn,
+                args,
+                lambda chunk: loop.call_soon_threadsafe(chunks.put_nowait, chunk),
+                loop,
+            )
+        except QueryRejected as e:
+            yield str(e)
+            return
+
+        deadline = time.monotonic() + self.timeout
+        first = True
+        running = False
+        while True:
+            try:
+                if first:
+                    chunk = await asyncio.wait_for(
+                        chunks.get(), max(0.0, deadline - time.monotonic())
+                    )
+                else:
+                    chunk = await chunks.get()
+            except asyncio.TimeoutError:
+                if self._queue_timeout(future):
+                    yield _TIMEOUT_MESSAGE
+                    return
+                if not running:
+                    # Запрос выполняется: ожидание первого фрагмента продлевается
+                    running = True
+                    deadline = time.monotonic() + self.execution_timeout
+                    continue
+                yield self._abandon(future)
+                return
+            if chunk is _END:
+                break
+            first = False
+            yield chunk
+        error = self._stream_error(future)
+        if error:
+            yield error
+
+    def metrics(self) -> Dict[str, Any]:
+        """Глубина очереди, счетчики и время ожидания в очереди (секунды)"""
+        with self._cond:
+            waits: List[float] = sorted(self._waits)
+            result: Dict[str, Any] = {
+                "workers": len(self._workers),
+                "queue_depth": self._pending,
+                "async_running": self._async_running,
+                "abandoned_running": self._abandoned_running,
+                "users_waiting": len(self._ready),
+                **self._counters,
+            }
+        result["wait_avg"] = sum(waits) / len(waits) if waits else 0.0
+        result["wait_p95"] = waits[int(len(waits) * 0.95)] if waits else 0.0
+        result["wait_max"] = waits[-1] if waits else 0.0
+        return result
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Останавливает потоки; ожидающие запросы завершаются отказом"""
+        with self._cond:
+            self._running = False
+            jobs = [job for user_queue in self._queues.values() for job in user_queue]
+            self._queues.clear()
+            self._ready.clear()
+            self._pending = 0
+            self._cond.notify_all()
+        for job in jobs:
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_exception(
+                    QueryRejected("Сервис останавливается, попробуйте позже")
+                )
+        if wait:
+            for worker in self._workers:
+                worker.join()
@@ -1,16 +1,22 @@
 import os
 import shutil
+import threading
 import uuid
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 import json
 import gc
 import numpy as np
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from managers.embedding_manager import EmbeddingManager
+from managers.index_catalog import IndexCatalog
 from config import Config
 
+DEFAULT_COLLECTION_NAME = "documents_collection"
+# Метрика новых коллекций: релевантность равна косинусному сходству
+COLLECTION_SPACE = "cosine"
+
 
 class VectorDatabase:
     """Class for managing ChromaDB vector databases with enhanced error handling"""
@@ -23,21 +29,38 @@ class VectorDatabase:
         self.embedding_manager = embedding_manager
         self.db: Optional[Chroma] = None
         self.cache_db: Optional[Chroma] = None
+        self.catalog: Optional[IndexCatalog] = None
+        self.collection_name = DEFAULT_COLLECTION_NAME
+        # Теневая база миграции пишет ссылки на чанки, но не фиксирует файлы
+        self.commit_files = True
+        # Сериализует запись в основную коллекцию (индексация, миграция)
+        self.write_lock = threading.RLock()
+        # Поколение индекса без каталога (каталог хранит его между запусками)
+        self._generation = 0
 
     def load_or_create(self, force_recreate: bool = False) -> None:
         """Load or create main ChromaDB collection"""
         try:
             if force_recreate and os.path.exists(self.db_path):
+                if self.catalog:
+                    self.catalog.close()
+                    self.catalog = None
                 shutil.rmtree(self.db_path)
                 print(f"Удалена существующая база: {self.db_path}")
 
-            device = self.embedding_manager.get_current_device()
-            self.db = Chroma(
-                persist_directory=self.db_path,
-                embedding_function=self.embedding_manager.embeddings,
-                collection_name="documents_collection",
+            self.load_catalog()
+            self.collection_name = self.catalog.get_meta(
+                "active_collection", DEFAULT_COLLECTION_NAME
             )
+            device = self.embedding_manager.get_current_device()
+            self.db = self.open_collection(self.collection_name)
             print(f"✅ База данных инициализирована. Устройство эмбеддингов: {device}")
+            if not self.scores_calibrated and self.db._collection.count():
+                print(
+                    f"⚠️ Коллекция '{self.collection_name}' использует метрику "
+                    f"{self.distance_space}: пороги релевантности не применяются. "
+                    "Для перехода на метрику cosine выполните миграцию индекса"
+                )
 
             # Test functionality
             test_id = "test_" + str(uuid.uuid4())
@@ -51,15 +74,70 @@ class VectorDatabase:
         except Exception as e:
             print(f"❌ Ошибка инициализации базы данных: {e}")
             try:
-                self.db = Chroma(
-                    persist_directory=self.db_path,
-                    embedding_function=self.embedding_manager.embeddings,
-                    collection_name="documents_collection",
-                )
+                self.db = self.open_collection(self.collection_name)
                 print("✅ База данных инициализирована (fallback)")
             except Exception as e:
                 raise RuntimeError(f"Не удалось инициализировать базу данных: {e}")
 
+    def open_collection(self, collection_name: str) -> Chroma:
+        """Open (or create) a collection of the main database.
+
+        New collections use the cosine space, existing ones keep their space.
+        """
+        return Chroma(
+            persist_directory=self.db_path,
+            embedding_function=self.embedding_manager.embeddings,
+            collection_name=collection_name,
+            collection_metadata={"hnsw:space": COLLECTION_SPACE},
+        )
+
+    @property
+    def distance_space(self) -> str:
+        """Distance of the active collection (collections created earlier use l2)"""
+        metadata = self.db._collection.metadata if self.db else None
+        return (metadata or {}).get("hnsw:space", "l2")
+
+    @property
+    def scores_calibrated(self) -> bool:
+        """Relevance scores are cosine similarities comparable with thresholds.
+
+        With l2 over unnormalized embeddings the relevance derived from the
+        distance depends on vector norms, thresholds are meaningless for it.
+        """
+        return self.distance_space == COLLECTION_SPACE
+
+    def swap_collection(self, new_db: Chroma, collection_name: str) -> Chroma:
+        """Atomically switch retrieval to another collection, returns the old one"""
+        with self.write_lock:
+            old_db = self.db
+            self.load_catalog()
+            self.catalog.set_meta("active_collection", collection_name)
+            self.db = new_db
+            self.collection_name = collection_name
+            self.bump_index_generation()
+        return old_db
+
+    @property
+    def index_generation(self) -> int:
+        """Monotonic counter bumped whenever the set of indexed chunks changes"""
+        if self.catalog is None:
+            return self._generation
+        return int(self.catalog.get_meta("index_generation", "0"))
+
+    def bump_index_generation(self) -> int:
+        """Invalidate results computed for earlier index generations"""
+        if self.catalog is None:
+            self._generation += 1
+            return self._generation
+        return self.catalog.increment_meta("index_generation")
+
+    def load_catalog(self) -> None:
+        """Open durable indexing catalog stored next to the main collection"""
+        if self.catalog is None:
+            self.catalog = IndexCatalog(
+                os.path.join(self.db_path, "index_catalog.sqlite3")
+            )
+
     def load_or_create_cache(self, force_recreate: bool = False) -> None:
         """Load or create cache ChromaDB collection"""
         if force_recreate:
@@ -147,6 +225,135 @@ class VectorDatabase:
         except Exception as e:
             raise RuntimeError(f"Error deleting documents: {e}")
 
+    def get_file_chunk_ids(self, file_path: str) -> List[str]:
+        """Return ids of all chunks of the file (including catalog items)"""
+        if not self.db:
+            return []
+
+        items = self.db.get(
+            where={"$or": [{"file_path": file_path}, {"catalog_path": file_path}]},
+            include=[],
+        )
+        return items.get("ids", []) if items else []
+
+    def get_existing_ids(self, ids: List[str]) -> set:
+        """Return which of the ids are already stored in the main collection"""
+        if not self.db or not ids:
+            return set()
+
+        items = self.db.get(ids=ids, include=[])
+        return set(items.get("ids", [])) if items else set()
+
+    def get_existing_metadata(self, ids: List[str]) -> Dict[str, Dict]:
+        """Return metadata of the ids already stored in the main collection"""
+        if not self.db or not ids:
+            return {}
+
+        items = self.db.get(ids=ids, include=["metadatas"])
+        return {
+            chunk_id: metadata or {}
+            for chunk_id, metadata in zip(
+                items.get("ids", []), items.get("metadatas", [])
+            )
+        }
+
+    def add_chunks(self, ids: List[str], chunks: List[Document]) -> None:
+        """Embed and store chunks under the given ids (existing ids are replaced)"""
+        self.db.add_texts(
+            texts=[chunk.page_content for chunk in chunks],
+            metadatas=[chunk.metadata for chunk in chunks],
+            ids=ids,
+        )
+
+    def update_chunk_metadata(self, ids: List[str], metadatas: List[Dict]) -> None:
+        """Replace metadata of stored chunks without re-embedding them"""
+        if self.db and ids:
+            self.db._collection.update(ids=ids, metadatas=metadatas)
+
+    def release_chunks(
+        self, orphaned: List[str], owners: Dict[str, str], released_file: str
+    ) -> None:
+        """Apply released chunk references to the collection.
+
+        Chunks without references are deleted. Shared chunks whose metadata
+        points to the released file are reassigned to a remaining source file.
+        """
+        if not self.db:
+            return
+
+        self.delete_documents(list(orphaned))
+        if not owners:
+            return
+
+        ids = list(owners)
+        items = self.db.get(ids=ids, include=["metadatas"])
+        update_ids, update_metadatas = [], []
+        for chunk_id, metadata in zip(items.get("ids", []), items.get("metadatas", [])):
+            if not isinstance(metadata, dict):
+                continue
+            owner = metadata.get("catalog_path") or metadata.get("file_path")
+            new_owner = owners[chunk_id]
+            if owner != released_file or new_owner == released_file:
+                continue
+            metadata = dict(metadata)
+            metadata["source"] = os.path.basename(new_owner)
+            metadata["file_path"] = new_owner
+            if "catalog_path" in metadata:
+                metadata["catalog_path"] = new_owner
+            update_ids.append(chunk_id)
+            update_metadatas.append(metadata)
+        self.update_chunk_metadata(update_ids, update_metadatas)
+
+    def delete_by_ingest_id(self, ingest_id: str) -> None:
+        """Delete chunks written by a single (possibly interrupted) ingestion"""
+        if not self.db:
+            return
+
+        try:
+            if self.catalog:
+                orphaned, _ = self.catalog.release_ingest_refs(
+                    self.collection_name, ingest_id
+                )
+                self.delete_documents(orphaned)
+            self.db.delete(where={"ingest_id": ingest_id})
+        except Exception as e:
+            raise RuntimeError(f"Error deleting documents: {e}")
+
+    @staticmethod
+    def _chunk_hashes(doc: Document) -> List[str]:
+        """Хэши фрагмента; у склеенного контекста - всех входящих чанков"""
+        if doc.metadata.get("merged_hashes"):
+            return doc.metadata["merged_hashes"]
+        chunk_hash = doc.metadata.get("content_hash")
+        return [chunk_hash] if chunk_hash else []
+
+    def get_chunk_sources(self, documents: List[Document]) -> List[str]:
+        """Return every source file of the retrieved chunks.
+
+        A deduplicated chunk is stored once, the files that contain it are
+        taken from the index catalog and saved to metadata["sources"].
+        """
+        hashes = [
+            chunk_hash
+            for doc in documents
+            for chunk_hash in self._chunk_hashes(doc)
+        ]
+        refs = (
+            self.catalog.get_sources(self.collection_name, hashes)
+            if self.catalog and hashes
+            else {}
+        )
+        sources: List[str] = []
+        for doc in documents:
+            owner = doc.metadata.get("catalog_path") or doc.metadata.get("file_path")
+            files = []
+            for chunk_hash in self._chunk_hashes(doc):
+                files.extend(p for p in refs.get(chunk_hash, []) if p not in files)
+            files = files or ([owner] if owner else [])
+            doc.metadata["sources"] = files
+            sources.extend(path for path in files if path not in sources)
+        return sources
+
     def delete_cached_entries_by_source(self, source_file_name: str) -> None:
         """Delete cache entries associated with specified source file"""
         if not isinstance(source_file_name, str):
@@ -224,12 +431,28 @@ class VectorDatabase:
             print(f"Error getting documents by hash: {e}")
             return {}
 
-    def get_all_metadata(self, batch_size: int = 1000) -> List[Dict]:
-        """Retrieve all metadata from ChromaDB with pagination."""
+    def get_file_metadata(self, file_path: str) -> Optional[Dict]:
+        """Return metadata of any stored chunk of the file, if it is indexed"""
         if not self.db:
-            return []
+            return None
+
+        try:
+            items = self.db.get(
+                where={"$or": [{"file_path": file_path}, {"catalog_path": file_path}]},
+                include=["metadatas"],
+                limit=1,
+            )
+        except Exception as e:
+            print(f"Error getting file metadata: {e}")
+            return None
+        metadatas = items.get("metadatas") if items else None
+        return metadatas[0] if metadatas else None
+
+    def iter_all_metadata(self, batch_size: int = 1000) -> Iterator[Dict]:
+        """Iterate over metadata of all chunks page by page"""
+        if not self.db:
+            return
 
-        metadatas = []
         offset = 0
         while True:
             items = self.db._collection.get(
@@ -237,9 +460,12 @@ class VectorDatabase:
             )
             if not items["metadatas"]:
                 break
-            metadatas.extend(items["metadatas"])
+            yield from items["metadatas"]
             offset += batch_size
-        return metadatas
+
+    def get_all_metadata(self, batch_size: int = 1000) -> List[Dict]:
+        """Retrieve all metadata from ChromaDB with pagination."""
+        return list(self.iter_all_metadata(batch_size))
 
     def close(self):
         """Гарантированное освобождение ресурсов"""
@@ -248,6 +474,9 @@ class VectorDatabase:
                 self.db = None
             if self.cache_db:
                 self.cache_db = None
+            if self.catalog:
+                self.catalog.close()
+                self.catalog = None
         except Exception as e:
             print(f"Ошибка при закрытии VectorDatabase: {e}")
         finally:
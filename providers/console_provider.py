@@ -1,11 +1,17 @@
-from core.chat_provider import ChatProvider
+from typing import Iterator
+
+from core.chat_provider import ChatProvider, MessageHandler, call_handler_sync
 
 
 class ConsoleProvider(ChatProvider):
     """Провайдер для консольного взаимодействия"""
 
+    # Идентификатор консольного пользователя для планировщика запросов
+    USER_ID = "console"
+
     def __init__(self):
         self.message_handler = None
+        self.stream_handler = None
 
     def start(self):
         """Заглушка для метода запуска (не требуется для консоли)"""
@@ -19,6 +25,17 @@ class ConsoleProvider(ChatProvider):
         """Выводит сообщение в консоль"""
         print(f"\nОтвет: {message}")
 
+    def send_stream(self, chunks: Iterator[str]):
+        """Выводит ответ в консоль по мере поступления фрагментов"""
+        started = False
+        for chunk in chunks:
+            if not started:
+                # Заголовок после первого фрагмента, чтобы не смешивать с логами поиска
+                print("\nОтвет: ", end="")
+                started = True
+            print(chunk, end="", flush=True)
+        print()
+
     def run_in_foreground(self):
         """Запускает консольный интерфейс в основном потоке"""
         print("\n=== Консольный чат ===")
@@ -37,8 +54,12 @@ class ConsoleProvider(ChatProvider):
                     print("Возврат в главное меню...")
                     return
 
-                if self.message_handler:
-                    response = self.message_handler(user_input)
+                if self.stream_handler:
+                    self.send_stream(self.stream_handler(user_input, self.USER_ID))
+                elif self.message_handler:
+                    response = call_handler_sync(
+                        self.message_handler, user_input, self.USER_ID
+                    )
                     self.send_message(response)
 
             except KeyboardInterrupt:
@@ -47,6 +68,6 @@ class ConsoleProvider(ChatProvider):
             except Exception as e:
                 print(f"\nОшибка в консольном провайдере: {e}")
 
-    def register_message_handler(self, handler: callable):
+    def register_message_handler(self, handler: MessageHandler):
         """Регистрирует обработчик входящих сообщений"""
         self.message_handler = handler
@@ -1,19 +1,31 @@
 import asyncio
 import logging
 import threading
+import time
+from typing import AsyncIterator
+
 from aiogram import Bot, Dispatcher, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from core.chat_provider import ChatProvider
+from core.chat_provider import ChatProvider, MessageHandler, call_handler
 
 
 class TelegramProvider(ChatProvider):
     """Провайдер для взаимодействия через Telegram"""
 
-    def __init__(self, token: str):
+    # Сообщения обрабатываются задачами aiogram параллельно
+    async_handlers = True
+    # Максимальная длина сообщения Telegram
+    MESSAGE_LIMIT = 4096
+
+    def __init__(self, token: str, stream_edit_interval: float = 1.0):
         self.token = token
         self.bot = Bot(token=token)
         self.dp = Dispatcher()
         self.message_handler = None
+        self.stream_handler = None
+        # Не чаще одного редактирования сообщения за интервал (лимиты Telegram)
+        self.stream_edit_interval = stream_edit_interval
         self.logger = logging.getLogger(__name__)
         self.running = False
         self.thread = None
@@ -53,6 +65,11 @@ class TelegramProvider(ChatProvider):
         finally:
             self.running = False
 
+    @staticmethod
+    def _user_id(message: types.Message) -> str:
+        """Лимиты запросов считаются по чату: группа делит их на всех участников"""
+        return f"telegram:{message.chat.id}"
+
     async def _handle_start(self, message: types.Message):
         """Обработчик команды /start"""
         await message.answer(
@@ -62,18 +79,52 @@ class TelegramProvider(ChatProvider):
     async def _handle_menu(self, message: types.Message):
         """Обработчик команды /menu"""
         if self.message_handler:
-            response = self.message_handler("menu")
+            response = await call_handler(
+                self.message_handler, "menu", self._user_id(message)
+            )
             await message.answer(response)
 
     async def _handle_message(self, message: types.Message):
         """Обработчик входящих сообщений"""
+        user_id = self._user_id(message)
+        if self.stream_handler and message.text:
+            chunks = self.stream_handler(message.text, user_id)
+            await self._answer_stream(message, chunks)
+            return
         if not message.text or not self.message_handler:
             return
 
-        # Обрабатываем текст сообщения
-        response = self.message_handler(message.text)
+        # Обрабатываем текст сообщения, не блокируя цикл событий бота
+        response = await call_handler(self.message_handler, message.text, user_id)
         await message.answer(response)
 
+    async def _answer_stream(self, message: types.Message, chunks: AsyncIterator[str]):
+        """Отправляет ответ одним сообщением, дописывая его по мере генерации.
+
+        Сообщение редактируется не чаще stream_edit_interval секунд, текст
+        длиннее MESSAGE_LIMIT обрезается.
+        """
+        reply = await message.answer("…")
+        text, shown = "", ""
+        last_edit = time.monotonic()
+        async for chunk in chunks:
+            text += chunk
+            if time.monotonic() - last_edit >= self.stream_edit_interval:
+                shown = await self._edit_reply(reply, text, shown)
+                last_edit = time.monotonic()
+        await self._edit_reply(reply, text or "Ответ не найден", shown)
+
+    async def _edit_reply(self, reply: types.Message, text: str, shown: str) -> str:
+        """Обновляет текст сообщения, если он изменился; возвращает показанный текст"""
+        text = text[: self.MESSAGE_LIMIT]
+        if text.strip() and text != shown:
+            try:
+                await reply.edit_text(text)
+                return text
+            except TelegramBadRequest as e:
+                self.logger.warning(f"Не удалось обновить сообщение: {e}")
+        return shown
+
     def send_message(self, message: str):
         """Отправляет сообщение через Telegram (не реализовано, так как требует chat_id)"""
         # Этот метод будет реализован позже при необходимости
@@ -81,7 +132,7 @@ class TelegramProvider(ChatProvider):
             "Метод send_message не реализован для группового использования"
         )
 
-    def register_message_handler(self, handler: callable):
+    def register_message_handler(self, handler: MessageHandler):
         """Регистрирует обработчик входящих сообщений"""
         self.message_handler = handler
 
@@ -0,0 +1,102 @@
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from config import Config
+
+
+def estimate_tokens(text: str, chars_per_token: float) -> int:
+    """Грубая оценка числа токенов по длине текста (без загрузки токенизатора)"""
+    return int(len(text) / chars_per_token) + 1
+
+
+def _merge_group(documents: List[Document], max_gap: int) -> List[Document]:
+    """Склеивает пересекающиеся и соседние фрагменты одного файла.
+
+    Фрагменты упорядочиваются по start_index, перекрытие берется один раз,
+    между соседними фрагментами (разрыв не больше max_gap символов)
+    вставляется перевод строки.
+    """
+    merged: List[Document] = []
+    end = 0
+    for doc in sorted(documents, key=lambda d: d.metadata["start_index"]):
+        start = doc.metadata["start_index"]
+        if merged and start <= end + max_gap:
+            current = merged[-1]
+            doc_end = start + len(doc.page_content)
+            if doc_end > end:
+                tail = doc.page_content[max(0, end - start) :]
+                separator = "" if start <= end else "\n"
+                current.page_content += separator + tail
+                end = doc_end
+            metadata = current.metadata
+            metadata["merged_hashes"].append(doc.metadata.get("content_hash"))
+            metadata["rank"] = min(metadata["rank"], doc.metadata["rank"])
+            continue
+
+        metadata = dict(doc.metadata)
+        metadata["merged_hashes"] = [doc.metadata.get("content_hash")]
+        merged.append(Document(page_content=doc.page_content, metadata=metadata))
+        end = start + len(doc.page_content)
+    return merged
+
+
+def merge_chunks(documents: List[Document], max_gap: int = 0) -> List[Document]:
+    """Объединяет пересекающиеся фрагменты файлов, сохраняя порядок релевантности.
+
+    Фрагменты без start_index (элементы каталогов) не объединяются.
+    Результат упорядочен по лучшему рангу входящих в него фрагментов.
+    """
+    groups: Dict[str, List[Document]] = {}
+    result: List[Document] = []
+    for rank, doc in enumerate(documents):
+        doc = Document(page_content=doc.page_content, metadata={**doc.metadata})
+        doc.metadata["rank"] = rank
+        if "start_index" in doc.metadata and doc.metadata.get("file_path"):
+            groups.setdefault(doc.metadata["file_path"], []).append(doc)
+        else:
+            doc.metadata["merged_hashes"] = [doc.metadata.get("content_hash")]
+            result.append(doc)
+
+    for group in groups.values():
+        result.extend(_merge_group(group, max_gap))
+    result.sort(key=lambda d: d.metadata["rank"])
+    for doc in result:
+        doc.metadata.pop("rank")
+        doc.metadata["merged_hashes"] = [h for h in doc.metadata["merged_hashes"] if h]
+    return result
+
+
+def pack_context(
+    documents: List[Document], token_budget: int, chars_per_token: float
+) -> List[Document]:
+    """Набирает фрагменты по порядку, пока не исчерпан бюджет токенов.
+
+    Не поместившиеся фрагменты пропускаются (следующий, более короткий, может
+    поместиться), первый фрагмент при необходимости обрезается по бюджету.
+    """
+    packed: List[Document] = []
+    remaining = token_budget
+    for doc in documents:
+        tokens = estimate_tokens(doc.page_content, chars_per_token)
+        if tokens <= remaining:
+            packed.append(doc)
+            remaining -= tokens
+        elif not packed:
+            limit = int(remaining * chars_per_token)
+            packed.append(
+                Document(page_content=doc.page_content[:limit], metadata=doc.metadata)
+            )
+            break
+    return packed
+
+
+def build_context(
+    hits: List[Tuple[Document, float]], config: Config
+) -> List[Document]:
+    """Контекст для промпта из найденных фрагментов (по убыванию релевантности)"""
+    documents = [doc for doc, _ in hits]
+    merged = merge_chunks(documents, config.CONTEXT_MERGE_GAP_CHARS)
+    return pack_context(
+        merged, config.CONTEXT_TOKEN_BUDGET, config.CONTEXT_CHARS_PER_TOKEN
+    )
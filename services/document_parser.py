@@ -1,25 +1,43 @@
+import hashlib
 import json
 import os
-from typing import List
-from pypdf import PdfReader
+import tempfile
+from typing import Dict, Iterator, List, Optional
+from pypdf import PdfReader, PdfWriter
 from striprtf.striprtf import rtf_to_text
 from unstructured.partition.auto import partition
 from config import Config
 from langchain_core.documents import Document
+from services.parsed_text_cache import ParsedTextCache
+from utils.indexing_metrics import stage
 from utils.json_splitter import JsonTextSplitter
 
+# Версия логики разбора: увеличивается при изменениях, влияющих на извлекаемый текст
+PARSER_VERSION = "1"
+
 
 class DocumentParser:
     def __init__(self, config: Config):
         self.config = config
+        self.text_cache = (
+            ParsedTextCache(config.PARSED_TEXT_CACHE_PATH, PARSER_VERSION)
+            if config.PARSED_TEXT_CACHE_ENABLED
+            else None
+        )
 
     def needs_ocr(self, file_path: str) -> bool:
         """Determine if PDF requires OCR processing."""
+        return self._ocr_by_path(file_path) or self._ocr_by_text(file_path)
+
+    def _ocr_by_path(self, file_path: str) -> bool:
         relative_path = os.path.relpath(file_path, start=self.config.INPUT_DIR).lower()
-        for keyword in self.config.PDF_PROCESSING["ocr_path_keywords"]:
-            if keyword in relative_path:
-                return True
+        return any(
+            keyword in relative_path
+            for keyword in self.config.PDF_PROCESSING["ocr_path_keywords"]
+        )
 
+    def _ocr_by_text(self, file_path: str) -> bool:
+        """OCR is needed if the first pages have little or suspicious text."""
         try:
             with open(file_path, "rb") as f:
                 reader = PdfReader(f)
@@ -38,8 +56,188 @@ class DocumentParser:
 
         return False
 
-    def parse_document(self, file_path: str) -> str:
-        """Parse document content with automatic OCR detection for PDFs."""
+    def _ocr_check_key(self) -> str:
+        """Settings the text-based OCR decision depends on"""
+        settings = [
+            self.config.PDF_MAX_PAGES_CHECK,
+            self.config.PDF_MIN_TEXT_LENGTH,
+            self.config.PDF_PROCESSING["ocr_keywords"],
+        ]
+        return "ocr_check:" + hashlib.sha256(
+            json.dumps(settings, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def _pdf_strategy(self, file_path: str, file_hash: Optional[str] = None) -> str:
+        """Select unstructured strategy for PDF (OCR or plain text extraction).
+
+        The text-based check reads the first pages with PdfReader, its result
+        is stored in the parsed text cache under the file hash.
+        """
+        if self._ocr_by_path(file_path):
+            needs_ocr = True
+        elif not self.text_cache or not file_hash:
+            needs_ocr = self._ocr_by_text(file_path)
+        else:
+            key = self._ocr_check_key()
+            cached = self.text_cache.get_value(file_hash, key)
+            if cached in ("0", "1"):
+                needs_ocr = cached == "1"
+            else:
+                needs_ocr = self._ocr_by_text(file_path)
+                self.text_cache.put_value(file_hash, key, "1" if needs_ocr else "0")
+        if needs_ocr:
+            return self.config.PDF_PROCESSING["ocr_strategy"]
+        return self.config.PDF_PROCESSING["default_strategy"]
+
+    def _cache_strategy(self, file_path: str, pdf_strategy: Optional[str]) -> str:
+        """Describe how the text is extracted, part of the parsed text cache key."""
+        extension = os.path.splitext(file_path)[1].lower()
+        if pdf_strategy:
+            languages = "+".join(self.config.PDF_PROCESSING["ocr_languages"])
+            return f"{extension}:{pdf_strategy}:{languages}"
+        return extension
+
+    @staticmethod
+    def _file_digest(file_path: str) -> str:
+        hasher = hashlib.sha256()
+        with stage("hash", os.path.getsize(file_path), 1):
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def iter_pdf_pages(
+        self, file_path: str, file_hash: Optional[str] = None
+    ) -> Iterator[str]:
+        """Yield PDF text page by page with bounded memory.
+
+        Pages are partitioned in windows of PDF_STREAM_PAGE_WINDOW pages, each
+        window is written to a temporary PDF, so only one window of elements is
+        kept in memory at a time. The page limit PDF_MAX_PAGES_PROCESS does not apply.
+        Parsed pages are streamed into the parsed text cache as well.
+        """
+        if not self.text_cache:
+            yield from self._iter_pdf_pages(file_path, self._pdf_strategy(file_path))
+            return
+
+        file_hash = file_hash or self._file_digest(file_path)
+        strategy = self._pdf_strategy(file_path, file_hash)
+        cache_strategy = self._cache_strategy(file_path, strategy)
+        cached_pages = self.text_cache.iter_pages(file_hash, cache_strategy)
+        if cached_pages is not None:
+            print("  Текст документа взят из кэша разбора")
+            yield from cached_pages
+            return
+
+        writer = self.text_cache.page_writer(file_hash, cache_strategy)
+        try:
+            for page in self._iter_pdf_pages(file_path, strategy):
+                writer.write(page)
+                yield page
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+
+    def _iter_pdf_pages(self, file_path: str, strategy: str) -> Iterator[str]:
+        if strategy == self.config.PDF_PROCESSING["ocr_strategy"]:
+            print(f"  Применение OCR к: {os.path.basename(file_path)}")
+        window = self.config.PDF_STREAM_PAGE_WINDOW
+
+        reader = PdfReader(file_path)
+        total_pages = len(reader.pages)
+        for start in range(0, total_pages, window):
+            end = min(start + window, total_pages)
+            pages = self._partition_pdf_window(reader, start, end, strategy)
+            for page_number in range(1, end - start + 1):
+                yield "\n\n".join(pages.get(page_number, []))
+
+    def _partition_pdf_window(
+        self, reader: PdfReader, start: int, end: int, strategy: str
+    ) -> Dict[int, List[str]]:
+        """Partition pages [start, end) and group element texts by page number."""
+        writer = PdfWriter()
+        for page in reader.pages[start:end]:
+            writer.add_page(page)
+
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            writer.write(tmp)
+            tmp_path = tmp.name
+
+        try:
+            with stage(
+                self._partition_stage(strategy), os.path.getsize(tmp_path), end - start
+            ):
+                try:
+                    elements = partition(
+                        filename=tmp_path,
+                        strategy=strategy,
+                        languages=self.config.PDF_PROCESSING["ocr_languages"],
+                        pdf_infer_table_structure=True,
+                        use_gpu=False,
+                    )
+                except Exception as e:
+                    print(f"  Ошибка обработки страниц {start + 1}-{end}: {str(e)}")
+                    print("  Повторная попытка с альтернативными параметрами...")
+                    try:
+                        elements = partition(
+                            filename=tmp_path,
+                            strategy="hi_res",
+                            languages=["rus", "eng"],
+                            pdf_infer_table_structure=False,
+                            use_gpu=False,
+                        )
+                    except Exception as e2:
+                        print(f"  Страницы {start + 1}-{end} пропущены: {str(e2)}")
+                        return {}
+        finally:
+            os.remove(tmp_path)
+
+        pages: Dict[int, List[str]] = {}
+        for e in elements:
+            if e.text and e.text.strip():
+                page_number = getattr(e.metadata, "page_number", None) or 1
+                pages.setdefault(page_number, []).append(e.text)
+        return pages
+
+    def parse_document(self, file_path: str, file_hash: Optional[str] = None) -> str:
+        """Parse document content with automatic OCR detection for PDFs.
+
+        Results are served from the parsed text cache when the file content,
+        parser version and extraction strategy are unchanged; the OCR decision
+        for PDFs is cached under the file hash as well.
+        """
+        is_pdf = file_path.lower().endswith(".pdf")
+        if not self.text_cache:
+            pdf_strategy = self._pdf_strategy(file_path) if is_pdf else None
+            return self._parse_document(file_path, pdf_strategy)
+
+        file_hash = file_hash or self._file_digest(file_path)
+        pdf_strategy = self._pdf_strategy(file_path, file_hash) if is_pdf else None
+        cache_strategy = self._cache_strategy(file_path, pdf_strategy)
+        cached = self.text_cache.get_text(file_hash, cache_strategy)
+        if cached is not None:
+            print("  Текст документа взят из кэша разбора")
+            return cached
+
+        content = self._parse_document(file_path, pdf_strategy)
+        if isinstance(content, str) and content.strip():
+            self.text_cache.put_text(file_hash, cache_strategy, content)
+        return content
+
+    def _partition_stage(self, strategy: Optional[str]) -> str:
+        """Name of the instrumentation stage for the extraction strategy"""
+        if strategy == self.config.PDF_PROCESSING["ocr_strategy"]:
+            return "ocr"
+        return "partition"
+
+    def _parse_document(self, file_path: str, pdf_strategy: Optional[str]) -> str:
+        with stage(
+            self._partition_stage(pdf_strategy), os.path.getsize(file_path), 1
+        ):
+            return self._extract_text(file_path, pdf_strategy)
+
+    def _extract_text(self, file_path: str, pdf_strategy: Optional[str]) -> str:
         if file_path.lower().endswith(".rtf"):
             try:
                 with open(file_path, "r", encoding="utf-8") as f:
@@ -50,13 +248,8 @@ class DocumentParser:
 
         elif file_path.lower().endswith(".pdf"):
             try:
-                strategy = (
-                    self.config.PDF_PROCESSING["ocr_strategy"]
-                    if self.needs_ocr(file_path)
-                    else self.config.PDF_PROCESSING["default_strategy"]
-                )
-
-                if self.needs_ocr(file_path):
+                strategy = pdf_strategy
+                if strategy == self.config.PDF_PROCESSING["ocr_strategy"]:
                     print(f"  Применение OCR к: {os.path.basename(file_path)}")
 
                 elements = partition(
@@ -99,7 +292,9 @@ class DocumentParser:
         elif file_path.lower().endswith(".json"):
             with open(file_path, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            splitter = JsonTextSplitter()
-            return splitter.split_json(data)
+            splitter = JsonTextSplitter(
+                self.config.DOCUMENT_TYPE_CONFIG["json"]["chunk_size"]
+            )
+            return splitter.to_text(data)
 
         raise ValueError(f"Unsupported file format: {file_path}")
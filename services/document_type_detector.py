@@ -1,10 +1,14 @@
-from typing import Literal, Tuple
+from typing import List, Literal, Optional, Pattern, Tuple
 import os
 import re
 from config import Config
 
 DocumentType = Literal["legal", "qa", "default"]
 
+# Обратные ссылки, именованные группы и глобальные флаги меняют смысл
+# шаблона внутри общего выражения: такие шаблоны проверяются отдельно
+_STANDALONE_PATTERN = re.compile(r"\\[1-9]|\(\?P?<(?![=!])|\(\?P=|\(\?[aiLmsux]+\)")
+
 
 class DocumentTypeDetector:
     def __init__(self, config: Config):
@@ -19,6 +23,67 @@ class DocumentTypeDetector:
             for doc_type, cfg in config.DOCUMENT_TYPE_CONFIG.items()
             for prefix in cfg.get("filename_prefixes", [])
         }
+        (
+            self.content_rules,
+            self.content_regex,
+            self.standalone_rules,
+        ) = self._compile_content_rules()
+
+    def _compile_content_rules(
+        self,
+    ) -> Tuple[
+        List[Tuple[DocumentType, str]], Optional[Pattern], List[Tuple[int, Pattern]]
+    ]:
+        """Compile keywords and patterns of all types into one regex.
+
+        Every rule is a zero-width lookahead, alternatives are ordered by
+        priority (type order, keywords before patterns). At each position the
+        first matching alternative is the highest-priority rule there, so one
+        scan finds the same rule as checking the rules one by one. Patterns
+        with backreferences, named groups or inline global flags cannot be
+        merged and are returned separately as (rule index, regex).
+        """
+        rules: List[Tuple[DocumentType, str]] = []
+        alternatives = []
+        standalone: List[Tuple[int, Pattern]] = []
+        first_chars: Optional[set] = set()
+        for doc_type, type_config in self.config.DOCUMENT_TYPE_CONFIG.items():
+            for keyword in type_config.get("content_keywords", []):
+                if not keyword:
+                    continue
+                rules.append((doc_type, f"по ключевому слову '{keyword}'"))
+                alternatives.append((len(rules) - 1, re.escape(keyword.lower())))
+                if first_chars is not None:
+                    first_chars.add(keyword.lower()[0])
+            for pattern in type_config.get("content_patterns", []):
+                rules.append((doc_type, f"по шаблону '{pattern}'"))
+                if _STANDALONE_PATTERN.search(pattern):
+                    standalone.append(
+                        (len(rules) - 1, re.compile(pattern, re.IGNORECASE))
+                    )
+                    continue
+                alternatives.append((len(rules) - 1, pattern))
+                # Шаблон из одной ветви, начинающийся с обычного символа без
+                # квантификатора (у шаблона с "|" первых символов несколько)
+                if (
+                    first_chars is not None
+                    and "|" not in pattern
+                    and re.match(r"\w(?![*?+{])", pattern)
+                ):
+                    first_chars.add(pattern[0])
+                else:
+                    first_chars = None
+
+        if not alternatives:
+            return rules, None, standalone
+        combined = "|".join(
+            f"(?=(?P<r{i}>(?:{alternative})))" for i, alternative in alternatives
+        )
+        if first_chars:
+            # Позиции, с которых не начинается ни одно правило, отсекаются сразу
+            char_class = "".join(re.escape(char) for char in sorted(first_chars))
+            combined = f"(?=[{char_class}])(?:{combined})"
+        return rules, re.compile(combined, re.IGNORECASE), standalone
 
     def detect(self, file_path: str, content: str = "") -> Tuple[DocumentType, str]:
         relative_path = os.path.relpath(file_path, start=self.config.INPUT_DIR)
@@ -35,14 +100,24 @@ class DocumentTypeDetector:
             if filename.startswith(prefix):
                 return doc_type, f"по префиксу '{prefix}'"
 
-        # 3. Content analysis
-        content_lower = content.lower()
-        for doc_type, type_config in self.config.DOCUMENT_TYPE_CONFIG.items():
-            for keyword in type_config.get("content_keywords", []):
-                if keyword.lower() in content_lower:
-                    return doc_type, f"по ключевому слову '{keyword}'"
-            for pattern in type_config.get("content_patterns", []):
-                if re.search(pattern, content, re.IGNORECASE):
-                    return doc_type, f"по шаблону '{pattern}'"
+        # 3. Content analysis: one pass over a bounded prefix of the text
+        if content and (self.content_regex is not None or self.standalone_rules):
+            window = self.config.DETECTION_WINDOW_CHARS or len(content)
+            best = None
+            if self.content_regex is not None:
+                for match in self.content_regex.finditer(content, 0, window):
+                    rule = int(match.lastgroup[1:])
+                    if best is None or rule < best:
+                        best = rule
+                        if best == 0:
+                            break
+            for rule, regex in self.standalone_rules:
+                if best is not None and rule > best:
+                    break
+                if regex.search(content, 0, window):
+                    best = rule
+                    break
+            if best is not None:
+                return self.content_rules[best]
 
         return "default", "автоматически (не удалось определить)"
@@ -1,26 +1,62 @@
-from typing import Dict, Literal
+import hashlib
+import re
+from typing import Dict, List, Literal
+import numpy as np
 from config import Config
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
 from utils import gpu_utils
 
 DocumentType = Literal["legal", "qa", "default"]
 
+_TOKEN = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Детерминированные эмбеддинги без модели (для бенчмарков и офлайн-запуска).
+
+    Слова и пары соседних слов хэшируются в вектор фиксированной размерности,
+    вектор нормируется. Похожие тексты получают близкие векторы, загрузка
+    модели и сеть не нужны.
+    """
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+        self.model_kwargs = {"device": "cpu"}
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        tokens = _TOKEN.findall(text.lower())
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimension] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
 
 class EmbeddingService:
     def __init__(self, config: Config):
         self.config = config
-        self._models = {}  # Для ленивой загрузки моделей
+        self._models: Dict[str, Embeddings] = {}  # Для ленивой загрузки моделей
 
-    def get_embeddings(
-        self, doc_type: DocumentType = "default"
-    ) -> HuggingFaceEmbeddings:
+    def get_embeddings(self, doc_type: DocumentType = "default") -> Embeddings:
         """Возвращает модель эмбеддингов для указанного типа документа"""
         if doc_type not in self._models:
             self._models[doc_type] = self._load_model(doc_type)
         return self._models[doc_type]
 
-    def _load_model(self, doc_type: DocumentType = "default") -> HuggingFaceEmbeddings:
+    def _load_model(self, doc_type: DocumentType = "default") -> Embeddings:
         """Загружает модель эмбеддингов с проверкой доступности GPU"""
+        if self.config.EMBEDDING_BACKEND == "hashing":
+            return HashingEmbeddings(self.config.HASHING_EMBEDDING_DIM)
+
         # Определяем имя модели для типа документа
         model_name = self.config.EMBEDDING_MODEL
         if doc_type in self.config.DOCUMENT_TYPE_CONFIG:
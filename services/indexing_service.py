@@ -1,16 +1,172 @@
 import os
 import json
-import gc
+import itertools
+import time
 import uuid
+from dataclasses import asdict, dataclass
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from langchain_core.documents import Document
 from managers.vector_db_manager import VectorDatabase
 from managers.embedding_manager import EmbeddingManager
 from utils import chunk_utils
+from utils.boilerplate import strip_artifacts
+from utils.indexing_metrics import IndexingMetrics, current_metrics, stage
+from utils.memory_profiler import MemoryProfiler
 from config import config
 
 
+@dataclass
+class IndexingStats:
+    """Итоги индексации (вместо списков документов)"""
+
+    files: int = 0
+    skipped: int = 0
+    failed: int = 0
+    chunks_added: int = 0
+    chunks_removed: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    report_path: Optional[str] = None
+
+    def add(self, result: Dict) -> None:
+        """Учитывает результат обработки одного файла"""
+        if result["status"] == "skipped":
+            self.skipped += 1
+            return
+        self.files += 1
+        if result["status"] == "failed":
+            self.failed += 1
+        self.chunks_added += result["chunks_added"]
+        self.chunks_removed += result["chunks_removed"]
+        self.bytes += result["bytes"]
+
+
+def write_chunks(
+    vector_db: VectorDatabase,
+    file_path: str,
+    chunks: Iterable[Document],
+    ingest_id: str,
+    batch_size: int = config.INDEX_WRITE_BATCH_SIZE,
+) -> Tuple[int, List[str]]:
+    """Write chunks of the file with content-hash deduplication.
+
+    Each distinct chunk text of a document type and chunking configuration is
+    embedded and stored once under its content hash, every occurrence is
+    recorded in the index catalog as a reference of the file. Reused chunks
+    of the same file get the metadata of the new version. Returns number of
+    chunks of the file and their ids.
+    """
+    if not vector_db.db:
+        vector_db.load_or_create()
+
+    chunks = iter(chunks)
+    ids: List[str] = []
+    stored = 0
+    while True:
+        batch = list(itertools.islice(chunks, batch_size))
+        if not batch:
+            break
+
+        refs = []
+        unique: Dict[str, Document] = {}
+        for chunk in batch:
+            chunk_hash = chunk_utils.content_hash(
+                chunk.page_content,
+                chunk.metadata.get("document_type"),
+                chunk.metadata.get("config_fingerprint"),
+            )
+            chunk.metadata["content_hash"] = chunk_hash
+            refs.append((chunk_hash, len(ids)))
+            ids.append(chunk_hash)
+            unique.setdefault(chunk_hash, chunk)
+
+        with stage("chroma_lookup", rows=len(unique)):
+            existing = vector_db.get_existing_metadata(list(unique))
+        new_chunks = [(h, c) for h, c in unique.items() if h not in existing]
+        if new_chunks:
+            text_size = sum(len(chunk.page_content) for _, chunk in new_chunks)
+            try:
+                # Эмбеддинг и запись выполняются одним вызовом Chroma.add_texts
+                with stage("embed", text_size, len(new_chunks)):
+                    vector_db.add_chunks(
+                        [chunk_hash for chunk_hash, _ in new_chunks],
+                        [chunk for _, chunk in new_chunks],
+                    )
+            except Exception as e:
+                print(f"❌ Failed to add texts to ChromaDB: {str(e)}")
+                raise
+        stored += len(new_chunks)
+        _refresh_reused_chunks(vector_db, file_path, unique, existing)
+
+        if vector_db.catalog:
+            vector_db.catalog.add_refs(
+                vector_db.collection_name, file_path, ingest_id, refs
+            )
+
+    if stored < len(ids):
+        print(f"  Повторяющихся чанков: {len(ids) - stored} (векторы переиспользованы)")
+    return len(ids), ids
+
+
+def _refresh_reused_chunks(
+    vector_db: VectorDatabase,
+    file_path: str,
+    chunks: Dict[str, Document],
+    existing: Dict[str, Dict],
+) -> None:
+    """Metadata of the new file version for reused chunks owned by the file.
+
+    Chunks owned by other files keep their metadata. ingest_id stays that of
+    the ingestion which stored the vector: rolling back the new version must
+    not delete chunks still referenced by the previous one.
+    """
+    update_ids, update_metadatas = [], []
+    for chunk_id, stored in existing.items():
+        owner = stored.get("catalog_path") or stored.get("file_path", "")
+        if owner.split("#")[0] != file_path:
+            continue
+        metadata = dict(chunks[chunk_id].metadata)
+        if "ingest_id" in stored:
+            metadata["ingest_id"] = stored["ingest_id"]
+        if metadata != stored:
+            update_ids.append(chunk_id)
+            update_metadatas.append(metadata)
+    vector_db.update_chunk_metadata(update_ids, update_metadatas)
+
+
+def release_previous_version(
+    vector_db: VectorDatabase, file_path: str, keep_ingest_id: Optional[str] = None
+) -> int:
+    """Release chunks of the file except those written by keep_ingest_id.
+
+    Chunks still referenced by other files are kept. Returns number of
+    released chunks.
+    """
+    released = 0
+    if vector_db.catalog:
+        orphaned, owners = vector_db.catalog.release_file_refs(
+            vector_db.collection_name, file_path, keep_ingest_id
+        )
+        vector_db.release_chunks(orphaned, owners, file_path)
+        released += len(orphaned) + sum(
+            1 for owner in owners.values() if owner != file_path
+        )
+
+    # Чанки, записанные до дедупликации, удаляются по метаданным
+    items = vector_db.db.get(
+        where={"$or": [{"file_path": file_path}, {"catalog_path": file_path}]},
+        include=["metadatas"],
+    )
+    legacy_ids = [
+        chunk_id
+        for chunk_id, metadata in zip(items.get("ids", []), items.get("metadatas", []))
+        if isinstance(metadata, dict) and not metadata.get("content_hash")
+    ]
+    vector_db.delete_documents(legacy_ids)
+    return released + len(legacy_ids)
+
+
 def update_document_in_chroma(
     vector_db: VectorDatabase,
     file_path: str,
@@ -18,9 +174,12 @@ def update_document_in_chroma(
     metadata: dict,
     current_file_hash: str,
     current_last_modified: float,
-    stored_doc_id: Optional[str] = None,
 ) -> Tuple[List[Document], List[str]]:
-    """Update document in ChromaDB."""
+    """Update document in ChromaDB.
+
+    New chunks are written under metadata["ingest_id"], the previous version
+    of the file is released by the caller after the write succeeded.
+    """
     metadata.update(
         {
             "file_hash_full": current_file_hash,
@@ -29,94 +188,112 @@ def update_document_in_chroma(
         }
     )
 
-    new_chunks = vector_db.embedding_manager.process_document(file_path)
+    new_chunks = vector_db.embedding_manager.create_document_chunks(
+        full_text_content, metadata
+    )
     if not new_chunks:
         print(f"⚠️ No chunks generated for {file_path}")
         return [], []
 
-    texts = [chunk.page_content for chunk in new_chunks]
-    metadatas = [chunk.metadata for chunk in new_chunks]
-    ids = [str(uuid.uuid4()) for _ in new_chunks]
+    _, ids = write_chunks(
+        vector_db,
+        file_path,
+        new_chunks,
+        metadata["ingest_id"],
+        config.CHROMA_BATCH_SIZE,
+    )
+    print(f"✅ Added {len(ids)} chunks from {os.path.basename(file_path)}")
+    return new_chunks, ids
 
-    if stored_doc_id:
-        vector_db.delete_documents([stored_doc_id])
 
-    try:
-        if not vector_db.db:
-            vector_db.load_or_create()
+def stream_document_to_chroma(
+    vector_db: VectorDatabase,
+    file_path: str,
+    pages: Iterable[str],
+    metadata: dict,
+    current_file_hash: str,
+    current_last_modified: float,
+) -> int:
+    """Chunk a stream of pages and write it to ChromaDB in bounded batches.
 
-        vector_db.db.add_texts(texts=texts, metadatas=metadatas, ids=ids)
-        print(f"✅ Added {len(ids)} chunks from {os.path.basename(file_path)}")
-        return new_chunks, ids
-    except Exception as e:
-        print(f"❌ Failed to add texts to ChromaDB: {str(e)}")
-        raise
+    Only INDEX_WRITE_BATCH_SIZE chunks are embedded and kept in memory at a
+    time. Returns number of written chunks.
+    """
+    metadata.update(
+        {
+            "file_hash_full": current_file_hash,
+            "last_modified": current_last_modified,
+            "processing_time": datetime.now().isoformat(),
+        }
+    )
+    chunks = vector_db.embedding_manager.iter_document_chunks(pages, metadata)
+    written, _ = write_chunks(vector_db, file_path, chunks, metadata["ingest_id"])
+
+    if written:
+        print(f"✅ Added {written} chunks from {os.path.basename(file_path)}")
+    else:
+        print(f"⚠️ No chunks generated for {file_path}")
+    return written
 
 
 def process_catalog_data(
-    file_path: str, vector_db: VectorDatabase
-) -> Tuple[List[Document], int]:
-    """Process JSON catalog data"""
-    documents = []
-    added_count = 0
+    file_path: str,
+    vector_db: VectorDatabase,
+    ingest_id: Optional[str] = None,
+) -> int:
+    """Process JSON catalog data, returns number of written chunks.
+
+    Whether the catalog changed is decided by the caller (index_file), chunks
+    are written without keeping documents in memory.
+    """
     base_filename = os.path.basename(file_path)
     print(f"\nОбработка каталога: {base_filename}")
 
     try:
-        file_hash = vector_db.embedding_manager.get_file_hash(file_path)
-        last_modified = os.path.getmtime(file_path)
-        file_unchanged = False
-
-        existing_docs = vector_db.get_documents_by_hash(file_hash)
-        if (
-            existing_docs
-            and existing_docs.get("metadatas")
-            and len(existing_docs["metadatas"]) > 0
-        ):
-            first_meta = existing_docs["metadatas"][0]
-            if (
-                isinstance(first_meta, dict)
-                and first_meta.get("file_hash_full") == file_hash
-                and abs(float(first_meta.get("last_modified", 0)) - last_modified)
-                < config.MTIME_TOLERANCE_SECONDS
-            ):
-                file_unchanged = True
-                documents.extend(
-                    [
-                        Document(
-                            page_content=existing_docs["documents"][i],
-                            metadata=existing_docs["metadatas"][i],
-                        )
-                        for i in range(len(existing_docs["ids"]))
-                    ]
-                )
-                print("  Каталог не изменился, используется существующая индексация")
-                return documents, 0
-
-        if not file_unchanged:
-            vector_db.delete_cached_entries_by_source(base_filename)
-            print("  Обновление каталога...")
+        vector_db.delete_cached_entries_by_source(base_filename)
+        print("  Обновление каталога...")
+        with stage("split", os.path.getsize(file_path)) as timer:
             chunks = chunk_utils.process_json_file(file_path)
+            timer.rows = len(chunks)
+        if not vector_db.db:
+            vector_db.load_or_create()
 
-            for chunk in chunks:
-                item_path = chunk.metadata["file_path"]
-                if vector_db.db:
-                    vector_db.db.delete(where={"file_path": item_path})
-                if vector_db.db:
-                    vector_db.db.add_texts(
-                        texts=[chunk.page_content],
-                        metadatas=[chunk.metadata],
-                        ids=[str(uuid.uuid4())],
-                    )
-                    added_count += 1
-                documents.append(chunk)
-            print(f"✅ Добавлено чанков: {len(chunks)}")
-        return documents, added_count
+        # Элементы каталога, записанные до появления catalog_path,
+        # удаляются только после записи новых
+        item_count = max(
+            (chunk.metadata["item_end"] + 1 for chunk in chunks), default=0
+        )
+        item_paths = [f"{file_path}#{i}" for i in range(item_count)]
+        legacy_ids = []
+        if item_paths:
+            legacy = vector_db.db.get(
+                where={"file_path": {"$in": item_paths}}, include=["metadatas"]
+            )
+            legacy_ids = [
+                chunk_id
+                for chunk_id, metadata in zip(
+                    legacy.get("ids", []), legacy.get("metadatas", [])
+                )
+                if isinstance(metadata, dict) and not metadata.get("catalog_path")
+            ]
+
+        ingest_id = ingest_id or str(uuid.uuid4())
+        fingerprint = vector_db.embedding_manager.get_config_fingerprint("catalog")
+        for chunk in chunks:
+            chunk.metadata["catalog_path"] = file_path
+            chunk.metadata["config_fingerprint"] = fingerprint
+            chunk.metadata["ingest_id"] = ingest_id
+
+        added_count, _ = write_chunks(
+            vector_db, file_path, chunks, ingest_id, config.CHROMA_BATCH_SIZE
+        )
+
+        vector_db.delete_documents(legacy_ids)
+        print(f"✅ Добавлено чанков: {len(chunks)}")
+        return added_count
     except Exception as e:
         print(f"Ошибка обработки каталога {file_path}: {e}")
-        return [], 0
-    finally:
-        gc.collect()
+        raise
 
 
 def get_all_metadata(
@@ -126,130 +303,441 @@ def get_all_metadata(
     return vector_db.get_all_metadata(batch_size)
 
 
-def parse_files(directory: str, vector_db: VectorDatabase) -> List[Document]:
-    """Parse files from directory and index them in ChromaDB."""
-    documents = []
-    print("\n=== Начало индексации документов ===")
-    total_files = 0
-    total_chunks = 0
-
-    existing_files_meta = {}
-    if vector_db.db and hasattr(vector_db.db, "_collection"):
-        for meta in get_all_metadata(vector_db, config.CHROMA_BATCH_SIZE):
-            if isinstance(meta, dict) and "file_path" in meta:
-                rel_path = (
-                    os.path.relpath(meta["file_path"], directory)
-                    .replace("\\", "/")
-                    .lower()
-                )
-                existing_files_meta[rel_path] = meta
+def get_indexed_state(vector_db: VectorDatabase, file_path: str) -> Optional[dict]:
+    """Return committed state of the file (catalog first, then chunk metadata)."""
+    if vector_db.catalog:
+        state = vector_db.catalog.get_file(file_path)
+        if state:
+            return state
+    return vector_db.get_file_metadata(file_path)
 
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            file_path = os.path.normpath(os.path.join(root, filename))
-            rel_path = os.path.relpath(file_path, directory).replace("\\", "/").lower()
-            total_files += 1
-            print(f"\n[{total_files}] Обработка файла: {rel_path}")
 
-            if not filename.lower().endswith(config.SUPPORTED_EXTENSIONS):
-                print("  Пропуск: неподдерживаемый формат")
-                continue
+def index_file(
+    vector_db: VectorDatabase,
+    file_path: str,
+    ingest_id: Optional[str] = None,
+    job_id: Optional[str] = None,
+    force: bool = False,
+) -> int:
+    """Index a single file in ChromaDB, returns number of added chunks.
+
+    New chunks are tagged with ingest_id, the previous version of the file is
+    swapped out only after they are written, then the file is committed.
+    If indexing fails, the chunks already written are rolled back and the
+    error is re-raised; the previous version of the file stays in the index.
+    """
+    added, _ = _index_file_or_rollback(
+        vector_db, file_path, ingest_id or str(uuid.uuid4()), job_id, force
+    )
+    return added
 
-            try:
-                current_hash = vector_db.embedding_manager.get_file_hash(file_path)
-                current_mtime = float(os.path.getmtime(file_path))
-                needs_reindex = True
-
-                if rel_path in existing_files_meta:
-                    existing_meta = existing_files_meta[rel_path]
-                    if (
-                        existing_meta.get("file_hash") == current_hash
-                        and abs(
-                            float(existing_meta.get("last_modified", 0)) - current_mtime
-                        )
-                        < config.MTIME_TOLERANCE_SECONDS
-                    ):
-                        needs_reindex = False
-                        print(
-                            "  Файл не изменился, используется существующая индексация"
-                        )
-                        continue
-
-                if needs_reindex:
-                    print("  Обновление индексации файла...")
-
-                    if filename.lower().endswith(".json"):
-                        try:
-                            with open(file_path, "r", encoding="utf-8") as f:
-                                data = json.load(f)
-                            if isinstance(data, list) and all(
-                                isinstance(i, dict) for i in data
-                            ):
-                                print("  Обнаружен JSON-каталог, специальная обработка")
-                                chunks, added_chunks = process_catalog_data(
-                                    file_path, vector_db
-                                )
-                                total_chunks += added_chunks
-                                continue
-                        except Exception as e:
-                            print(f"  Ошибка при проверке JSON: {e}")
-
-                    content = vector_db.embedding_manager.parse_document(file_path)
-                    doc_type, detection_reason = (
-                        vector_db.embedding_manager.type_detector.detect(
-                            file_path, content
-                        )
-                    )
-                    metadata = chunk_utils.generate_metadata(
-                        file_path, doc_type, current_hash, current_mtime
-                    )
-                    metadata["detection_reason"] = detection_reason
-
-                    if rel_path in existing_files_meta:
-                        vector_db.db.delete(where={"file_path": file_path})
-
-                    chunks, ids = update_document_in_chroma(
-                        vector_db,
-                        file_path,
-                        content,
-                        metadata,
-                        current_hash,
-                        current_mtime,
-                    )
 
-                    chunk_count = len(chunks)
-                    total_chunks += chunk_count
-                    print(
-                        f"  Добавлено чанков: {chunk_count} (тип: {doc_type}, причина: {detection_reason})"
-                    )
+def _index_file_or_rollback(
+    vector_db: VectorDatabase,
+    file_path: str,
+    ingest_id: str,
+    job_id: Optional[str],
+    force: bool,
+) -> Tuple[int, int]:
+    """_index_file under the write lock with rollback of a failed ingestion"""
+    with vector_db.write_lock:
+        try:
+            added, removed = _index_file(
+                vector_db, file_path, ingest_id, job_id, force
+            )
+        except Exception:
+            # Чанки и ссылки частично записанной версии удаляются
+            vector_db.delete_by_ingest_id(ingest_id)
+            raise
+        if added or removed:
+            vector_db.bump_index_generation()
+        return added, removed
+
+
+def _index_file(
+    vector_db: VectorDatabase,
+    file_path: str,
+    ingest_id: Optional[str],
+    job_id: Optional[str],
+    force: bool,
+) -> Tuple[int, int]:
+    """Returns numbers of added chunks and chunks of the released version"""
+    embedding_manager = vector_db.embedding_manager
+    filename = os.path.basename(file_path)
+    current_hash = embedding_manager.get_file_hash(file_path)
+    current_mtime = float(os.path.getmtime(file_path))
+    existing_state = get_indexed_state(vector_db, file_path)
+
+    if (
+        not force
+        and existing_state
+        and existing_state.get("file_hash") == current_hash
+        and abs(float(existing_state.get("last_modified", 0)) - current_mtime)
+        < config.MTIME_TOLERANCE_SECONDS
+    ):
+        print("  Файл не изменился, используется существующая индексация")
+        if vector_db.catalog and vector_db.commit_files:
+            vector_db.catalog.commit_file(
+                file_path,
+                current_hash,
+                float(existing_state.get("last_modified", current_mtime)),
+                existing_state.get("ingest_id") or "legacy",
+                existing_state.get("chunk_count")
+                or len(vector_db.get_file_chunk_ids(file_path)),
+                job_id,
+                existing_state.get("doc_type") or existing_state.get("document_type"),
+                existing_state.get("fingerprint")
+                or existing_state.get("config_fingerprint"),
+            )
+        return 0, 0
+
+    print("  Обновление индексации файла...")
+    ingest_id = ingest_id or str(uuid.uuid4())
+    chunk_count = None
+    doc_type = None
+    data = None
+
+    if filename.lower().endswith(".json"):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            is_catalog = isinstance(data, list) and all(
+                isinstance(i, dict) for i in data
+            )
+        except Exception as e:
+            print(f"  Ошибка при проверке JSON: {e}")
+            is_catalog = False
+
+        if is_catalog:
+            print("  Обнаружен JSON-каталог, специальная обработка")
+            doc_type = "catalog"
+            chunk_count = process_catalog_data(file_path, vector_db, ingest_id)
+        elif data is not None:
+            # Прочие JSON разбиваются структурно: элементы с путями полей
+            doc_type = "json"
+            metadata = chunk_utils.generate_metadata(
+                file_path, doc_type, current_hash, current_mtime
+            )
+            metadata.update(
+                {
+                    "detection_reason": "структура JSON",
+                    "ingest_id": ingest_id,
+                    "config_fingerprint": embedding_manager.get_config_fingerprint(
+                        doc_type
+                    ),
+                    "file_hash_full": current_hash,
+                    "processing_time": datetime.now().isoformat(),
+                }
+            )
+            with stage("split", os.path.getsize(file_path)) as timer:
+                chunks = embedding_manager.json_splitter.split_json(data, metadata)
+                timer.rows = len(chunks)
+            write_chunks(
+                vector_db, file_path, chunks, ingest_id, config.CHROMA_BATCH_SIZE
+            )
+            chunk_count = len(chunks)
+            print(f"  Добавлено чанков: {chunk_count} (тип: {doc_type})")
+
+    if chunk_count is None and config.PDF_STREAMING and filename.lower().endswith(
+        ".pdf"
+    ):
+        pages = embedding_manager.document_parser.iter_pdf_pages(
+            file_path, current_hash
+        )
+        if config.BOILERPLATE_FILTER_ENABLED:
+            pages = embedding_manager.boilerplate_filter.clean_pages(pages)
+        # Тип документа определяется по первым страницам
+        head_pages: List[str] = []
+        head_length = 0
+        for page in pages:
+            head_pages.append(page)
+            head_length += len(page)
+            if head_length >= config.STREAM_DETECTION_CHARS:
+                break
+        doc_type, detection_reason = embedding_manager.type_detector.detect(
+            file_path, "\n\n".join(head_pages)
+        )
+        metadata = chunk_utils.generate_metadata(
+            file_path, doc_type, current_hash, current_mtime
+        )
+        metadata["detection_reason"] = detection_reason
+        metadata["ingest_id"] = ingest_id
+        metadata["config_fingerprint"] = embedding_manager.get_config_fingerprint(
+            doc_type
+        )
+
+        chunk_count = stream_document_to_chroma(
+            vector_db,
+            file_path,
+            itertools.chain(head_pages, pages),
+            metadata,
+            current_hash,
+            current_mtime,
+        )
+        print(
+            f"  Добавлено чанков: {chunk_count} (тип: {doc_type}, причина: {detection_reason})"
+        )
+
+    if chunk_count is None:
+        content = embedding_manager.parse_document(file_path, current_hash)
+        if config.BOILERPLATE_FILTER_ENABLED:
+            content = strip_artifacts(content)
+        doc_type, detection_reason = embedding_manager.type_detector.detect(
+            file_path, content
+        )
+        metadata = chunk_utils.generate_metadata(
+            file_path, doc_type, current_hash, current_mtime
+        )
+        metadata["detection_reason"] = detection_reason
+        metadata["ingest_id"] = ingest_id
+        metadata["config_fingerprint"] = embedding_manager.get_config_fingerprint(
+            doc_type
+        )
+
+        chunks, ids = update_document_in_chroma(
+            vector_db,
+            file_path,
+            content,
+            metadata,
+            current_hash,
+            current_mtime,
+        )
+        chunk_count = len(chunks)
+        print(
+            f"  Добавлено чанков: {chunk_count} (тип: {doc_type}, причина: {detection_reason})"
+        )
+
+    # Предыдущая версия файла освобождается только после записи новой
+    removed = release_previous_version(vector_db, file_path, ingest_id)
+
+    if vector_db.catalog and vector_db.commit_files:
+        vector_db.catalog.commit_file(
+            file_path,
+            current_hash,
+            current_mtime,
+            ingest_id,
+            chunk_count,
+            job_id,
+            doc_type,
+            embedding_manager.get_config_fingerprint(doc_type),
+        )
+    return chunk_count, removed
+
+
+def remove_file_from_chroma(vector_db: VectorDatabase, file_path: str) -> int:
+    """Remove all chunks of a file (including catalog items) from ChromaDB."""
+    with vector_db.write_lock:
+        removed = _remove_file_from_chroma(vector_db, file_path)
+        if removed:
+            vector_db.bump_index_generation()
+        return removed
+
+
+def _remove_file_from_chroma(vector_db: VectorDatabase, file_path: str) -> int:
+    if not vector_db.db:
+        return 0
+
+    removed = release_previous_version(vector_db, file_path)
+    if not removed and file_path.lower().endswith(".json"):
+        # Элементы каталогов, проиндексированные до появления catalog_path
+        prefix = f"{file_path}#"
+        item_paths = [
+            meta["file_path"]
+            for meta in vector_db.iter_all_metadata(config.CHROMA_BATCH_SIZE)
+            if isinstance(meta, dict)
+            and meta.get("file_path", "").startswith(prefix)
+            and not meta.get("catalog_path")
+        ]
+        if item_paths:
+            docs = vector_db.db.get(where={"file_path": {"$in": item_paths}})
+            ids = docs.get("ids", []) if docs else []
+            vector_db.delete_documents(ids)
+            removed = len(ids)
+
+    if removed:
+        vector_db.delete_cached_entries_by_source(os.path.basename(file_path))
+    if vector_db.catalog:
+        vector_db.catalog.remove_file(file_path)
+    return removed
+
+
+def list_supported_files(directory: str) -> List[str]:
+    """Return supported files of the directory in a stable order."""
+    file_paths = []
+    skipped = 0
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.lower().endswith(config.SUPPORTED_EXTENSIONS):
+                file_paths.append(os.path.normpath(os.path.join(root, filename)))
+            else:
+                skipped += 1
+    if skipped:
+        print(f"Пропущено файлов неподдерживаемого формата: {skipped}")
+    return file_paths
+
+
+def _resume_or_create_job(vector_db: VectorDatabase, directory: str) -> str:
+    """Resume an interrupted indexing job or start a new one."""
+    catalog = vector_db.catalog
+    job_id = catalog.get_running_job(directory)
+    if not job_id:
+        return catalog.create_job(directory)
+
+    print(f"Возобновление прерванного задания индексации {job_id}")
+    for item in catalog.get_interrupted_items(job_id):
+        # Частично записанные чанки незафиксированного файла удаляются
+        if item["ingest_id"]:
+            vector_db.delete_by_ingest_id(item["ingest_id"])
+        print(f"  Откат незавершенной записи: {item['file_path']}")
+        catalog.mark_item(job_id, item["file_path"], "pending")
+
+    committed = catalog.count_items(job_id, "committed")
+    if committed:
+        print(f"  Уже зафиксировано файлов: {committed}")
+    return job_id
+
+
+def iter_index_files(directory: str, vector_db: VectorDatabase) -> Iterator[Dict]:
+    """Index files of the directory one by one, yielding per-file results.
+
+    Indexing runs as a durable job: the work queue and per-file commit markers
+    are stored in the index catalog, so a restarted run resumes from the last
+    committed file. As in index_file, a failed file is rolled back and the
+    index generation is bumped after every committed file that changed the
+    index, so cached search results do not outlive a long run. Each result
+    holds file_path, status (committed, skipped or failed), chunks_added,
+    chunks_removed, bytes and seconds.
+    """
+    if not vector_db.db:
+        vector_db.load_or_create()
+    catalog = vector_db.catalog
+
+    job_id = _resume_or_create_job(vector_db, directory)
+    catalog.enqueue(job_id, list_supported_files(directory))
+    pending = catalog.get_pending_items(job_id)
+
+    for number, file_path in enumerate(pending, 1):
+        rel_path = os.path.relpath(file_path, directory).replace("\\", "/").lower()
+        print(f"\n[{number}/{len(pending)}] Обработка файла: {rel_path}")
+        result = {
+            "file_path": file_path,
+            "status": "committed",
+            "chunks_added": 0,
+            "chunks_removed": 0,
+            "bytes": 0,
+            "seconds": 0.0,
+        }
 
-            except Exception as e:
-                print(f"  Ошибка обработки файла: {str(e)}")
-                continue
+        if not os.path.exists(file_path):
+            print("  Пропуск: файл удален")
+            catalog.mark_item(job_id, file_path, "skipped")
+            result["status"] = "skipped"
+            yield result
+            continue
+
+        started = time.perf_counter()
+        result["bytes"] = os.path.getsize(file_path)
+        metrics = current_metrics()
+        if metrics:
+            metrics.start_file(file_path, result["bytes"])
+        ingest_id = str(uuid.uuid4())
+        catalog.mark_item(job_id, file_path, "in_progress", ingest_id)
+        try:
+            added, removed = _index_file_or_rollback(
+                vector_db, file_path, ingest_id, job_id, False
+            )
+            result["chunks_added"] = added
+            result["chunks_removed"] = removed
+        except Exception as e:
+            print(f"  Ошибка обработки файла: {str(e)}")
+            catalog.mark_item(job_id, file_path, "failed", ingest_id)
+            result["status"] = "failed"
+        result["seconds"] = time.perf_counter() - started
+        if metrics:
+            metrics.finish_file(result["status"], result["chunks_added"])
+        yield result
+
+    catalog.finish_job(job_id)
+
+
+def parse_files(directory: str, vector_db: VectorDatabase) -> IndexingStats:
+    """Index files from directory in ChromaDB and return indexing stats.
+
+    Per-file results are consumed as they are produced, so memory use does
+    not grow with the number of files or chunks. With INDEXING_METRICS_ENABLED
+    per-stage timings are written to a JSON report in INDEXING_REPORT_DIR,
+    MEMORY_PROFILING_ENABLED adds RSS/tracemalloc peaks and allocation sites.
+    """
+    print("\n=== Начало индексации документов ===")
+    started = time.perf_counter()
+    stats = IndexingStats()
+    metrics = None
+    if config.INDEXING_METRICS_ENABLED or config.MEMORY_PROFILING_ENABLED:
+        memory = (
+            MemoryProfiler(config.MEMORY_PROFILE_TOP_SITES)
+            if config.MEMORY_PROFILING_ENABLED
+            else None
+        )
+        metrics = IndexingMetrics(config.INDEXING_REPORT_SLOWEST_FILES, memory)
+        token = metrics.activate()
+    try:
+        for result in iter_index_files(directory, vector_db):
+            stats.add(result)
+    finally:
+        if metrics:
+            metrics.deactivate(token)
+            if metrics.memory:
+                metrics.memory.close()
+
+    # Поколение индекса повышают iter_index_files и cleanup_deleted_files
+    stats.chunks_removed += cleanup_deleted_files(vector_db, directory)
+    stats.seconds = time.perf_counter() - started
 
     print("\n=== Итоги индексации ===")
-    print(f"Всего обработано файлов: {total_files}")
-    print(f"Всего добавлено чанков: {total_chunks}")
+    print(f"Всего обработано файлов: {stats.files} (ошибок: {stats.failed})")
+    print(f"Всего добавлено чанков: {stats.chunks_added}")
+    print(f"Удалено устаревших чанков: {stats.chunks_removed}")
+    print(f"Объем файлов: {stats.bytes / 1024 / 1024:.1f} МБ за {stats.seconds:.1f} с")
     print(
         f"Общее количество документов в базе: {vector_db.db._collection.count() if vector_db.db else 0}"
     )
-
-    cleanup_deleted_files(vector_db, directory)
-    return documents
-
-
-def cleanup_deleted_files(vector_db: VectorDatabase, input_dir: str) -> None:
-    """Check for deleted files and remove their entries from ChromaDB."""
+    if metrics:
+        print("Время по этапам:")
+        metrics.print_summary()
+        try:
+            report_path = metrics.write_report(
+                config.INDEXING_REPORT_DIR, asdict(stats)
+            )
+            stats.report_path = report_path
+            print(f"Отчет индексации: {report_path}")
+        except OSError as e:
+            print(f"Не удалось сохранить отчет индексации: {e}")
+    return stats
+
+
+def cleanup_deleted_files(vector_db: VectorDatabase, input_dir: str) -> int:
+    """Remove entries of deleted files from ChromaDB, returns removed chunks."""
+    total_deleted = 0
     if not vector_db.db:
-        return
+        return total_deleted
 
     try:
+        # Файлы, зафиксированные в каталоге индекса
+        if vector_db.catalog:
+            for file_path in vector_db.catalog.list_files():
+                if not os.path.exists(file_path):
+                    count = remove_file_from_chroma(vector_db, file_path)
+                    total_deleted += count
+                    print(f"Удален файл: {file_path} | Удалено чанков: {count}")
+
         abs_input_dir = os.path.abspath(input_dir)
         files_to_delete_set = set()
         total_checked = 0
 
-        for metadata in get_all_metadata(vector_db, config.CHROMA_BATCH_SIZE):
-            if isinstance(metadata, dict):
+        for metadata in vector_db.iter_all_metadata(config.CHROMA_BATCH_SIZE):
+            # Дедуплицированные чанки учитываются через ссылки каталога индекса
+            if isinstance(metadata, dict) and not metadata.get("content_hash"):
                 file_path = metadata.get("file_path", "")
                 total_checked += 1
 
@@ -284,7 +772,6 @@ def cleanup_deleted_files(vector_db: VectorDatabase, input_dir: str) -> None:
                 main_file_to_chunk_count[main_file] += len(ids)
 
         # Удаляем и выводим результаты по основным файлам
-        total_deleted = 0
         for main_file, ids in main_file_to_ids.items():
             if not ids:
                 continue
@@ -293,11 +780,15 @@ def cleanup_deleted_files(vector_db: VectorDatabase, input_dir: str) -> None:
             total_deleted += count
             vector_db.delete_documents(ids)
             vector_db.delete_cached_entries_by_source(os.path.basename(main_file))
+            if vector_db.catalog:
+                vector_db.catalog.remove_file(main_file)
             print(f"Удален файл: {main_file} | Удалено чанков: {count}")
 
         if total_deleted > 0:
+            vector_db.bump_index_generation()
             print(f"Всего удалено чанков: {total_deleted}")
         else:
             print("Нет чанков для удаления")
     except Exception as e:
         print(f"Ошибка при очистке удаленных файлов: {e}")
+    return total_deleted
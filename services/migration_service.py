@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import config
+from managers.vector_db_manager import DEFAULT_COLLECTION_NAME, VectorDatabase
+from services.indexing_service import index_file
+
+_migration_thread: Optional[threading.Thread] = None
+
+
+def find_outdated_files(vector_db: VectorDatabase) -> Dict[str, List[str]]:
+    """Group files whose chunking/embedding fingerprint differs from the config.
+
+    Files without a recorded document type or fingerprint (indexed before
+    fingerprints were introduced) are reported under "unknown".
+    """
+    embedding_manager = vector_db.embedding_manager
+    outdated: Dict[str, List[str]] = {}
+    for state in vector_db.catalog.list_file_states():
+        doc_type = state.get("doc_type")
+        if not doc_type or not state.get("fingerprint"):
+            outdated.setdefault("unknown", []).append(state["file_path"])
+        elif state["fingerprint"] != embedding_manager.get_config_fingerprint(doc_type):
+            outdated.setdefault(doc_type, []).append(state["file_path"])
+    return outdated
+
+
+def _copy_current_chunks(
+    vector_db: VectorDatabase, target: VectorDatabase, fingerprints: List[str]
+) -> int:
+    """Copy chunks built with the current configuration together with vectors"""
+    if not fingerprints:
+        return 0
+
+    source = vector_db.db._collection
+    destination = target.db._collection
+    where = {"config_fingerprint": {"$in": fingerprints}}
+    copied = 0
+    offset = 0
+    while True:
+        items = source.get(
+            where=where,
+            include=["embeddings", "documents", "metadatas"],
+            limit=config.CHROMA_BATCH_SIZE,
+            offset=offset,
+        )
+        if not items["ids"]:
+            break
+        destination.add(
+            ids=items["ids"],
+            embeddings=items["embeddings"],
+            documents=items["documents"],
+            metadatas=items["metadatas"],
+        )
+        copied += len(items["ids"])
+        offset += config.CHROMA_BATCH_SIZE
+    return copied
+
+
+def _copy_referenced_chunks(vector_db: VectorDatabase, target: VectorDatabase) -> int:
+    """Copy shared chunks referenced by kept files but owned by rebuilt ones"""
+    hashes = vector_db.catalog.list_hashes(target.collection_name)
+    copied = 0
+    batch_size = config.CHROMA_BATCH_SIZE
+    for start in range(0, len(hashes), batch_size):
+        batch = hashes[start : start + batch_size]
+        missing = sorted(set(batch) - target.get_existing_ids(batch))
+        if not missing:
+            continue
+        items = vector_db.db._collection.get(
+            ids=missing, include=["embeddings", "documents", "metadatas"]
+        )
+        if items["ids"]:
+            target.db._collection.add(
+                ids=items["ids"],
+                embeddings=items["embeddings"],
+                documents=items["documents"],
+                metadatas=items["metadatas"],
+            )
+            copied += len(items["ids"])
+    return copied
+
+
+def migration_running() -> bool:
+    return bool(_migration_thread and _migration_thread.is_alive())
+
+
+def migrate_index(vector_db: VectorDatabase) -> None:
+    """Rebuild outdated chunks into a new collection and switch retrieval to it.
+
+    Chunks whose fingerprint matches the current config are copied with their
+    vectors, only files of changed document types are re-chunked and
+    re-embedded (the parsed text cache makes re-parsing cheap). A collection
+    created with the l2 space is moved to a cosine one this way. Files that
+    fail to rebuild keep their old chunks and fingerprint, so the next
+    migration retries them. Queries keep using the old collection until the
+    switch, indexing waits for the end of the migration.
+
+    Queries are embedded with the currently configured model: after a change
+    of EMBEDDING_MODEL, answers are unreliable until the switch, because the
+    old collection holds vectors of the previous model.
+    """
+    if not vector_db.db:
+        vector_db.load_or_create()
+
+    outdated = find_outdated_files(vector_db)
+    if not outdated and vector_db.scores_calibrated:
+        print("Конфигурация чанкинга и эмбеддингов не изменилась, миграция не нужна")
+        return
+    if not vector_db.scores_calibrated:
+        # Новая коллекция создается с метрикой cosine, векторы копируются
+        print(f"  Переход с метрики {vector_db.distance_space} на cosine")
+
+    for doc_type, files in outdated.items():
+        print(f"  Тип '{doc_type}': файлов к перестроению {len(files)}")
+
+    embedding_manager = vector_db.embedding_manager
+    collection_name = (
+        f"{DEFAULT_COLLECTION_NAME}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    )
+    started = time.time()
+
+    with vector_db.write_lock:
+        # Теневая база пишет в новую коллекцию и не фиксирует файлы в каталоге
+        target = VectorDatabase(
+            vector_db.db_path, vector_db.cache_path, embedding_manager
+        )
+        target.db = vector_db.open_collection(collection_name)
+        target.cache_db = vector_db.cache_db
+        target.catalog = vector_db.catalog
+        target.collection_name = collection_name
+        target.commit_files = False
+
+        outdated_files = {path for files in outdated.values() for path in files}
+        current_fingerprints = sorted(
+            {
+                embedding_manager.get_config_fingerprint(state["doc_type"])
+                for state in vector_db.catalog.list_file_states()
+                if state["file_path"] not in outdated_files
+            }
+        )
+        copied = _copy_current_chunks(vector_db, target, current_fingerprints)
+        vector_db.catalog.copy_refs(
+            vector_db.collection_name, collection_name, outdated_files
+        )
+        copied += _copy_referenced_chunks(vector_db, target)
+        print(f"  Скопировано актуальных чанков: {copied}")
+
+        rebuilt = []
+        failed = []
+        for file_path in sorted(outdated_files):
+            if not os.path.exists(file_path):
+                continue
+            print(f"\nПерестроение: {file_path}")
+            ingest_id = str(uuid.uuid4())
+            try:
+                index_file(target, file_path, ingest_id=ingest_id, force=True)
+                rebuilt.append(file_path)
+            except Exception as e:
+                # Частично записанные чанки удалены самим index_file
+                print(f"  Ошибка перестроения файла: {str(e)}")
+                failed.append(file_path)
+
+        if failed:
+            # Файлы, которые не удалось перестроить, остаются в индексе со
+            # старыми чанками и отпечатком (перестроятся при следующей миграции)
+            vector_db.catalog.copy_refs(
+                vector_db.collection_name, collection_name, only_files=failed
+            )
+            kept = _copy_referenced_chunks(vector_db, target)
+            print(
+                f"  Не перестроено файлов: {len(failed)}, "
+                f"сохранено их прежних чанков: {kept}"
+            )
+
+        old_collection_name = vector_db.collection_name
+        old_db = vector_db.swap_collection(target.db, collection_name)
+        for file_path in rebuilt:
+            meta = target.get_file_metadata(file_path) or {}
+            doc_type = "catalog" if meta.get("catalog_path") else meta.get(
+                "document_type"
+            )
+            vector_db.catalog.update_file_config(
+                file_path, doc_type, meta.get("config_fingerprint")
+            )
+
+    print(
+        f"\n✅ Миграция завершена за {time.time() - started:.1f} с: "
+        f"перестроено файлов {len(rebuilt)}, с ошибками {len(failed)}, "
+        f"активная коллекция '{collection_name}'"
+    )
+
+    # Запросы, начатые до переключения, успевают завершиться на старой коллекции
+    time.sleep(config.MIGRATION_DROP_DELAY_SECONDS)
+    try:
+        old_db.delete_collection()
+        vector_db.catalog.drop_refs(old_collection_name)
+    except Exception as e:
+        print(f"Не удалось удалить старую коллекцию: {e}")
+
+
+def start_index_migration(vector_db: VectorDatabase) -> bool:
+    """Start migration in a background thread, returns False if one is running"""
+    global _migration_thread
+    if migration_running():
+        print("Миграция индекса уже выполняется")
+        return False
+
+    _migration_thread = threading.Thread(
+        target=migrate_index, args=(vector_db,), daemon=True
+    )
+    _migration_thread.start()
+    print("Миграция индекса запущена в фоне, чат продолжает работать")
+    return True
@@ -0,0 +1,120 @@
+import hashlib
+import io
+import json
+import os
+import uuid
+from typing import Iterator, Optional
+
+import zstandard
+
+
+class PageWriter:
+    """Incremental writer of parsed pages, the entry appears only on commit"""
+
+    def __init__(self, path: str, level: int) -> None:
+        self.path = path
+        self.tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self.tmp_path, "wb")
+        self._writer = zstandard.ZstdCompressor(level=level).stream_writer(self._file)
+
+    def write(self, page: str) -> None:
+        self._writer.write(json.dumps(page, ensure_ascii=False).encode("utf-8"))
+        self._writer.write(b"\n")
+
+    def commit(self) -> None:
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        try:
+            self._writer.close()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+class ParsedTextCache:
+    """Compressed on-disk cache of parsed document text.
+
+    Entries are keyed by (file hash, parser version, strategy), so changing
+    chunking or embedding settings does not require re-running unstructured
+    partitioning and OCR for unchanged files.
+    """
+
+    def __init__(self, cache_dir: str, parser_version: str, level: int = 3) -> None:
+        self.cache_dir = cache_dir
+        self.parser_version = parser_version
+        self.level = level
+
+    def _path(self, file_hash: str, strategy: str, suffix: str) -> str:
+        key = hashlib.sha256(
+            f"{file_hash}:{self.parser_version}:{strategy}".encode("utf-8")
+        ).hexdigest()
+        directory = os.path.join(self.cache_dir, key[:2])
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{key}{suffix}")
+
+    def get_text(self, file_hash: str, strategy: str) -> Optional[str]:
+        path = self._path(file_hash, strategy, ".txt.zst")
+        try:
+            with open(path, "rb") as f:
+                data = zstandard.ZstdDecompressor().stream_reader(f).read()
+            return data.decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"  Поврежденная запись кэша текста, будет перезаписана: {e}")
+            return None
+
+    def put_text(self, file_hash: str, strategy: str, text: str) -> None:
+        path = self._path(file_hash, strategy, ".txt.zst")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(
+                    zstandard.ZstdCompressor(level=self.level).compress(
+                        text.encode("utf-8")
+                    )
+                )
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"  Не удалось сохранить текст в кэш: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_value(self, file_hash: str, name: str) -> Optional[str]:
+        """Small per-file value (e.g. the PDF strategy decision) or None"""
+        try:
+            with open(self._path(file_hash, name, ".value"), encoding="utf-8") as f:
+                return f.read()
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+
+    def put_value(self, file_hash: str, name: str, value: str) -> None:
+        path = self._path(file_hash, name, ".value")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"  Не удалось сохранить значение в кэш: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def iter_pages(self, file_hash: str, strategy: str) -> Optional[Iterator[str]]:
+        """Return iterator over cached pages or None if there is no entry"""
+        path = self._path(file_hash, strategy, ".pages.zst")
+        if not os.path.exists(path):
+            return None
+        return self._read_pages(path)
+
+    @staticmethod
+    def _read_pages(path: str) -> Iterator[str]:
+        with open(path, "rb") as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f)
+            for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                yield json.loads(line)
+
+    def page_writer(self, file_hash: str, strategy: str) -> PageWriter:
+        return PageWriter(self._path(file_hash, strategy, ".pages.zst"), self.level)
@@ -0,0 +1,120 @@
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+
+
+class QueryRouter:
+    """Выбор типов документов (партиций индекса) для вопроса.
+
+    Эмбеддинг вопроса сравнивается с центроидами типов - средними векторами
+    выборки чанков каждого типа, к сходству добавляется бонус за ключевые
+    слова и шаблоны типа из DOCUMENT_TYPE_CONFIG. Возвращается лучший тип и
+    следующий за ним, если его оценка отстает не больше чем на
+    ROUTER_SCORE_MARGIN.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self._centroids: Dict[str, np.ndarray] = {}
+        self._centroids_db = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._keywords = {
+            doc_type: [word.lower() for word in settings.get("content_keywords", [])]
+            for doc_type, settings in config.DOCUMENT_TYPE_CONFIG.items()
+        }
+        self._patterns = {
+            doc_type: [
+                re.compile(pattern, re.IGNORECASE)
+                for pattern in settings.get("content_patterns", [])
+            ]
+            for doc_type, settings in config.DOCUMENT_TYPE_CONFIG.items()
+        }
+
+    @property
+    def doc_types(self) -> List[str]:
+        return [*self.config.DOCUMENT_TYPE_CONFIG, "default"]
+
+    def _load_centroids(self, db) -> Dict[str, np.ndarray]:
+        """Центроиды типов по выборке сохраненных векторов"""
+        centroids = {}
+        for doc_type in self.doc_types:
+            items = db._collection.get(
+                where={"document_type": doc_type},
+                include=["embeddings"],
+                limit=self.config.ROUTER_CENTROID_SAMPLE,
+            )
+            embeddings = items.get("embeddings")
+            if embeddings is None or len(embeddings) == 0:
+                continue
+            centroid = np.asarray(embeddings, dtype=np.float32).mean(axis=0)
+            norm = np.linalg.norm(centroid)
+            if norm:
+                centroids[doc_type] = centroid / norm
+        return centroids
+
+    def centroids(self, db) -> Dict[str, np.ndarray]:
+        """Центроиды пересчитываются при смене коллекции и по истечении TTL"""
+        with self._lock:
+            expired = (
+                time.monotonic() - self._loaded_at
+                > self.config.ROUTER_CENTROID_TTL_SECONDS
+            )
+            if db is not self._centroids_db or expired:
+                self._centroids = self._load_centroids(db)
+                self._centroids_db = db
+                self._loaded_at = time.monotonic()
+            return self._centroids
+
+    def keyword_scores(self, question: str) -> Dict[str, int]:
+        """Число ключевых слов и шаблонов типа, найденных в вопросе"""
+        text = question.lower()
+        scores = {}
+        for doc_type in self.config.DOCUMENT_TYPE_CONFIG:
+            hits = sum(keyword in text for keyword in self._keywords[doc_type])
+            hits += sum(bool(p.search(question)) for p in self._patterns[doc_type])
+            if hits:
+                scores[doc_type] = hits
+        return scores
+
+    def score(
+        self, question: str, embedding: List[float], db
+    ) -> List[Tuple[str, float]]:
+        """Оценки типов документов, по убыванию"""
+        centroids = self.centroids(db)
+        if not centroids:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+        keywords = self.keyword_scores(question)
+        scores = [
+            (
+                doc_type,
+                float(centroid @ query)
+                + self.config.ROUTER_KEYWORD_WEIGHT * keywords.get(doc_type, 0),
+            )
+            for doc_type, centroid in centroids.items()
+        ]
+        return sorted(scores, key=lambda item: item[1], reverse=True)
+
+    def route(
+        self, question: str, embedding: List[float], db, doc_type: Optional[str] = None
+    ) -> List[str]:
+        """Типы документов, в которых нужно искать ответ"""
+        if doc_type:
+            return [doc_type]
+        scores = self.score(question, embedding, db)
+        if not scores:
+            return ["default"]
+        best = scores[0][1]
+        return [
+            doc_type
+            for doc_type, value in scores[: self.config.ROUTER_MAX_TYPES]
+            if best - value <= self.config.ROUTER_SCORE_MARGIN
+        ]
@@ -1,16 +1,29 @@
+import asyncio
 import gc
 import os
 import shutil
-from typing import List, Optional, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 import utils.gpu_utils as gpu_utils
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 from langchain_core.documents import Document
-from core.llm_manager import create_llm_provider
+from core.llm_manager import get_llm_provider
 
 from config import Config, config
 from managers.embedding_manager import EmbeddingManager
 from managers.vector_db_manager import VectorDatabase
+from services.context_builder import build_context
+from services.query_router import QueryRouter
+from services.migration_service import migration_running
+from services.retrieval_cache import (
+    NegativeAnswerCache,
+    RetrievalCache,
+    normalize_question,
+)
+from utils.memory_profiler import MemoryProbe, format_mb, start_tracing
 
 # Удаляем циклический импорт
 from services.indexing_service import (
@@ -19,6 +32,16 @@ from services.indexing_service import (
 )
 
 
+# Ответ, когда в индексе нет подходящих фрагментов (совпадает с текстом промптов)
+NOT_FOUND_ANSWER = "Информация не найдена"
+
+
+def is_not_found_answer(answer: str) -> bool:
+    """Ответ LLM означает, что информации в контексте нет"""
+    text = answer.strip().strip("\"«».!").lower()
+    return text.startswith(NOT_FOUND_ANSWER.lower())
+
+
 class RAGSystem:
     """Main RAG system class."""
 
@@ -34,6 +57,21 @@ class RAGSystem:
         self.llm_provider = None
         self.llm = None
         self.qa_chain = None
+        self.answer_chains: Dict[str, Any] = {}  # Цепочки ответа по типам промптов
+        self.router = QueryRouter(config)
+        self.retrieval_cache = RetrievalCache(config.RETRIEVAL_CACHE_SIZE)
+        self.negative_cache = NegativeAnswerCache(
+            config.NEGATIVE_CACHE_SIZE, config.NEGATIVE_CACHE_TTL_SECONDS
+        )
+        # Поиск по партициям для всех одновременно обрабатываемых запросов
+        self._search_pool = ThreadPoolExecutor(
+            max_workers=config.ROUTER_MAX_TYPES * config.QUERY_WORKERS,
+            thread_name_prefix="rag-search",
+        )
+        self._chains_db = None  # Коллекция, на которую настроены цепочки
+        self._ready_lock = threading.Lock()  # Ленивая инициализация LLM и цепочек
+        self.last_sources: List[str] = []  # Файлы-источники последнего ответа
+        self.last_query_memory: Dict[str, int] = {}  # Замер памяти запроса
 
     def initialize(self):
         """Initialize RAG system with indexing"""
@@ -55,7 +93,7 @@ class RAGSystem:
 
     def _init_llm(self):
         """Initialize LLM components"""
-        self.llm_provider = create_llm_provider(self.config.__dict__)
+        self.llm_provider = get_llm_provider(self.config.__dict__)
         self.llm = self.llm_provider.get_llm()
         self._init_chains()
 
@@ -104,38 +142,163 @@ class RAGSystem:
                 template="""Ответьте на вопрос на основе предоставленного контекста.
                             Контекст: {context}
                             Вопрос: {input}  # Изменено
+                            Если ответа нет в контексте, скажите "Информация не найдена".
                             Ответ:""",
                 input_variables=["context", "input"],  # Обновлено
             ),
         }
 
-        self.qa_chains = {}
-
         if not self.vector_db.db:
             raise RuntimeError("Vector database not initialized")
 
-        from langchain.chains import create_retrieval_chain
         from langchain.chains.combine_documents import create_stuff_documents_chain
 
-        available_types = self.get_available_doc_types() or ["default"]
-
-        # Гарантируем создание цепи для типа "default" в любом случае
-        if "default" not in available_types:
-            available_types.append("default")
+        # Поиск выполняется маршрутизатором по партициям типов, цепочки
+        # только формируют ответ по найденному контексту
+        self.answer_chains = {
+            doc_type: create_stuff_documents_chain(self.llm, prompt)
+            for doc_type, prompt in prompts.items()
+        }
 
-        for doc_type in available_types:
-            prompt = prompts.get(doc_type, prompts["default"])
+        self._chains_db = self.vector_db.db
 
-            combine_chain = create_stuff_documents_chain(self.llm, prompt)
+    def _retriever_settings(self, doc_type: str) -> Tuple[int, float]:
+        """Число фрагментов и порог релевантности для типа документа"""
+        if doc_type == "legal":
+            return (
+                self.config.RETRIEVER_K_LEGAL,
+                self.config.RETRIEVER_SCORE_THRESHOLD_LEGAL,
+            )
+        return (
+            self.config.RETRIEVER_K_DEFAULT,
+            self.config.RETRIEVER_SCORE_THRESHOLD_DEFAULT,
+        )
 
-            retriever = self.vector_db.db.as_retriever(
-                search_kwargs={
-                    "k": 3,
-                    "filter": {"document_type": doc_type},
-                }
+    def _search_partition(
+        self, embedding: List[float], doc_type: str
+    ) -> List[Tuple[Document, float]]:
+        """k ближайших фрагментов типа с релевантностью (для метрики cosine -
+        косинусное сходство)"""
+        k, _ = self._retriever_settings(doc_type)
+        db = self.vector_db.db
+        relevance = db._select_relevance_score_fn()
+        hits = db.similarity_search_by_vector_with_relevance_scores(
+            embedding, k=k, filter={"document_type": doc_type}
+        )
+        return [(doc, relevance(distance)) for doc, distance in hits]
+
+    def _search(
+        self, question: str, doc_type: Optional[str]
+    ) -> Tuple[List[str], List[Tuple[Document, float]]]:
+        """Типы документов от маршрутизатора и найденные в их партициях фрагменты"""
+        embedding = self.vector_db.db.embeddings.embed_query(question)
+        doc_types = self.router.route(question, embedding, self.vector_db.db, doc_type)
+        if len(doc_types) == 1:
+            return doc_types, self._search_partition(embedding, doc_types[0])
+        futures = [
+            self._search_pool.submit(self._search_partition, embedding, t)
+            for t in doc_types
+        ]
+        return doc_types, [hit for future in futures for hit in future.result()]
+
+    def _load_hits(
+        self, scored_ids: List[Tuple[str, float]]
+    ) -> Optional[List[Tuple[Document, float]]]:
+        """Фрагменты закэшированного результата; None, если какого-то уже нет"""
+        if not scored_ids:
+            return []
+        items = self.vector_db.db._collection.get(
+            ids=[chunk_id for chunk_id, _ in scored_ids],
+            include=["documents", "metadatas"],
+        )
+        docs = {
+            chunk_id: Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+            for chunk_id, text, metadata in zip(
+                items["ids"], items["documents"], items["metadatas"]
             )
+        }
+        if len(docs) != len(scored_ids):
+            return None
+        return [(docs[chunk_id], score) for chunk_id, score in scored_ids]
+
+    def retrieve(
+        self, question: str, doc_type: Optional[str] = None
+    ) -> Tuple[List[Document], List[str]]:
+        """Поиск фрагментов по партициям типов, выбранным маршрутизатором.
+
+        Вопрос векторизуется один раз, партиции ищутся параллельно с k своего
+        типа. Остаются фрагменты, прошедшие порог типа и отстающие от лучшего
+        не больше чем на RETRIEVER_SCORE_MARGIN (если таких нет, остается
+        лучший, а с NO_ANSWER_SHORT_CIRCUIT контекст пуст); в коллекции без
+        метрики cosine пороги и NO_ANSWER_SHORT_CIRCUIT не применяются.
+        Результаты поиска кэшируются до изменения индекса.
+        Пересекающиеся фрагменты склеиваются, контекст ограничивается бюджетом
+        CONTEXT_TOKEN_BUDGET. Возвращает фрагменты контекста и выбранные типы.
+        """
+        key = (
+            normalize_question(question),
+            doc_type,
+            self.config.RETRIEVER_K_LEGAL,
+            self.config.RETRIEVER_K_DEFAULT,
+        )
+        # Поколение читается до поиска: изменение индекса во время поиска
+        # сделает запись устаревшей
+        generation = self.vector_db.index_generation
+        cached = self.retrieval_cache.get(key, generation)
+        hits = self._load_hits(cached[1]) if cached else None
+        if hits is not None:
+            doc_types = cached[0]
+        else:
+            doc_types, hits = self._search(question, doc_type)
+            result = (doc_types, [(doc.id, score) for doc, score in hits])
+            self.retrieval_cache.put(key, generation, result)
+
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        if not self.vector_db.scores_calibrated:
+            # Коллекция l2: оценки несопоставимы с порогами, берутся k лучших
+            return build_context(hits, self.config), doc_types
+
+        floor = hits[0][1] - self.config.RETRIEVER_SCORE_MARGIN if hits else 0.0
+        relevant = [
+            (doc, score)
+            for doc, score in hits
+            if score >= floor
+            and score
+            >= self._retriever_settings(doc.metadata.get("document_type"))[1]
+        ]
+        if not relevant and self.config.NO_ANSWER_SHORT_CIRCUIT:
+            # Ни один фрагмент не прошел порог - ответ без вызова LLM
+            return [], doc_types
+        return build_context(relevant or hits[:1], self.config), doc_types
+
+    def _answer_chain(self, doc_types: List[str]):
+        """Цепочка ответа по промпту лучшего из выбранных типов"""
+        print(f"Поиск по типам документов: {', '.join(doc_types)}")
+        prompt_type = doc_types[0] if doc_types[0] in self.answer_chains else "default"
+        return self.answer_chains[prompt_type]
+
+    def _answer(self, question: str, doc_type: Optional[str]) -> Dict[str, Any]:
+        """Ответ в формате create_retrieval_chain: {"context", "answer"}"""
+        context, doc_types = self.retrieve(question, doc_type)
+        if not context:
+            return {"input": question, "context": [], "answer": NOT_FOUND_ANSWER}
+        answer = self._answer_chain(doc_types).invoke(
+            {"input": question, "context": context}
+        )
+        return {"input": question, "context": context, "answer": answer}
 
-            self.qa_chains[doc_type] = create_retrieval_chain(retriever, combine_chain)
+    async def _aanswer(self, question: str, doc_type: Optional[str]) -> Dict[str, Any]:
+        """Асинхронный _answer: поиск в пуле потоков, ответ через ainvoke"""
+        loop = asyncio.get_running_loop()
+        context, doc_types = await loop.run_in_executor(
+            None, self.retrieve, question, doc_type
+        )
+        if not context:
+            return {"input": question, "context": [], "answer": NOT_FOUND_ANSWER}
+        answer = await self._answer_chain(doc_types).ainvoke(
+            {"input": question, "context": context}
+        )
+        return {"input": question, "context": context, "answer": answer}
 
     def close(self):
         """Корректное закрытие ресурсов"""
@@ -150,13 +313,26 @@ class RAGSystem:
         self, question: str, doc_type: Optional[str] = None, use_cache: bool = False
     ) -> str:
         """Поиск с возможностью указания типа документа"""
-        if not question or not isinstance(question, str):
-            return "Вопрос должен быть непустой строкой"
+        if not self.config.MEMORY_PROFILING_ENABLED:
+            return self._query(question, doc_type, use_cache)
+
+        # Пики памяти запроса (RSS и tracemalloc)
+        start_tracing()
+        with MemoryProbe() as probe:
+            answer = self._query(question, doc_type, use_cache)
+        self.last_query_memory = probe.as_dict()
+        print(
+            f"Память запроса: пик Python {format_mb(probe.peak_traced)}, "
+            f"RSS {format_mb(probe.rss_before)} -> {format_mb(probe.rss_after)}"
+        )
+        return answer
 
-        try:
+    def _prepare(self) -> None:
+        """Инициализация LLM при первом запросе и проверка базы и цепочек"""
+        with self._ready_lock:
             # Инициализация LLM при первом запросе (если не была инициализирована ранее)
             if self.llm is None:
-                self.llm_provider = create_llm_provider(self.config.__dict__)
+                self.llm_provider = get_llm_provider(self.config.__dict__)
                 self.llm = self.llm_provider.get_llm()
                 self._init_chains()
                 print(f"Инициализирована LLM: {self.llm_provider.get_model_name()}")
@@ -164,47 +340,219 @@ class RAGSystem:
             # Принудительная проверка базы
             if not self.vector_db.db:
                 self.vector_db.load_or_create()
-            # Определяем тип документа
-            target_doc_type = doc_type if doc_type in self.qa_chains else "default"
-
-            # Проверяем наличие цепи
-            if target_doc_type not in self.qa_chains:
-                return (
-                    f"Не найдена цепь обработки для типа документа: {target_doc_type}"
-                )
-
-            # Выполняем запрос
-            result = self.qa_chains[target_doc_type].invoke(
-                {"input": question}  # Ключ должен быть "input"
+            # Коллекция сменилась (миграция, переиндексация) - пересоздаем цепочки
+            if self._chains_db is not self.vector_db.db:
+                self._init_chains()
+
+    def _negative_key(self, question: str, doc_type: Optional[str]) -> tuple:
+        return normalize_question(question), doc_type
+
+    def _cached_answer(
+        self, question: str, doc_type: Optional[str], use_cache: bool
+    ) -> Optional[str]:
+        """Ответ из семантического кэша или NOT_FOUND_ANSWER из негативного"""
+        if use_cache:
+            cached = self.vector_db.get_cached_answer(
+                question, self.config.CACHE_SIMILARITY_THRESHOLD
+            )
+            if cached:
+                return cached
+        # Негативный кэш проверяется всегда: повторы вопросов вне корпуса
+        # не доходят до поиска и LLM
+        key = self._negative_key(question, doc_type)
+        if self.negative_cache.contains(key, self.vector_db.index_generation):
+            return NOT_FOUND_ANSWER
+        return None
+
+    def _finish(
+        self,
+        question: str,
+        doc_type: Optional[str],
+        result: Dict[str, Any],
+        use_cache: bool,
+    ) -> str:
+        """Текст ответа, файлы-источники и запись в кэш.
+
+        Ответы "Информация не найдена" попадают в негативный кэш с коротким
+        TTL, а не в семантический кэш.
+        """
+        answer = result.get("answer", "Ответ не найден")
+        if not isinstance(answer, str):
+            answer = str(answer)
+
+        # Все файлы, содержащие найденные фрагменты (с учетом дедупликации)
+        sources = self.vector_db.get_chunk_sources(result.get("context", []))
+        self.last_sources = sources
+        if is_not_found_answer(answer):
+            self.negative_cache.add(
+                self._negative_key(question, doc_type), self.vector_db.index_generation
             )
+        elif use_cache:
+            self.vector_db.add_to_cache(
+                question, answer, [os.path.basename(path) for path in sources]
+            )
+        return answer
+
+    def _query(self, question: str, doc_type: Optional[str], use_cache: bool) -> str:
+        if not question or not isinstance(question, str):
+            return "Вопрос должен быть непустой строкой"
+
+        try:
+            self._prepare()
+            cached = self._cached_answer(question, doc_type, use_cache)
+            if cached:
+                return cached
 
-            # Форматируем ответ
-            answer = result.get("answer", "Ответ не найден")
-            if isinstance(answer, str):
-                return answer
-            return str(answer)
+            # Выполняем запрос: поиск по выбранным типам и ответ по контексту
+            result = self._answer(question, doc_type)
+            return self._finish(question, doc_type, result, use_cache)
 
         except Exception as e:
             print(f"Ошибка при выполнении запроса: {str(e)}")
             return f"Произошла ошибка: {str(e)}"
 
+    async def aquery(
+        self, question: str, doc_type: Optional[str] = None, use_cache: bool = False
+    ) -> str:
+        """Асинхронный query для обработчиков в цикле событий (Telegram).
+
+        Блокирующие шаги - инициализация, кэш, эмбеддинг и поиск, запись
+        источников - выполняются в пуле потоков цикла, ответ LLM ожидается
+        через ainvoke, поэтому цикл событий обслуживает другие запросы.
+        Замер памяти (MEMORY_PROFILING_ENABLED) для параллельных запросов
+        не выполняется.
+        """
+        if not question or not isinstance(question, str):
+            return "Вопрос должен быть непустой строкой"
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._prepare)
+            cached = await loop.run_in_executor(
+                None, self._cached_answer, question, doc_type, use_cache
+            )
+            if cached:
+                return cached
+
+            result = await self._aanswer(question, doc_type)
+            return await loop.run_in_executor(
+                None, self._finish, question, doc_type, result, use_cache
+            )
+
+        except Exception as e:
+            print(f"Ошибка при выполнении запроса: {str(e)}")
+            return f"Произошла ошибка: {str(e)}"
+
+    def stream_query(
+        self, question: str, doc_type: Optional[str] = None, use_cache: bool = False
+    ) -> Iterator[str]:
+        """Потоковый query: фрагменты ответа по мере генерации LLM.
+
+        Ответ из кэша отдается целиком. Полный ответ записывается в кэш
+        после завершения потока.
+        """
+        if not question or not isinstance(question, str):
+            yield "Вопрос должен быть непустой строкой"
+            return
+
+        try:
+            self._prepare()
+            cached = self._cached_answer(question, doc_type, use_cache)
+            if cached:
+                yield cached
+                return
+
+            context, doc_types = self.retrieve(question, doc_type)
+            parts = []
+            if not context:
+                parts.append(NOT_FOUND_ANSWER)
+                yield NOT_FOUND_ANSWER
+            else:
+                for chunk in self._answer_chain(doc_types).stream(
+                    {"input": question, "context": context}
+                ):
+                    parts.append(chunk)
+                    yield chunk
+            result = {"context": context, "answer": "".join(parts)}
+            self._finish(question, doc_type, result, use_cache)
+
+        except Exception as e:
+            print(f"Ошибка при выполнении запроса: {str(e)}")
+            yield f"Произошла ошибка: {str(e)}"
+
+    async def astream_query(
+        self, question: str, doc_type: Optional[str] = None, use_cache: bool = False
+    ) -> AsyncIterator[str]:
+        """Асинхронный stream_query: ответ LLM читается через astream"""
+        if not question or not isinstance(question, str):
+            yield "Вопрос должен быть непустой строкой"
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._prepare)
+            cached = await loop.run_in_executor(
+                None, self._cached_answer, question, doc_type, use_cache
+            )
+            if cached:
+                yield cached
+                return
+
+            context, doc_types = await loop.run_in_executor(
+                None, self.retrieve, question, doc_type
+            )
+            parts = []
+            if not context:
+                parts.append(NOT_FOUND_ANSWER)
+                yield NOT_FOUND_ANSWER
+            else:
+                async for chunk in self._answer_chain(doc_types).astream(
+                    {"input": question, "context": context}
+                ):
+                    parts.append(chunk)
+                    yield chunk
+            result = {"context": context, "answer": "".join(parts)}
+            await loop.run_in_executor(
+                None, self._finish, question, doc_type, result, use_cache
+            )
+
+        except Exception as e:
+            print(f"Ошибка при выполнении запроса: {str(e)}")
+            yield f"Произошла ошибка: {str(e)}"
+
+
+def _index_busy() -> bool:
+    """Миграция держит старую коллекцию открытой до переключения"""
+    if migration_running():
+        print("Выполняется миграция индекса, повторите после ее завершения")
+        return True
+    return False
+
 
 def clean_data(vector_db: Optional[VectorDatabase] = None):
     """Clean existing ChromaDB indexes."""
-    if vector_db:
-        vector_db.db = None
-        vector_db.cache_db = None
-        gc.collect()
-
-    for path in [config.CHROMA_DB_PATH, config.CHROMA_CACHE_PATH]:
-        if os.path.exists(path):
-            try:
-                shutil.rmtree(path)
-                print(f"Removed {path}")
-            except PermissionError as e:
-                print(f"Error removing {path}: {e}")
-            except Exception as e:
-                print(f"Unexpected error: {e}")
+    if _index_busy():
+        return
+
+    # Наблюдение за каталогом не пишет в индекс, пока он удаляется
+    with vector_db.write_lock if vector_db else nullcontext():
+        if vector_db:
+            vector_db.db = None
+            vector_db.cache_db = None
+            if vector_db.catalog:
+                vector_db.catalog.close()
+                vector_db.catalog = None
+            gc.collect()
+
+        for path in [config.CHROMA_DB_PATH, config.CHROMA_CACHE_PATH]:
+            if os.path.exists(path):
+                try:
+                    shutil.rmtree(path)
+                    print(f"Removed {path}")
+                except PermissionError as e:
+                    print(f"Error removing {path}: {e}")
+                except Exception as e:
+                    print(f"Unexpected error: {e}")
 
 
 def clear_semantic_cache(vector_db: VectorDatabase):
@@ -227,17 +575,21 @@ def clear_semantic_cache(vector_db: VectorDatabase):
 
 def run_indexing(vector_db: VectorDatabase):
     """Run document indexing."""
-    # Закрываем текущее соединение перед повторным открытием
-    vector_db.close()
-    gc.collect()
+    if _index_busy():
+        return
+
+    with vector_db.write_lock:
+        # Закрываем текущее соединение перед повторным открытием
+        vector_db.close()
+        gc.collect()
 
-    # Пересоздаем соединение
-    vector_db.load_or_create()
-    vector_db.load_or_create_cache()
+        # Пересоздаем соединение
+        vector_db.load_or_create()
+        vector_db.load_or_create_cache()
 
-    # Выполняем индексацию
-    cleanup_deleted_files(vector_db, config.INPUT_DIR)
-    parse_files(config.INPUT_DIR, vector_db)
+        # Выполняем индексацию
+        cleanup_deleted_files(vector_db, config.INPUT_DIR)
+        parse_files(config.INPUT_DIR, vector_db)
     print("Индексация завершена")
 
 
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# Результат поиска: выбранные типы документов и (id чанка, релевантность)
+RetrievalResult = Tuple[List[str], List[Tuple[str, float]]]
+
+
+def normalize_question(question: str) -> str:
+    """Регистр, повторные пробелы и пунктуация по краям не влияют на ключ"""
+    return " ".join(question.lower().split()).strip(" ?!.,;:")
+
+
+class RetrievalCache:
+    """LRU-кэш результатов поиска по индексу.
+
+    Хранятся только id чанков и оценки, тексты читаются из коллекции при
+    попадании. Каждая запись помечена поколением индекса, в котором она
+    получена: после изменения индекса (VectorDatabase.bump_index_generation)
+    записи прежних поколений не используются и удаляются при обращении.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[int, RetrievalResult]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, generation: int) -> Optional[RetrievalResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, generation: int, result: RetrievalResult) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (generation, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class NegativeAnswerCache:
+    """Вопросы, на которые в индексе нет ответа, на короткое время ttl.
+
+    Запись действует, пока не истек ttl и не изменилось поколение индекса
+    (новые документы могут содержать ответ).
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def contains(self, key: Hashable, generation: int) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if entry[0] != generation or entry[1] < time.monotonic():
+                del self._entries[key]
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, key: Hashable, generation: int) -> None:
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
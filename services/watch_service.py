@@ -0,0 +1,183 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from watchfiles import Change, DefaultFilter, watch
+
+from config import config
+from managers.vector_db_manager import VectorDatabase
+from services.indexing_service import (
+    index_file,
+    parse_files,
+    remove_file_from_chroma,
+)
+
+
+def _normalize_path(path: str, directory: str) -> str:
+    """Приводит абсолютный путь из события к виду, который хранится в метаданных"""
+    rel_path = os.path.relpath(os.path.abspath(path), os.path.abspath(directory))
+    return os.path.normpath(os.path.join(directory, rel_path))
+
+
+def coalesce_changes(
+    changes: Iterable[Tuple[Change, str]], directory: str
+) -> Tuple[List[str], List[str]]:
+    """Схлопывает пачку событий в списки файлов на переиндексацию и удаление.
+
+    Для каждого пути учитывается только итоговое состояние на диске, поэтому
+    перемещение (deleted + added) и серия сохранений одного файла дают одну операцию.
+    """
+    paths: Set[str] = {_normalize_path(path, directory) for _, path in changes}
+    to_index: List[str] = []
+    to_delete: List[str] = []
+    for path in sorted(paths):
+        if os.path.isfile(path):
+            if path.lower().endswith(config.SUPPORTED_EXTENSIONS):
+                to_index.append(path)
+        elif os.path.isdir(path):
+            # Перемещенный в наблюдаемую область каталог приходит одним событием
+            for root, _, files in os.walk(path):
+                to_index.extend(
+                    os.path.normpath(os.path.join(root, f))
+                    for f in files
+                    if f.lower().endswith(config.SUPPORTED_EXTENSIONS)
+                )
+        elif not os.path.exists(path):
+            to_delete.append(path)
+    return to_index, to_delete
+
+
+def _expand_deleted_paths(vector_db: VectorDatabase, paths: List[str]) -> List[str]:
+    """Раскрывает удаленные пути в список проиндексированных файлов.
+
+    Файл это или каталог, решает индекс, а не расширение: путь, совпадающий
+    с проиндексированным файлом, удаляется как файл, иначе удаляются файлы
+    внутри него (path + os.sep). Метаданные коллекции просматриваются только
+    для путей, которых нет в каталоге индекса (индексы до его появления).
+    """
+
+    def resolve(indexed: Set[str], path: str) -> Set[str]:
+        if path in indexed:
+            return {path}
+        prefix = path + os.sep
+        return {file_path for file_path in indexed if file_path.startswith(prefix)}
+
+    catalog_files = set(vector_db.catalog.list_files() if vector_db.catalog else [])
+    resolved: Set[str] = set()
+    unresolved: List[str] = []
+    for path in paths:
+        found = resolve(catalog_files, path)
+        resolved |= found
+        if not found:
+            unresolved.append(path)
+
+    if unresolved:
+        stored: Set[str] = set()
+        for meta in vector_db.iter_all_metadata(config.CHROMA_BATCH_SIZE):
+            file_path = meta.get("file_path", "") if isinstance(meta, dict) else ""
+            if file_path:
+                stored.add(file_path.split("#")[0])
+        for path in unresolved:
+            resolved |= resolve(stored, path)
+    return sorted(resolved)
+
+
+def apply_changes(
+    vector_db: VectorDatabase, to_index: List[str], to_delete: List[str]
+) -> Dict[str, int]:
+    """Применяет изменения к индексу небольшими батчами"""
+    stats = {"indexed": 0, "deleted": 0, "chunks_added": 0, "chunks_removed": 0}
+    batch_size = config.WATCH_BATCH_SIZE
+
+    for path in _expand_deleted_paths(vector_db, to_delete):
+        try:
+            removed = remove_file_from_chroma(vector_db, path)
+        except Exception as e:
+            print(f"  Ошибка удаления {path}: {e}")
+            continue
+        if removed:
+            stats["deleted"] += 1
+            stats["chunks_removed"] += removed
+            print(f"Удален файл: {path} | Удалено чанков: {removed}")
+
+    for start in range(0, len(to_index), batch_size):
+        batch = to_index[start : start + batch_size]
+        for path in batch:
+            print(f"\nОбработка файла: {path}")
+            try:
+                stats["chunks_added"] += index_file(vector_db, path)
+                stats["indexed"] += 1
+            except Exception as e:
+                print(f"  Ошибка обработки файла: {str(e)}")
+        print(f"Обработано файлов: {start + len(batch)}/{len(to_index)}")
+    return stats
+
+
+def watch_directory(
+    vector_db: VectorDatabase,
+    directory: str = config.INPUT_DIR,
+    stop_event: Optional[threading.Event] = None,
+) -> None:
+    """Непрерывная инкрементальная индексация по событиям файловой системы.
+
+    Запросы продолжают обслуживаться провайдерами чата: соединение с базой
+    не переоткрывается, изменения пишутся в ту же коллекцию.
+    """
+    if not vector_db.db:
+        vector_db.load_or_create()
+    if not vector_db.cache_db:
+        vector_db.load_or_create_cache()
+
+    if config.WATCH_INITIAL_SCAN:
+        parse_files(directory, vector_db)
+
+    print(f"\n=== Наблюдение за каталогом: {directory} ===")
+    try:
+        for changes in watch(
+            directory,
+            watch_filter=DefaultFilter(),
+            debounce=config.WATCH_DEBOUNCE_MS,
+            stop_event=stop_event,
+        ):
+            to_index, to_delete = coalesce_changes(changes, directory)
+            if not to_index and not to_delete:
+                continue
+
+            stats = apply_changes(vector_db, to_index, to_delete)
+            print(
+                f"Изменения применены: переиндексировано {stats['indexed']}, "
+                f"удалено {stats['deleted']}, чанков +{stats['chunks_added']}"
+                f"/-{stats['chunks_removed']}"
+            )
+    except KeyboardInterrupt:
+        pass
+    print("Наблюдение за каталогом остановлено")
+
+
+_watch_thread: Optional[threading.Thread] = None
+_watch_stop: Optional[threading.Event] = None
+
+
+def start_watch(vector_db: VectorDatabase, directory: str = config.INPUT_DIR) -> bool:
+    """Start watching in a background thread, returns False if already running"""
+    global _watch_thread, _watch_stop
+    if _watch_thread and _watch_thread.is_alive():
+        print("Наблюдение за каталогом уже выполняется")
+        return False
+
+    _watch_stop = threading.Event()
+    _watch_thread = threading.Thread(
+        target=watch_directory, args=(vector_db, directory, _watch_stop), daemon=True
+    )
+    _watch_thread.start()
+    print("Наблюдение за каталогом запущено в фоне, меню и чат продолжают работать")
+    return True
+
+
+def stop_watch(timeout: Optional[float] = None) -> bool:
+    """Stop the background watcher, returns False if it was not running"""
+    if not _watch_thread or not _watch_thread.is_alive():
+        return False
+    _watch_stop.set()
+    _watch_thread.join(timeout)
+    return True
@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config проверяет ключ провайдера LLM при импорте
+os.environ.setdefault("SBER_API_KEY", "test")
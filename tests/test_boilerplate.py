@@ -0,0 +1,30 @@
+from config import Config
+from utils.boilerplate import BoilerplateFilter
+
+
+WORDS = ["договор", "закон", "оплата", "срок", "услуга", "сторона", "порядок"]
+
+
+def pages(header, count):
+    """Страницы с колонтитулом, уникальным текстом и номером страницы"""
+    return [f"{header}\n{WORDS[n % 7]} {n // 7}\nСтраница {n}" for n in range(count)]
+
+
+def test_result_does_not_depend_on_previous_documents():
+    # Строка повторяется на 2 страницах из 10 - меньше порога документа
+    document = pages("Общий колонтитул", 2) + pages("Раздел", 8)
+
+    fresh = list(BoilerplateFilter(Config()).clean_pages(document))
+    warmed = BoilerplateFilter(Config())
+    for _ in range(5):
+        # Другие документы с той же строкой на многих страницах
+        list(warmed.clean_pages(pages("Общий колонтитул", 10)))
+
+    assert list(warmed.clean_pages(document)) == fresh
+    assert fresh[0].startswith("Общий колонтитул")
+
+
+def test_repeated_edge_lines_are_removed():
+    cleaned = list(BoilerplateFilter(Config()).clean_pages(pages("Колонтитул", 6)))
+
+    assert cleaned == [f"{WORDS[n]} 0" for n in range(6)]
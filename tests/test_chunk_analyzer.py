@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+from chunk_analyzer.analyzer import analyze_document
+from config import config
+from managers.embedding_manager import EmbeddingManager
+
+
+@pytest.fixture(scope="module")
+def manager():
+    return EmbeddingManager(config)
+
+
+@pytest.mark.parametrize("value", [42, "строка", None])
+def test_top_level_json_scalar_is_reported(tmp_path, manager, value):
+    file_path = tmp_path / "scalar.json"
+    file_path.write_text(json.dumps(value), "utf-8")
+
+    with pytest.raises(ValueError, match="массивом или объектом"):
+        analyze_document(str(file_path), clean_text=False, manager=manager)
+
+
+def test_json_object_report(tmp_path, manager):
+    file_path = tmp_path / "object.json"
+    file_path.write_text(json.dumps({"a": [1, 2], "b": {"c": "d"}}), "utf-8")
+
+    report = analyze_document(str(file_path), clean_text=False, manager=manager)
+
+    assert "**Всего элементов:** 2" in report
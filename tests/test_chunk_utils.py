@@ -0,0 +1,22 @@
+from utils.chunk_utils import content_hash
+
+
+def test_whitespace_does_not_change_hash():
+    assert content_hash("Справка  о\nдоходах ") == content_hash("Справка о доходах")
+
+
+def test_different_text_changes_hash():
+    assert content_hash("Справка о доходах") != content_hash("Справка о расходах")
+
+
+def test_scope_separates_document_types_and_configs():
+    text = "Справка о доходах"
+    assert content_hash(text, "legal", "fp1") == content_hash(text, "legal", "fp1")
+    assert content_hash(text, "legal", "fp1") != content_hash(text, "qa", "fp1")
+    assert content_hash(text, "legal", "fp1") != content_hash(text, "legal", "fp2")
+    assert content_hash(text, None) == content_hash(text, "")
+
+
+def test_scope_parts_are_not_concatenated():
+    assert content_hash("a", "bc") != content_hash("ab", "c")
+    assert content_hash("a", "b", "c") != content_hash("a", "bc")
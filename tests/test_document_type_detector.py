@@ -0,0 +1,67 @@
+import re
+
+import pytest
+
+from config import Config
+from services.document_type_detector import DocumentTypeDetector
+
+
+def make_detector(type_config):
+    config = Config()
+    config.DOCUMENT_TYPE_CONFIG = type_config
+    config.DETECTION_WINDOW_CHARS = 0
+    return DocumentTypeDetector(config)
+
+
+def sequential_detect(type_config, content):
+    """Прежняя проверка правил по одному в порядке приоритета"""
+    for doc_type, rules in type_config.items():
+        for keyword in rules.get("content_keywords", []):
+            if keyword.lower() in content.lower():
+                return doc_type, f"по ключевому слову '{keyword}'"
+        for pattern in rules.get("content_patterns", []):
+            if re.search(pattern, content, re.IGNORECASE):
+                return doc_type, f"по шаблону '{pattern}'"
+    return "default", "автоматически (не удалось определить)"
+
+
+TYPE_CONFIGS = [
+    # Ветви верхнего уровня начинаются с разных символов
+    {"legal": {"content_patterns": ["закон|кодекс"]}},
+    {
+        "legal": {"content_keywords": ["статья"], "content_patterns": ["закон|кодекс"]},
+        "qa": {"content_keywords": ["вопрос"]},
+    },
+    # Нумерованная обратная ссылка внутри шаблона
+    {
+        "qa": {"content_patterns": [r"(\w+) \1"]},
+        "legal": {"content_patterns": [r"(глава) (\d+)"]},
+    },
+    # Именованные группы с одинаковыми именами и глобальный флаг
+    {
+        "legal": {"content_patterns": [r"(?P<n>\d+)-(?P=n)"]},
+        "qa": {"content_patterns": [r"(?P<n>вопрос)", r"(?s)ответ.+конец"]},
+    },
+]
+
+TEXTS = [
+    "Налоговый кодекс РФ",
+    "Федеральный закон о защите прав",
+    "Статья 5. Вопрос об ответственности",
+    "Частые вопросы: вопрос вопрос и ответ",
+    "Глава 12 и снова 12-12",
+    "ответ\nбез вопроса\nконец",
+    "Ничего подходящего",
+]
+
+
+@pytest.mark.parametrize("type_config", TYPE_CONFIGS)
+@pytest.mark.parametrize("text", TEXTS)
+def test_same_result_as_sequential_rules(type_config, text):
+    detector = make_detector(type_config)
+    assert detector.detect("file.txt", text) == sequential_detect(type_config, text)
+
+
+def test_alternation_is_not_cut_by_prefilter():
+    detector = make_detector({"legal": {"content_patterns": ["закон|кодекс"]}})
+    assert detector.detect("file.txt", "Налоговый кодекс РФ")[0] == "legal"
@@ -0,0 +1,65 @@
+import pytest
+
+from managers.index_catalog import IndexCatalog
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = IndexCatalog(str(tmp_path / "catalog.sqlite3"))
+    yield catalog
+    catalog.close()
+
+
+def test_job_resumes_from_last_committed_file(catalog):
+    job_id = catalog.create_job("data")
+    catalog.enqueue(job_id, ["a.txt", "b.txt", "c.txt"])
+    catalog.commit_file("a.txt", "hash-a", 1.0, "ingest-a", 2, job_id=job_id)
+    catalog.mark_item(job_id, "b.txt", "in_progress", "ingest-b")
+
+    # Перезапуск: то же незавершенное задание, a.txt уже зафиксирован
+    assert catalog.get_running_job("data") == job_id
+    assert catalog.get_pending_items(job_id) == ["b.txt", "c.txt"]
+    assert catalog.get_interrupted_items(job_id) == [
+        {"file_path": "b.txt", "ingest_id": "ingest-b"}
+    ]
+    assert catalog.count_items(job_id, "committed") == 1
+    assert catalog.get_file("a.txt")["ingest_id"] == "ingest-a"
+
+    # Повторная постановка в очередь не сбрасывает состояние
+    catalog.enqueue(job_id, ["a.txt", "d.txt"])
+    assert catalog.get_pending_items(job_id) == ["b.txt", "c.txt", "d.txt"]
+
+    catalog.finish_job(job_id)
+    assert catalog.get_running_job("data") is None
+    assert catalog.get_pending_items(job_id) == []
+
+
+def test_rolled_back_ingest_releases_only_its_refs(catalog):
+    catalog.add_refs("docs", "a.txt", "ingest-a", [("shared", 0), ("only-a", 1)])
+    catalog.add_refs("docs", "b.txt", "ingest-b", [("shared", 0), ("only-b", 1)])
+
+    released, owners = catalog.release_ingest_refs("docs", "ingest-b")
+
+    assert released == ["only-b"]
+    assert owners == {"shared": "a.txt"}
+    assert sorted(catalog.list_hashes("docs")) == ["only-a", "shared"]
+
+
+def test_new_file_version_keeps_its_own_refs(catalog):
+    catalog.add_refs("docs", "a.txt", "old", [("kept", 0), ("dropped", 1)])
+    catalog.add_refs("docs", "a.txt", "new", [("kept", 0)])
+
+    released, owners = catalog.release_file_refs("docs", "a.txt", "new")
+
+    assert released == ["dropped"]
+    assert owners == {"kept": "a.txt"}
+    assert catalog.get_sources("docs", ["kept"]) == {"kept": ["a.txt"]}
+
+
+def test_copy_refs_filters_files(catalog):
+    catalog.add_refs("old", "a.txt", "ingest-a", [("h1", 0)])
+    catalog.add_refs("old", "b.txt", "ingest-b", [("h2", 0)])
+
+    catalog.copy_refs("old", "new", only_files=["b.txt"])
+
+    assert catalog.list_hashes("new") == ["h2"]
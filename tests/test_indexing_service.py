@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from config import config
+from managers.embedding_manager import EmbeddingManager
+from managers.vector_db_manager import VectorDatabase
+from services.indexing_service import index_file
+
+
+@pytest.fixture
+def vector_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "EMBEDDING_BACKEND", "hashing")
+    vector_db = VectorDatabase(
+        str(tmp_path / "db"), str(tmp_path / "cache"), EmbeddingManager(config)
+    )
+    vector_db.load_or_create()
+    yield vector_db
+    vector_db.close()
+
+
+def write_catalog(path, version):
+    items = [{"name": f"{version}-{i}", "text": "слово " * i} for i in range(20)]
+    path.write_text(json.dumps({"items": items}, ensure_ascii=False), "utf-8")
+
+
+def test_failed_reindex_keeps_previous_version(vector_db, tmp_path, monkeypatch):
+    file_path = str(tmp_path / "data.json")
+    write_catalog(tmp_path / "data.json", "v1")
+    assert index_file(vector_db, file_path) > 0
+    ids_before = sorted(vector_db.db.get()["ids"])
+    state_before = vector_db.catalog.get_file(file_path)
+    hashes_before = sorted(vector_db.catalog.list_hashes(vector_db.collection_name))
+    generation = vector_db.index_generation
+
+    # Вторая партия новой версии не записывается
+    write_catalog(tmp_path / "data.json", "v2")
+    monkeypatch.setattr(config, "CHROMA_BATCH_SIZE", 2)
+    add_chunks = vector_db.add_chunks
+    calls = []
+
+    def failing_add_chunks(ids, chunks):
+        calls.append(len(ids))
+        if len(calls) > 1:
+            raise RuntimeError("запись не удалась")
+        add_chunks(ids, chunks)
+
+    monkeypatch.setattr(vector_db, "add_chunks", failing_add_chunks)
+    with pytest.raises(RuntimeError):
+        index_file(vector_db, file_path)
+
+    assert len(calls) == 2
+    assert sorted(vector_db.db.get()["ids"]) == ids_before
+    assert vector_db.catalog.get_file(file_path) == state_before
+    assert (
+        sorted(vector_db.catalog.list_hashes(vector_db.collection_name))
+        == hashes_before
+    )
+    assert vector_db.index_generation == generation
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.llm_manager import LLMRateLimiter, _retry_after_seconds
+
+
+def acquire_in_thread(limiter, priority=0):
+    """Поток, ожидающий разрешения; granted выставляется после выдачи"""
+    granted = threading.Event()
+    thread = threading.Thread(
+        target=lambda: (limiter.acquire(priority), granted.set()), daemon=True
+    )
+    thread.start()
+    return granted
+
+
+def test_concurrency_limit():
+    limiter = LLMRateLimiter(0, concurrency=2)
+    limiter.acquire()
+    limiter.acquire()
+
+    third = acquire_in_thread(limiter)
+    assert not third.wait(0.1)
+
+    limiter.release()
+    assert third.wait(1)
+
+
+def test_requests_are_paced_by_rate():
+    limiter = LLMRateLimiter(600, concurrency=10)  # 10 в секунду
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    # Первый вызов тратит начальный токен, остальные ждут по 0.1 с
+    assert 0.25 <= time.monotonic() - started < 1.0
+
+
+def test_zero_rate_is_unlimited():
+    limiter = LLMRateLimiter(0, concurrency=1)
+    started = time.monotonic()
+    for _ in range(50):
+        limiter.acquire()
+        limiter.release()
+    assert time.monotonic() - started < 0.5
+    limiter.on_success()
+    assert limiter.rate == 0
+
+
+def test_rate_limited_halves_rate_and_recovers():
+    limiter = LLMRateLimiter(600, concurrency=1)
+    limiter.on_rate_limited(0)
+    assert limiter.rate == pytest.approx(5)
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.rate == pytest.approx(10)
+
+
+def test_retry_after_pauses_even_without_rate_limit():
+    limiter = LLMRateLimiter(0, concurrency=1)
+    limiter.on_rate_limited(0.3)
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.25
+
+
+def test_higher_priority_waiter_goes_first():
+    limiter = LLMRateLimiter(0, concurrency=1)
+    limiter.acquire()
+    low = acquire_in_thread(limiter, priority=1)
+    time.sleep(0.05)
+    high = acquire_in_thread(limiter, priority=0)
+    time.sleep(0.05)
+
+    limiter.release()
+    assert high.wait(1)
+    assert not low.is_set()
+    limiter.release()
+    assert low.wait(1)
+
+
+def test_cancelled_async_waiter_does_not_hold_a_slot():
+    limiter = LLMRateLimiter(0, concurrency=1)
+
+    async def scenario():
+        await limiter.aacquire()
+        waiter = asyncio.ensure_future(limiter.aacquire())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+        await asyncio.wait_for(limiter.aacquire(), 1)
+
+    asyncio.run(scenario())
+    assert limiter.active == 1
+
+
+def test_retry_after_header_values():
+    assert _retry_after_seconds("2.5") == 2.5
+    assert _retry_after_seconds("-1") == 0.0
+    assert _retry_after_seconds(None) is None
+    assert _retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from utils.offset_splitter import OffsetTextSplitter
+
+SEPARATORS = [
+    ["\n\nСТАТЬЯ", "\n\nРАЗДЕЛ", "\n\n", "\n"],
+    ["\n\nQ:", "\nA:", "\n\n", "\n"],
+    ["}", ","],
+    None,
+]
+
+
+def random_text(seed: int) -> str:
+    """Статьи, вопросы и JSON-подобные фрагменты с абзацами разной длины"""
+    rng = random.Random(seed)
+    words = "договор сторона оплата срок услуги закон Q: A: {a} , }".split()
+    parts = []
+    for number in range(rng.randint(5, 40)):
+        heading = rng.choice(["СТАТЬЯ", "РАЗДЕЛ", "Q:", "A:", ""])
+        paragraphs = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(0, 120)))
+            for _ in range(rng.randint(1, 4))
+        ]
+        separator = rng.choice(["\n\n", "\n", "  \n\n  ", ""])
+        parts.append(f"{heading} {number}. " + separator.join(paragraphs))
+    return "\n\n".join(parts)
+
+
+@pytest.mark.parametrize("separators", SEPARATORS)
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(50, 0), (200, 40), (700, 150)])
+@pytest.mark.parametrize("seed", range(5))
+def test_same_chunks_as_langchain(separators, chunk_size, chunk_overlap, seed):
+    params = dict(
+        separators=separators,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True,
+    )
+    text = random_text(seed)
+
+    expected = RecursiveCharacterTextSplitter(**params).create_documents([text])
+    actual = OffsetTextSplitter(**params).create_documents([text])
+
+    assert [doc.page_content for doc in actual] == [
+        doc.page_content for doc in expected
+    ]
+    for doc in actual:
+        start = doc.metadata["start_index"]
+        assert text[start : start + len(doc.page_content)] == doc.page_content
+
+
+def test_keep_separator_end_is_rejected():
+    with pytest.raises(ValueError):
+        OffsetTextSplitter(keep_separator="end")
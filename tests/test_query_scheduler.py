@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from config import Config
+from managers.query_scheduler import QueryScheduler
+
+TIMEOUT_MESSAGE = "Превышено время ожидания ответа, повторите запрос"
+
+
+@pytest.fixture
+def scheduler():
+    config = Config()
+    config.QUERY_WORKERS = 1
+    config.QUERY_TIMEOUT_SECONDS = 0.2
+    config.QUERY_EXECUTION_TIMEOUT_SECONDS = 0.3
+    scheduler = QueryScheduler(config)
+    yield scheduler
+    scheduler.shutdown(wait=False)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_execution_gets_its_own_timeout(scheduler):
+    # Выполнение дольше дедлайна очереди, но в пределах дедлайна выполнения
+    assert scheduler.ask("u", lambda: time.sleep(0.35) or "ответ") == "ответ"
+
+
+def test_queued_request_times_out_without_running(scheduler):
+    release = threading.Event()
+    ran = []
+    threading.Thread(
+        target=scheduler.ask, args=("a", release.wait), daemon=True
+    ).start()
+    assert wait_until(lambda: scheduler.metrics()["queue_depth"] == 0)
+
+    assert scheduler.ask("b", lambda: ran.append(1)) == TIMEOUT_MESSAGE
+    release.set()
+    time.sleep(0.1)
+    assert ran == []
+    assert scheduler.metrics()["timeouts"] == 1
+
+
+def test_abandoned_sync_request_is_counted_until_it_finishes(scheduler):
+    release = threading.Event()
+
+    assert scheduler.ask("u", release.wait) == TIMEOUT_MESSAGE
+    metrics = scheduler.metrics()
+    assert metrics["execution_timeouts"] == 1
+    assert metrics["abandoned_running"] == 1
+
+    release.set()
+    assert wait_until(lambda: scheduler.metrics()["abandoned_running"] == 0)
+
+
+def test_timed_out_coroutine_is_cancelled(scheduler):
+    cancelled = []
+
+    async def slow() -> str:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "ответ"
+
+    async def scenario() -> str:
+        answer = await scheduler.aask("u", slow)
+        await asyncio.sleep(0.05)
+        return answer
+
+    assert asyncio.run(scenario()) == TIMEOUT_MESSAGE
+    assert cancelled == [True]
+    assert wait_until(lambda: scheduler.metrics()["async_running"] == 0)
+
+
+def test_abandoned_stream_stops_producing(scheduler):
+    produced = []
+
+    def chunks():
+        time.sleep(0.6)
+        for number in range(100):
+            produced.append(number)
+            yield str(number)
+            time.sleep(0.01)
+
+    assert list(scheduler.stream("u", chunks)) == [TIMEOUT_MESSAGE]
+    assert wait_until(lambda: scheduler.metrics()["abandoned_running"] == 0)
+    assert produced == [0]
@@ -0,0 +1,68 @@
+from services.retrieval_cache import (
+    NegativeAnswerCache,
+    RetrievalCache,
+    normalize_question,
+)
+
+RESULT = (["legal"], [("chunk-1", 0.8), ("chunk-2", 0.6)])
+
+
+def test_question_normalization():
+    assert normalize_question("  Как получить   СПРАВКУ? ") == "как получить справку"
+
+
+def test_entry_is_valid_only_for_its_generation():
+    cache = RetrievalCache(max_size=10)
+    cache.put("q", 1, RESULT)
+
+    assert cache.get("q", 1) == RESULT
+    # Индекс изменился: запись устарела и удаляется
+    assert cache.get("q", 2) is None
+    assert cache.get("q", 1) is None
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 2}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = RetrievalCache(max_size=2)
+    cache.put("a", 1, RESULT)
+    cache.put("b", 1, RESULT)
+    cache.get("a", 1)
+    cache.put("c", 1, RESULT)
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == RESULT
+    assert cache.get("c", 1) == RESULT
+
+
+def test_zero_size_disables_cache():
+    cache = RetrievalCache(max_size=0)
+    cache.put("q", 1, RESULT)
+    assert cache.get("q", 1) is None
+
+
+def test_negative_answer_expires_with_generation_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("services.retrieval_cache.time.monotonic", lambda: now[0])
+    cache = NegativeAnswerCache(max_size=10, ttl=60)
+    cache.add("q", 1)
+
+    assert cache.contains("q", 1)
+    assert not cache.contains("q", 2)  # Новые документы могут содержать ответ
+    assert not cache.contains("q", 1)
+
+    cache.add("q", 1)
+    now[0] += 61
+    assert not cache.contains("q", 1)
+    assert cache.hits == 1
+
+
+def test_negative_cache_size_and_disabling():
+    cache = NegativeAnswerCache(max_size=1, ttl=60)
+    cache.add("a", 1)
+    cache.add("b", 1)
+    assert not cache.contains("a", 1)
+    assert cache.contains("b", 1)
+
+    for disabled in (NegativeAnswerCache(0, 60), NegativeAnswerCache(10, 0)):
+        disabled.add("q", 1)
+        assert not disabled.contains("q", 1)
@@ -0,0 +1,54 @@
+import os
+
+from services.watch_service import _expand_deleted_paths
+
+
+class FakeCatalog:
+    def __init__(self, files):
+        self.files = files
+
+    def list_files(self):
+        return list(self.files)
+
+
+class FakeVectorDatabase:
+    """Каталог индекса и метаданные чанков без ChromaDB"""
+
+    def __init__(self, catalog_files, chunk_paths=()):
+        self.catalog = FakeCatalog(catalog_files)
+        self.chunk_paths = chunk_paths
+        self.scans = 0
+
+    def iter_all_metadata(self, batch_size=1000):
+        self.scans += 1
+        return ({"file_path": path} for path in self.chunk_paths)
+
+
+def path(*parts):
+    return os.path.join("data", *parts)
+
+
+def test_dotted_directory_and_extensionless_file():
+    vector_db = FakeVectorDatabase(
+        [path("v1.2", "a.pdf"), path("v1.2", "b.txt"), path("README"), path("READMEx")]
+    )
+
+    assert _expand_deleted_paths(vector_db, [path("v1.2")]) == [
+        path("v1.2", "a.pdf"),
+        path("v1.2", "b.txt"),
+    ]
+    # Файл без расширения не удаляет файлы с тем же префиксом
+    assert _expand_deleted_paths(vector_db, [path("README")]) == [path("README")]
+    assert vector_db.scans == 0
+
+
+def test_files_missing_from_catalog_are_found_in_chunk_metadata():
+    vector_db = FakeVectorDatabase(
+        [], [path("legacy", "items.json") + "#3", path("legacy", "doc.txt")]
+    )
+
+    assert _expand_deleted_paths(vector_db, [path("legacy")]) == [
+        path("legacy", "doc.txt"),
+        path("legacy", "items.json"),
+    ]
+    assert _expand_deleted_paths(vector_db, [path("unknown.txt")]) == []
@@ -0,0 +1,87 @@
+import hashlib
+import itertools
+import math
+import re
+from collections import Counter
+from typing import Iterable, Iterator, List, Set
+
+# Версия правил очистки входит в отпечаток конфигурации чанков
+BOILERPLATE_VERSION = "2"
+
+# Артефакты выгрузок КонсультантПлюс, компилируются один раз
+ARTIFACT_PATTERNS = [
+    re.compile(pattern)
+    for pattern in (
+        r"Страница \d+ из \d+",  # номера страниц
+        r"Документ предоставлен КонсультантПлюс",
+        r"Дата сохранения: \d{2}\.\d{2}\.\d{4}",
+        r"www\.consultant\.ru",
+        r"КонсультантПлюс.*?поддержка",
+    )
+]
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+
+
+def strip_artifacts(text: str) -> str:
+    """Удаление известных артефактов (колонтитулы КонсультантПлюс и т.п.)"""
+    for pattern in ARTIFACT_PATTERNS:
+        text = pattern.sub("", text)
+    return text
+
+
+def line_key(line: str) -> bytes:
+    """Хэш строки без учета регистра, пробелов и чисел (номера страниц, даты)"""
+    normalized = _SPACES.sub(" ", _DIGITS.sub("#", line)).strip().lower()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+
+
+class BoilerplateFilter:
+    """Удаление колонтитулов по повторяющимся строкам.
+
+    Рассматриваются только крайние строки страниц. Строка считается
+    колонтитулом, если она повторяется на заметной доле страниц в начале
+    документа. Решение зависит только от самого документа, поэтому один и тот
+    же файл всегда дает одинаковые чанки и хэши содержимого.
+    """
+
+    def __init__(self, config) -> None:
+        self.sample_pages = config.BOILERPLATE_SAMPLE_PAGES
+        self.edge_lines = config.BOILERPLATE_EDGE_LINES
+        self.page_ratio = config.BOILERPLATE_PAGE_RATIO
+        self.max_line_chars = config.BOILERPLATE_MAX_LINE_CHARS
+
+    def _edge_indexes(self, lines: List[str]) -> List[int]:
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        edges = filled[: self.edge_lines] + filled[-self.edge_lines :]
+        return sorted(
+            i for i in set(edges) if len(lines[i].strip()) <= self.max_line_chars
+        )
+
+    def _learn(self, sample: List[List[str]]) -> Set[bytes]:
+        """Определяет ключи колонтитулов по выборке страниц документа"""
+        page_counts: Counter = Counter()
+        for lines in sample:
+            page_counts.update({line_key(lines[i]) for i in self._edge_indexes(lines)})
+
+        if len(sample) < 2:
+            return set()
+        threshold = max(2, math.ceil(len(sample) * self.page_ratio))
+        return {key for key, count in page_counts.items() if count >= threshold}
+
+    def clean_pages(self, pages: Iterable[str]) -> Iterator[str]:
+        """Потоковая очистка страниц: правила определяются по первым страницам"""
+        pages = (strip_artifacts(page).split("\n") for page in pages)
+        sample = list(itertools.islice(pages, self.sample_pages))
+        repeated = self._learn(sample)
+
+        removed = 0
+        for lines in itertools.chain(sample, pages):
+            drop = {
+                i for i in self._edge_indexes(lines) if line_key(lines[i]) in repeated
+            }
+            removed += len(drop)
+            yield "\n".join(line for i, line in enumerate(lines) if i not in drop)
+        if removed:
+            print(f"  Удалено строк колонтитулов: {removed}")
@@ -2,7 +2,9 @@ import json
 import hashlib
 import os
 from langchain_core.documents import Document
-from typing import List, Dict
+from typing import List, Dict, Optional
+from config import config
+from utils.json_splitter import JsonTextSplitter
 
 
 def create_chunks(content: str, metadata: dict, doc_type: str) -> List[Document]:
@@ -12,8 +14,15 @@ def create_chunks(content: str, metadata: dict, doc_type: str) -> List[Document]
     return [Document(page_content=content, metadata=metadata)]
 
 
-def process_json_file(file_path: str) -> List[Document]:
-    """Обрабатывает JSON-файл и создает чанки для каждого элемента"""
+def process_json_file(
+    file_path: str, chunk_size: Optional[int] = None
+) -> List[Document]:
+    """Обрабатывает JSON-каталог: соседние элементы упаковываются в чанки.
+
+    Элементы преобразуются в текст с путями полей и объединяются в чанки
+    размером до chunk_size (по умолчанию - из настроек типа "json"), диапазон
+    элементов чанка сохраняется в метаданных.
+    """
     base_filename = os.path.basename(file_path)
     file_hash = hashlib.sha256(open(file_path, "rb").read()).hexdigest()
     last_modified = os.path.getmtime(file_path)
@@ -21,28 +30,46 @@ def process_json_file(file_path: str) -> List[Document]:
     with open(file_path, "r", encoding="utf-8") as f:
         catalog_data = json.load(f)
 
-    chunks = []
-    for i, item in enumerate(catalog_data):
-        item_path = f"{file_path}#{i}"
-
-        item_content = json.dumps(item, ensure_ascii=False)
-
-        metadata = {
-            "source": base_filename,
-            "item_name": item.get("name", "N/A"),
-            "item_url": item.get("url", "N/A"),
-            "index_in_catalog": i,
-            "file_path": item_path,
-            "file_hash": hashlib.sha256(item_content.encode()).hexdigest(),
-            "file_hash_full": file_hash,
-            "last_modified": last_modified,
-            "document_type": "qa",
-        }
-        chunks.append(Document(page_content=item_content, metadata=metadata))
+    splitter = JsonTextSplitter(
+        chunk_size or config.DOCUMENT_TYPE_CONFIG["json"]["chunk_size"]
+    )
+    chunks = splitter.split_json(catalog_data)
+    for chunk in chunks:
+        start = chunk.metadata["item_start"]
+        end = chunk.metadata["item_end"]
+        items = catalog_data[start : end + 1]
+        item_path = (
+            f"{file_path}#{start}" if start == end else f"{file_path}#{start}-{end}"
+        )
+        chunk.metadata.update(
+            {
+                "source": base_filename,
+                "item_name": "; ".join(str(item.get("name", "N/A")) for item in items),
+                "item_url": items[0].get("url", "N/A"),
+                "index_in_catalog": start,
+                "file_path": item_path,
+                "file_hash": hashlib.sha256(
+                    chunk.page_content.encode()
+                ).hexdigest(),
+                "file_hash_full": file_hash,
+                "last_modified": last_modified,
+                "document_type": "qa",
+            }
+        )
 
     return chunks
 
 
+def content_hash(text: str, *scope: Optional[str]) -> str:
+    """Хэш содержимого чанка (без учета различий в пробелах) для дедупликации.
+
+    scope (тип документа, отпечаток настроек) входит в хэш: одинаковый текст
+    разных типов хранится отдельными чанками со своими метаданными.
+    """
+    payload = "\x00".join([" ".join(text.split()), *(part or "" for part in scope)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 def generate_metadata(
     file_path: str, doc_type: str, file_hash: str, last_modified: float
 ) -> Dict:
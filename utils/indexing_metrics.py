@@ -0,0 +1,214 @@
+import heapq
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from utils.memory_profiler import MemoryProbe, MemoryProfiler, format_mb
+
+# Этапы индексации в порядке конвейера
+STAGES = (
+    "hash",
+    "partition",
+    "ocr",
+    "split",
+    "embed",
+    "chroma_lookup",
+)
+
+_current_metrics: ContextVar[Optional["IndexingMetrics"]] = ContextVar(
+    "indexing_metrics", default=None
+)
+
+
+def _empty_counters() -> Dict[str, float]:
+    return {"calls": 0, "seconds": 0.0, "bytes": 0, "rows": 0}
+
+
+class _Stage:
+    """Замер одного этапа; bytes и rows можно уточнить внутри блока"""
+
+    __slots__ = ("metrics", "name", "bytes", "rows", "started", "probe")
+
+    def __init__(self, metrics: "IndexingMetrics", name: str, size: int, rows: int):
+        self.metrics = metrics
+        self.name = name
+        self.bytes = size
+        self.rows = rows
+        self.started = 0.0
+        self.probe = MemoryProbe() if metrics.memory else None
+
+    def __enter__(self) -> "_Stage":
+        if self.probe:
+            self.probe.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.metrics.record(
+            self.name, time.perf_counter() - self.started, self.bytes, self.rows
+        )
+        if self.probe:
+            self.probe.__exit__(*exc_info)
+            self.metrics.memory.record_stage(self.name, self.probe)
+
+
+class _NoopStage:
+    """Замер при выключенной инструментации: ничего не считает"""
+
+    __slots__ = ("bytes", "rows")
+
+    def __init__(self) -> None:
+        self.bytes = 0
+        self.rows = 0
+
+    def __enter__(self) -> "_NoopStage":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+class IndexingMetrics:
+    """Счетчики времени, байтов и строк по этапам индексации.
+
+    Хранятся только агрегаты по этапам и расширениям файлов и ограниченный
+    список самых медленных файлов, поэтому объем памяти не зависит от
+    размера корпуса. Активируется на время запуска через activate().
+    С memory дополнительно снимаются RSS и tracemalloc на границах этапов.
+    """
+
+    def __init__(
+        self, slowest_files: int = 20, memory: Optional[MemoryProfiler] = None
+    ) -> None:
+        self.slowest_limit = slowest_files
+        self.memory = memory
+        self.started_at = datetime.now()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.extensions: Dict[str, Dict[str, Any]] = {}
+        self._slowest: List[tuple] = []  # куча (seconds, file_path, details)
+        self._file: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def activate(self):
+        """Делает счетчики текущими, возвращает токен для deactivate()"""
+        return _current_metrics.set(self)
+
+    @staticmethod
+    def deactivate(token) -> None:
+        _current_metrics.reset(token)
+
+    def record(self, name: str, seconds: float, size: int = 0, rows: int = 0) -> None:
+        with self._lock:
+            counters = self.stages.setdefault(name, _empty_counters())
+            counters["calls"] += 1
+            counters["seconds"] += seconds
+            counters["bytes"] += size
+            counters["rows"] += rows
+            if self._file is not None:
+                file_stages = self._file["stages"]
+                file_stages[name] = file_stages.get(name, 0.0) + seconds
+
+    def start_file(self, file_path: str, size: int) -> None:
+        self._file = {
+            "file_path": file_path,
+            "bytes": size,
+            "stages": {},
+            "started": time.perf_counter(),
+        }
+        if self.memory:
+            self.memory.start_file()
+
+    def finish_file(self, status: str, chunks: int = 0) -> None:
+        current, self._file = self._file, None
+        if current is None:
+            return
+        if self.memory:
+            self.memory.finish_file(current["file_path"])
+        seconds = time.perf_counter() - current.pop("started")
+        extension = os.path.splitext(current["file_path"])[1].lower() or "<none>"
+        with self._lock:
+            summary = self.extensions.setdefault(
+                extension,
+                {
+                    "files": 0,
+                    "failed": 0,
+                    "bytes": 0,
+                    "chunks": 0,
+                    "seconds": 0.0,
+                    "stages": {},
+                },
+            )
+            summary["files"] += 1
+            summary["failed"] += status == "failed"
+            summary["bytes"] += current["bytes"]
+            summary["chunks"] += chunks
+            summary["seconds"] += seconds
+            stages = summary["stages"]
+            for name, stage_seconds in current["stages"].items():
+                stages[name] = stages.get(name, 0.0) + stage_seconds
+
+            current.update({"status": status, "chunks": chunks, "seconds": seconds})
+            entry = (seconds, current["file_path"], current)
+            if len(self._slowest) < self.slowest_limit:
+                heapq.heappush(self._slowest, entry)
+            elif self.slowest_limit:
+                heapq.heappushpop(self._slowest, entry)
+
+    def report(self, totals: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        ordered = [name for name in STAGES if name in self.stages] + sorted(
+            name for name in self.stages if name not in STAGES
+        )
+        report = {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now().isoformat(),
+            "totals": totals or {},
+            "stages": {name: self.stages[name] for name in ordered},
+            "extensions": dict(sorted(self.extensions.items())),
+            "slowest_files": [
+                details for _, _, details in sorted(self._slowest, reverse=True)
+            ],
+        }
+        if self.memory:
+            report["memory"] = self.memory.report()
+        return report
+
+    def write_report(
+        self, directory: str, totals: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Сохраняет отчет запуска в JSON, возвращает путь к файлу"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = self.started_at.strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(directory, f"indexing_{stamp}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(totals), f, ensure_ascii=False, indent=2)
+        return path
+
+    def print_summary(self) -> None:
+        memory = self.memory.stages if self.memory else {}
+        for name, counters in self.report()["stages"].items():
+            line = (
+                f"  {name}: {counters['seconds']:.2f} с, вызовов {counters['calls']}, "
+                f"байт {counters['bytes']}, строк {counters['rows']}"
+            )
+            if name in memory:
+                line += (
+                    f", пик Python {format_mb(memory[name]['peak_traced'])}, "
+                    f"RSS {format_mb(memory[name]['max_rss'])}"
+                )
+            print(line)
+
+
+def current_metrics() -> Optional[IndexingMetrics]:
+    return _current_metrics.get()
+
+
+def stage(name: str, size: int = 0, rows: int = 0):
+    """Контекстный менеджер замера этапа для текущего запуска индексации"""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return _NoopStage()
+    return _Stage(metrics, name, size, rows)
@@ -1,29 +1,145 @@
-import json
-from typing import Dict, List, Union
+import copy
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 from langchain_core.documents import Document
 
+# Версия структурного разбиения входит в отпечаток конфигурации чанков
+JSON_CHUNKER_VERSION = "1"
+
+_WHITESPACE = re.compile(r"\s+")
+
 
 class JsonTextSplitter:
-    """Custom splitter for JSON files preserving structure"""
+    """Structural splitter for JSON files.
+
+    Nested objects are flattened into "path: value" lines, adjacent items
+    (array elements or top-level keys) are packed into chunks of up to
+    chunk_size characters. Chunks hold whole items separated by a blank
+    line, only an item longer than chunk_size is split by its lines. Item
+    indices of every chunk are kept in metadata (item_start, item_end).
+    """
+
+    def __init__(self, chunk_size: int = 500, item_separator: str = "\n\n") -> None:
+        self.chunk_size = chunk_size
+        self.item_separator = item_separator
 
-    def split_json(self, data: Union[Dict, List]) -> List[Document]:
-        chunks = []
+    def flatten(self, value: Any, path: str = "") -> List[str]:
+        """Path-annotated lines of all leaf values"""
+        if isinstance(value, dict):
+            if not value:
+                return [f"{path}: {{}}"] if path else []
+            lines = []
+            for key, item in value.items():
+                lines.extend(self.flatten(item, f"{path}.{key}" if path else str(key)))
+            return lines
+        if isinstance(value, list):
+            if not value:
+                return [f"{path}: []"] if path else []
+            lines = []
+            for i, item in enumerate(value):
+                lines.extend(self.flatten(item, f"{path}[{i}]"))
+            return lines
+
+        if value is None:
+            text = "null"
+        elif isinstance(value, bool):
+            text = "true" if value else "false"
+        else:
+            # Значение занимает одну строку, пустая строка разделяет элементы
+            text = _WHITESPACE.sub(" ", str(value)).strip()
+        return [f"{path}: {text}"] if path else [text]
+
+    def iter_items(self, data: Union[Dict, List]) -> Iterator[Tuple[str, str]]:
+        """Yield (json_path, text) of top-level items"""
         if isinstance(data, list):
-            # Process array items
-            for item in data:
-                chunks.append(
-                    Document(
-                        page_content=json.dumps(item, ensure_ascii=False),
-                        metadata={"json_type": "array_item"},
-                    )
-                )
+            for i, item in enumerate(data):
+                yield f"$[{i}]", "\n".join(self.flatten(item))
         elif isinstance(data, dict):
-            # Process object properties
             for key, value in data.items():
-                chunks.append(
-                    Document(
-                        page_content=json.dumps({key: value}, ensure_ascii=False),
-                        metadata={"json_path": f"$.{key}"},
-                    )
-                )
+                yield f"$.{key}", "\n".join(self.flatten(value, str(key)))
+        else:
+            yield "$", "\n".join(self.flatten(data))
+
+    def to_text(self, data: Union[Dict, List]) -> str:
+        """Flattened text of the whole document"""
+        return self.item_separator.join(
+            text for _, text in self.iter_items(data) if text
+        )
+
+    def _split_long_item(self, text: str) -> List[str]:
+        """Split an item longer than chunk_size by lines"""
+        parts: List[str] = []
+        current = ""
+        for line in text.split("\n"):
+            while len(line) > self.chunk_size:
+                if current:
+                    parts.append(current)
+                    current = ""
+                parts.append(line[: self.chunk_size])
+                line = line[self.chunk_size :]
+            if current and len(current) + 1 + len(line) > self.chunk_size:
+                parts.append(current)
+                current = ""
+            current = f"{current}\n{line}" if current else line
+        if current:
+            parts.append(current)
+        return parts
+
+    def split_json(
+        self, data: Union[Dict, List], metadata: Optional[Dict] = None
+    ) -> List[Document]:
+        json_type = (
+            "array_item"
+            if isinstance(data, list)
+            else "object_property" if isinstance(data, dict) else "value"
+        )
+        chunks: List[Document] = []
+
+        def emit(
+            text: str, start: int, end: int, json_path: str, part: Optional[int] = None
+        ) -> None:
+            chunk_metadata = copy.deepcopy(metadata) if metadata else {}
+            chunk_metadata.update(
+                {
+                    "json_type": json_type,
+                    "json_path": json_path,
+                    "item_start": start,
+                    "item_end": end,
+                    "item_count": end - start + 1,
+                }
+            )
+            if part is not None:
+                chunk_metadata["item_part"] = part
+            chunks.append(Document(page_content=text, metadata=chunk_metadata))
+
+        packed: List[str] = []
+        packed_start, packed_end, packed_path, packed_length = 0, 0, "$", 0
+        separator_length = len(self.item_separator)
+
+        def flush() -> None:
+            if packed:
+                text = self.item_separator.join(packed)
+                emit(text, packed_start, packed_end, packed_path)
+                packed.clear()
+
+        for index, (json_path, text) in enumerate(self.iter_items(data)):
+            if not text:
+                continue
+            if len(text) > self.chunk_size:
+                flush()
+                for part, piece in enumerate(self._split_long_item(text)):
+                    emit(piece, index, index, json_path, part)
+                continue
+
+            added_length = separator_length + len(text)
+            if packed and packed_length + added_length > self.chunk_size:
+                flush()
+            if not packed:
+                packed_start, packed_path, packed_length = index, json_path, len(text)
+            else:
+                packed_length += added_length
+            packed.append(text)
+            packed_end = index
+
+        flush()
         return chunks
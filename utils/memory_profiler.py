@@ -0,0 +1,131 @@
+import os
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import psutil
+
+_process = psutil.Process()
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса"""
+    return _process.memory_info().rss
+
+
+def start_tracing(frames: int = 1) -> None:
+    """Включает tracemalloc, если он еще не включен"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+class MemoryProbe:
+    """Пик памяти Python (tracemalloc) и RSS на участке кода.
+
+    Пик tracemalloc сбрасывается при входе, поэтому вложенные замеры
+    искажают пик внешнего участка; замеры этапов индексации не вкладываются.
+    """
+
+    __slots__ = ("rss_before", "rss_after", "peak_traced", "traced_before")
+
+    def __init__(self) -> None:
+        self.rss_before = self.rss_after = 0
+        self.peak_traced = self.traced_before = 0
+
+    def __enter__(self) -> "MemoryProbe":
+        self.rss_before = rss_bytes()
+        if tracemalloc.is_tracing():
+            self.traced_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.rss_after = rss_bytes()
+        if tracemalloc.is_tracing():
+            # Пик относительно памяти, занятой до входа в участок
+            self.peak_traced = max(
+                0, tracemalloc.get_traced_memory()[1] - self.traced_before
+            )
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "rss_before": self.rss_before,
+            "rss_after": self.rss_after,
+            "peak_traced": self.peak_traced,
+        }
+
+
+class MemoryProfiler:
+    """Снимки памяти на границах этапов и файлов индексации.
+
+    Для каждого этапа копятся максимальный пик tracemalloc и RSS, для каждого
+    расширения файлов - максимальный RSS и места в коде, где за время
+    обработки файла прибавилось больше всего живой памяти (по разнице
+    снимков tracemalloc до и после файла).
+    """
+
+    def __init__(self, top_sites: int = 10, frames: int = 1) -> None:
+        self._owns_tracing = not tracemalloc.is_tracing()
+        start_tracing(frames)
+        self.top_sites = top_sites
+        self.stages: Dict[str, Dict[str, int]] = {}
+        self.extensions: Dict[str, Dict[str, Any]] = {}
+        self._file_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._ignored = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        )
+
+    def close(self) -> None:
+        """Выключает tracemalloc, если он был включен этим профилировщиком"""
+        if self._owns_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._file_snapshot = None
+
+    def record_stage(self, name: str, probe: MemoryProbe) -> None:
+        counters = self.stages.setdefault(name, {"peak_traced": 0, "max_rss": 0})
+        counters["peak_traced"] = max(counters["peak_traced"], probe.peak_traced)
+        counters["max_rss"] = max(counters["max_rss"], probe.rss_after)
+
+    def start_file(self) -> None:
+        self._file_snapshot = tracemalloc.take_snapshot().filter_traces(self._ignored)
+
+    def finish_file(self, file_path: str) -> None:
+        if self._file_snapshot is None:
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces(self._ignored)
+        before, self._file_snapshot = self._file_snapshot, None
+
+        extension = os.path.splitext(file_path)[1].lower() or "<none>"
+        summary = self.extensions.setdefault(
+            extension, {"files": 0, "max_rss": 0, "sites": Counter()}
+        )
+        summary["files"] += 1
+        summary["max_rss"] = max(summary["max_rss"], rss_bytes())
+        for stat in snapshot.compare_to(before, "lineno")[: self.top_sites]:
+            if stat.size_diff > 0:
+                frame = stat.traceback[0]
+                summary["sites"][f"{frame.filename}:{frame.lineno}"] += stat.size_diff
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "stages": self.stages,
+            "extensions": {
+                extension: {
+                    "files": summary["files"],
+                    "max_rss": summary["max_rss"],
+                    "top_sites": [
+                        {"site": site, "bytes": size}
+                        for site, size in summary["sites"].most_common(
+                            self.top_sites
+                        )
+                    ],
+                }
+                for extension, summary in sorted(self.extensions.items())
+            },
+        }
+
+
+def format_mb(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} МБ"
+
@@ -0,0 +1,138 @@
+import copy
+import re
+from typing import Any, Dict, Iterator, List, Optional, Pattern, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+Span = Tuple[int, int]
+
+_NON_SPACE = re.compile(r"\S")
+
+
+class OffsetTextSplitter(RecursiveCharacterTextSplitter):
+    """Recursive character splitter working on (start, end) offsets.
+
+    Produces the same chunks as RecursiveCharacterTextSplitter with
+    keep_separator="start" (the default), but separators are searched with
+    precompiled patterns inside the span being split, pieces are never copied
+    and chunk text is sliced only when a chunk is emitted. start_index is the
+    exact chunk offset instead of a str.find() lookup.
+    """
+
+    def __init__(
+        self, separators: Optional[List[str]] = None, **kwargs: Any
+    ) -> None:
+        if kwargs.get("keep_separator", True) not in (True, "start"):
+            raise ValueError("OffsetTextSplitter supports only keep_separator='start'")
+        super().__init__(separators=separators, **kwargs)
+        self._patterns: List[Optional[Pattern]] = [
+            (
+                None
+                if separator == ""
+                else re.compile(
+                    separator if self._is_separator_regex else re.escape(separator)
+                )
+            )
+            for separator in self._separators
+        ]
+
+    def split_spans(self, text: str) -> Iterator[Span]:
+        """Lazily yield (start, end) offsets of chunks of the text"""
+        yield from self._split_spans(text, 0, len(text), 0)
+
+    def _split_spans(
+        self, text: str, start: int, end: int, level: int
+    ) -> Iterator[Span]:
+        # Первый разделитель, встречающийся в фрагменте (как в LangChain)
+        pattern = self._patterns[-1]
+        next_level = len(self._patterns)
+        for i in range(level, len(self._patterns)):
+            if self._patterns[i] is None:
+                pattern = None
+                break
+            if self._patterns[i].search(text, start, end):
+                pattern = self._patterns[i]
+                next_level = i + 1
+                break
+
+        good_splits: List[Span] = []
+        for piece_start, piece_end in self._split_pieces(text, start, end, pattern):
+            if piece_end - piece_start < self._chunk_size:
+                good_splits.append((piece_start, piece_end))
+                continue
+            if good_splits:
+                yield from self._merge_spans(text, good_splits)
+                good_splits = []
+            if next_level >= len(self._patterns):
+                yield piece_start, piece_end
+            else:
+                yield from self._split_spans(text, piece_start, piece_end, next_level)
+        if good_splits:
+            yield from self._merge_spans(text, good_splits)
+
+    @staticmethod
+    def _split_pieces(
+        text: str, start: int, end: int, pattern: Optional[Pattern]
+    ) -> List[Span]:
+        """Pieces that start with a separator occurrence (keep_separator='start')"""
+        if pattern is None:
+            return [(position, position + 1) for position in range(start, end)]
+
+        bounds = [match.start() for match in pattern.finditer(text, start, end)]
+        if not bounds or bounds[0] != start:
+            bounds.insert(0, start)
+        bounds.append(end)
+        return list(zip(bounds, bounds[1:]))
+
+    def _merge_spans(self, text: str, splits: List[Span]) -> Iterator[Span]:
+        """Port of TextSplitter._merge_splits for contiguous pieces.
+
+        Pieces are adjacent, so the length of the current window of pieces
+        splits[first:i] is simply the distance between its bounds.
+        """
+        chunk_size = self._chunk_size
+        chunk_overlap = self._chunk_overlap
+        first = 0
+        for i, (piece_start, piece_end) in enumerate(splits):
+            length = piece_end - piece_start
+            if i > first and piece_start - splits[first][0] + length > chunk_size:
+                span = self._strip_span(text, splits[first][0], piece_start)
+                if span:
+                    yield span
+                while first < i:
+                    total = piece_start - splits[first][0]
+                    if total <= chunk_overlap and total + length <= chunk_size:
+                        break
+                    first += 1
+        span = self._strip_span(text, splits[first][0], splits[-1][1])
+        if span:
+            yield span
+
+    def _strip_span(self, text: str, start: int, end: int) -> Optional[Span]:
+        if self._strip_whitespace:
+            match = _NON_SPACE.search(text, start, end)
+            if not match:
+                return None
+            start = match.start()
+            while text[end - 1].isspace():
+                end -= 1
+        return (start, end) if end > start else None
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def create_documents(
+        self, texts: List[str], metadatas: Optional[List[Dict[Any, Any]]] = None
+    ) -> List[Document]:
+        _metadatas = metadatas or [{}] * len(texts)
+        documents = []
+        for text, metadata in zip(texts, _metadatas):
+            for start, end in self.split_spans(text):
+                chunk_metadata = copy.deepcopy(metadata)
+                if self._add_start_index:
+                    chunk_metadata["start_index"] = start
+                documents.append(
+                    Document(page_content=text[start:end], metadata=chunk_metadata)
+                )
+        return documents
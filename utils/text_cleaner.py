@@ -1,7 +1,79 @@
 import re
 import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from sentence_transformers import SentenceTransformer
 from sklearn.cluster import DBSCAN
+from config import config
+from utils.boilerplate import strip_artifacts
+
+
+def approximate_dbscan_labels(
+    embeddings: np.ndarray,
+    eps: float,
+    tables: int = 8,
+    bits: int = 12,
+    bucket_limit: int = 1000,
+    seed: int = 0,
+) -> np.ndarray:
+    """Метки DBSCAN(eps, min_samples=2) по приближенному графу соседей.
+
+    При min_samples=2 кластеры DBSCAN - это компоненты связности графа пар
+    на расстоянии <= eps, а точки без соседей - шум (-1). Кандидаты в соседи
+    берутся из корзин LSH по случайным гиперплоскостям (несколько таблиц),
+    расстояние проверяется точно, поэтому лишних ребер нет, а пропуск
+    соседей маловероятен для близких векторов.
+    """
+    n = len(embeddings)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.maximum(norms, 1e-12)
+    rng = np.random.default_rng(seed)
+    powers = 1 << np.arange(bits)
+
+    rows, cols = [], []
+    eps_sq = eps * eps
+    for _ in range(tables):
+        planes = rng.standard_normal((vectors.shape[1], bits)).astype(np.float32)
+        codes = ((unit @ planes) > 0) @ powers
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        for bucket in np.split(order, boundaries):
+            if len(bucket) < 2:
+                continue
+            # Большие корзины сравниваются блоками вдоль случайной проекции
+            if len(bucket) > bucket_limit:
+                projection = unit[bucket] @ rng.standard_normal(vectors.shape[1])
+                bucket = bucket[np.argsort(projection)]
+            for start in range(0, len(bucket), bucket_limit):
+                block = bucket[start : start + 2 * bucket_limit]
+                block_vectors = vectors[block]
+                sq = np.einsum("ij,ij->i", block_vectors, block_vectors)
+                distances = (
+                    sq[:, None] + sq[None, :] - 2 * block_vectors @ block_vectors.T
+                )
+                left, right = np.nonzero(np.triu(distances <= eps_sq, k=1))
+                rows.append(block[left])
+                cols.append(block[right])
+
+    labels = np.full(n, -1)
+    if not rows:
+        return labels
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    graph = coo_matrix(
+        (np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n)
+    )
+    _, components = connected_components(graph, directed=False)
+
+    has_neighbors = np.zeros(n, dtype=bool)
+    has_neighbors[rows] = True
+    has_neighbors[cols] = True
+    # Компоненты нумеруются заново, одиночные точки - шум
+    _, labels[has_neighbors] = np.unique(
+        components[has_neighbors], return_inverse=True
+    )
+    return labels
 
 
 class LegalTextCleaner:
@@ -25,16 +97,7 @@ class LegalTextCleaner:
 
     def preprocess(self, text):
         """Удаление только конкретных артефактов"""
-        patterns = [
-            r"Страница \d+ из \d+",  # номера страниц
-            r"Документ предоставлен КонсультантПлюс",
-            r"Дата сохранения: \d{2}\.\d{2}\.\d{4}",
-            r"www\.consultant\.ru",
-            r"КонсультантПлюс.*?поддержка",
-        ]
-        for pattern in patterns:
-            text = re.sub(pattern, "", text)
-        return text
+        return strip_artifacts(text)
 
     def split_sentences(self, text):
         """Разбивка текста на предложения"""
@@ -45,13 +108,27 @@ class LegalTextCleaner:
         if len(sentences) < 3:
             return " ".join(sentences)
 
-        embeddings = self.model.encode(sentences)
-        clustering = DBSCAN(eps=0.7, min_samples=2).fit(embeddings)
+        embeddings = self.model.encode(
+            sentences,
+            batch_size=config.CLEANER_ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        # Точный DBSCAN квадратичен, для длинных документов - приближенный граф
+        if len(sentences) <= config.CLEANER_EXACT_CLUSTER_LIMIT:
+            labels = DBSCAN(eps=0.7, min_samples=2).fit(embeddings).labels_
+        else:
+            labels = approximate_dbscan_labels(
+                embeddings,
+                eps=0.7,
+                tables=config.CLEANER_LSH_TABLES,
+                bits=config.CLEANER_LSH_BITS,
+            )
 
         # Выбор основного кластера
-        labels = clustering.labels_
-        if len(set(labels)) > 1:  # Если есть несколько кластеров
-            main_cluster = max(set(labels), key=list(labels).count)
+        cluster_labels, counts = np.unique(labels, return_counts=True)
+        if len(cluster_labels) > 1:  # Если есть несколько кластеров
+            main_cluster = cluster_labels[np.argmax(counts)]
             return " ".join(
                 sent for sent, label in zip(sentences, labels) if label == main_cluster
             )